@@ -1,2 +1,2 @@
 # SPDX-License-Identifier: UNLICENSED
-from . import abi, token, uniswap
+from . import abi, arbitrage, block, cache, clones, compound, confirmations, futures, hedge, history, liquidity, lp, ndjson, pending, proxy_wallet, rpc, scan, scenario, simulate, token, twap, uniswap
@@ -1,15 +1,27 @@
 # SPDX-License-Identifier: UNLICENSED
 import sys
+import enum
 import json
 from pathlib import Path
-from typing import Iterable, Mapping, Optional
+from typing import Any, Iterable, Mapping, Optional, Sequence, Tuple
 import web3
+from . import cache, rpc
 
 _SEARCH_PATH = Path(sys.path[0]) / '..' / 'interfaces'
 _DEPLOY_PATH = Path(sys.path[0]) / '..' / 'client' / 'src' / 'artifacts' / 'deployments'
+_INDEX_PATH = _DEPLOY_PATH / 'index.json'
+_INDEX_VERSION = 1
+
+class InstanceType(enum.IntEnum):
+    NONE = 0
+    BASE = 1
+    LONG = 2
+    SHORT = 3
+    CLASS = 4
 
 def load_contracts(w3: web3.providers.base.BaseProvider, network: str = 'mainnet') -> Mapping[str, web3.contract.Contract]:
     results = {}
+    cache.install(w3)
     for path in _SEARCH_PATH.glob(f'{network}.0x*.*.abi'):
         assert path.name.startswith(f'{network}.0x')
         assert path.name.endswith('.abi')
@@ -23,6 +35,7 @@ def load_contracts(w3: web3.providers.base.BaseProvider, network: str = 'mainnet
 
 def load_contract_by_name(w3: web3.providers.base.BaseProvider, name: str, network: str = 'mainnet') -> web3.contract.Contract:
     assert not any(c in name for c in '?/*\\')
+    cache.install(w3)
     result = None
     for path in _SEARCH_PATH.glob(f'{network}.0x*.{name}.abi'):
         assert path.name.startswith(f'{network}.0x')
@@ -42,34 +55,123 @@ def load_contracts_by_name(w3: web3.providers.base.BaseProvider, names: Optional
         return load_contracts(w3, network)
     return dict((name, load_contract_by_name(w3, name=name, network=network)) for name in names)
 
-def load_deployed_FutureToken(w3: web3.providers.base.BaseProvider) -> web3.contract.Contract:
+def _deployment_signature() -> Sequence[Tuple[str, int, int]]:
+    paths = [_DEPLOY_PATH / 'map.json']
+    paths.extend(sorted((_DEPLOY_PATH / 'dev').glob('*.json')))
+    signature = []
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        signature.append((path.name, stat.st_mtime_ns, stat.st_size))
+    return signature
+
+def _build_deployment_index(w3: web3.providers.base.BaseProvider, signature: Sequence[Tuple[str, int, int]]) -> Mapping[str, Any]:
     with (_DEPLOY_PATH / 'map.json').open() as fd:
         map = json.load(fd)
-    for addr in map['dev']['FutureToken']:
-        with (_DEPLOY_PATH / 'dev' / f'{addr}.json').open() as fd:
-            dpl = json.load(fd)
-        contract = w3.eth.contract(address=addr, abi=dpl['abi'])
-        instance_type = contract.functions.instanceType().call()
-        if instance_type == 1:
-            break
-    return contract
+    abis = {}
+    contracts = {}
+    names = {}
+    for name, addrs in map.get('dev', {}).items():
+        names[name] = list(addrs)
+        for addr in addrs:
+            with (_DEPLOY_PATH / 'dev' / f'{addr}.json').open() as fd:
+                dpl = json.load(fd)
+            abi_text = json.dumps(dpl['abi'], sort_keys=True)
+            abi_hash = web3.main.eth_utils_keccak(text=abi_text).hex()
+            abis.setdefault(abi_hash, dpl['abi'])
+            contracts[addr] = {
+                'name': name,
+                'abi': abi_hash,
+                'bytecodeHash': web3.main.eth_utils_keccak(hexstr=dpl.get('deployedBytecode') or '0x').hex(),
+                'blockHeight': dpl.get('deployment', {}).get('blockHeight'),
+                'instanceType': None,
+            }
+    return {
+        'version': _INDEX_VERSION,
+        'signature': signature,
+        'names': names,
+        'abis': abis,
+        'contracts': contracts,
+    }
+
+def _resolve_instance_types(w3: web3.providers.base.BaseProvider, index: Mapping[str, Any]) -> bool:
+    '''
+    Look up every FutureToken instance type still unknown with a single batch of
+    calls. A failed lookup, e.g. with the node down, stays unknown for the next
+    load to try again. Returns whether any was resolved.
+    '''
+    contracts = index['contracts']
+    candidates = [addr for addr, entry in contracts.items() if entry['name'] == 'FutureToken' and entry['instanceType'] is None]
+    if not candidates:
+        return False
+    functions = [
+        w3.eth.contract(address=addr, abi=index['abis'][contracts[addr]['abi']]).functions.instanceType()
+        for addr in candidates
+    ]
+    resolved = False
+    for addr, instance_type in zip(candidates, rpc.batch_call(w3, functions, allow_failure=True)):
+        if instance_type is not None:
+            contracts[addr]['instanceType'] = instance_type
+            resolved = True
+    return resolved
+
+_DEPLOYMENT_INDEX = None
+
+def load_deployment_index(w3: web3.providers.base.BaseProvider, rebuild: bool = False) -> Mapping[str, Any]:
+    global _DEPLOYMENT_INDEX
+    signature = [list(item) for item in _deployment_signature()]
+    index = _DEPLOYMENT_INDEX
+    if index is None and _INDEX_PATH.exists() and not rebuild:
+        with _INDEX_PATH.open() as fd:
+            index = json.load(fd)
+    if rebuild or index is None or index.get('version') != _INDEX_VERSION or index['signature'] != signature:
+        index = _build_deployment_index(w3, signature)
+        _resolve_instance_types(w3, index)
+        save = True
+    else:
+        # Retry the lookups that failed before, whether the index was saved with them
+        # or is the one already in memory; a resolved index costs no calls
+        save = _resolve_instance_types(w3, index)
+    if save:
+        with _INDEX_PATH.open('w') as fd:
+            json.dump(index, fd)
+    _DEPLOYMENT_INDEX = index
+    return index
+
+def find_deployments(w3: web3.providers.base.BaseProvider, name: str, instance_type: Optional[InstanceType] = None) -> Sequence[web3.contract.Contract]:
+    index = load_deployment_index(w3)
+    results = []
+    for addr in index['names'].get(name, ()):
+        entry = index['contracts'][addr]
+        if instance_type is not None and entry['instanceType'] != instance_type:
+            continue
+        results.append(w3.eth.contract(address=addr, abi=index['abis'][entry['abi']]))
+    return results
+
+def load_deployed_FutureToken(w3: web3.providers.base.BaseProvider) -> web3.contract.Contract:
+    contracts = find_deployments(w3, 'FutureToken', InstanceType.BASE)
+    if not contracts:
+        raise ValueError('no FutureToken base instance deployed')
+    return contracts[0]
+
+def load_deployed_ProxyWallet(w3: web3.providers.base.BaseProvider) -> web3.contract.Contract:
+    contracts = find_deployments(w3, 'ProxyWallet')
+    if not contracts:
+        raise ValueError('no ProxyWallet deployed')
+    return contracts[0]
 
 def load_deployments(w3: web3.providers.base.BaseProvider):
+    index = load_deployment_index(w3)
     results = {}
-    map = _DEPLOY_PATH / 'map.json'
-    with map.open() as fd:
-        map = json.load(fd)
-    for name, addrs in map.get('dev', {}).items():
+    for name, addrs in index['names'].items():
         if not addrs:
             continue
-        try:
-            meta = results[name]
-        except KeyError:
-            meta = results[name] = []
+        meta = results[name] = []
         for addr in addrs:
-            dpl = _DEPLOY_PATH / 'dev' / f'{addr}.json'
-            with dpl.open() as fd:
-                dpl = json.load(fd)
+            entry = index['contracts'][addr]
+            dpl = dict(entry, abi=index['abis'][entry['abi']])
             contract = w3.eth.contract(address=addr, abi=dpl['abi'])
             meta.append((contract, dpl))
     return results
@@ -0,0 +1,336 @@
+# SPDX-License-Identifier: UNLICENSED
+import time
+from typing import Callable, Iterable, Mapping, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+import web3
+from . import liquidity, rpc, uniswap
+from .block import BlockIdentifier
+from .futures import FutureSeries, FutureTokenRegistry, calc_collateral_factor
+
+GAMMA = 0.997
+POW_10_18 = 10**18
+BISECTION_STEPS = 64
+
+MINT_SELL = 'mint_sell'
+BUY_REDEEM = 'buy_redeem'
+CYCLE_LONG = 'cycle_long'
+CYCLE_SHORT = 'cycle_short'
+
+# The three pools of a series, by the tokens their reserves are given in
+_POOLS = (
+    ('long_ctoken', lambda s: (s.fut_long, s.ctoken)),
+    ('short_ctoken', lambda s: (s.fut_short, s.ctoken)),
+    ('long_short', lambda s: (s.fut_long, s.fut_short)),
+)
+
+class TriangleState(NamedTuple):
+    '''Reserves of the three pools of every series at one block, as (reserve of first token, reserve of second token)'''
+    block_number: int
+    series: Sequence[FutureSeries]
+    # Raw ctoken per pair, scaled by 1e18, as used by mintPairs/redeemPairs
+    collateral_factor: Sequence[int]
+    long_ctoken: Tuple[np.ndarray, np.ndarray]
+    short_ctoken: Tuple[np.ndarray, np.ndarray]
+    long_short: Tuple[np.ndarray, np.ndarray]
+    # Unexpired series whose three pools all have liquidity
+    active: np.ndarray
+    raw: Mapping[str, Sequence[Tuple[int, int]]]
+
+class Opportunity(NamedTuple):
+    series: FutureSeries
+    kind: str
+    # Pairs minted or redeemed, or the ctoken put into the cycle
+    amount: int
+    # Exact amounts along the trade, in the order the transactions move them
+    amounts: Sequence[int]
+    profit: int
+    block_number: int
+
+def cycle_amount_in(pools: Sequence[Tuple[np.ndarray, np.ndarray]], gamma: float = GAMMA) -> np.ndarray:
+    '''
+    Optimal input of a swap around a cycle of pools given as (reserve in, reserve out).
+    The pools compose into one virtual pool (e0, e1), for which the profit
+    gamma*a*e1/(e0 + gamma*a) - a peaks at a = (sqrt(gamma*e0*e1) - e0)/gamma.
+    '''
+    e0, e1 = pools[0]
+    for reserve_in, reserve_out in pools[1:]:
+        denominator = reserve_in + gamma * e1
+        e0, e1 = e0 * reserve_in / denominator, gamma * e1 * reserve_out / denominator
+    return np.maximum((np.sqrt(gamma * e0 * e1) - e0) / gamma, 0.0)
+
+def _bisect(marginal: Callable[[np.ndarray], np.ndarray], high: np.ndarray) -> np.ndarray:
+    '''Root of decreasing marginal profits in [0, high], element-wise'''
+    low = np.zeros_like(high)
+    for _ in range(BISECTION_STEPS):
+        middle = (low + high) / 2
+        positive = marginal(middle) > 0
+        low = np.where(positive, middle, low)
+        high = np.where(positive, high, middle)
+    return low
+
+def mint_sell_amount(long_ctoken: Tuple[np.ndarray, np.ndarray],
+                     short_ctoken: Tuple[np.ndarray, np.ndarray],
+                     factor: np.ndarray,
+                     gamma: float = GAMMA) -> np.ndarray:
+    '''Pairs to mint for `factor` ctoken each and sell into both ctoken pools'''
+    (x_long, y_long), (x_short, y_short) = long_ctoken, short_ctoken
+    def marginal(n):
+        return (gamma * x_long * y_long / (x_long + gamma * n)**2 +
+                gamma * x_short * y_short / (x_short + gamma * n)**2 - factor)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Past these sizes each pool pays less than factor / 2 per pair
+        high = np.maximum(
+            (np.sqrt(2 * gamma * x_long * y_long / factor) - x_long) / gamma,
+            (np.sqrt(2 * gamma * x_short * y_short / factor) - x_short) / gamma,
+        )
+        high = np.nan_to_num(np.maximum(high, 0.0), posinf=0.0)
+        return np.where(marginal(np.zeros_like(high)) > 0, _bisect(marginal, high), 0.0)
+
+def buy_redeem_amount(long_ctoken: Tuple[np.ndarray, np.ndarray],
+                      short_ctoken: Tuple[np.ndarray, np.ndarray],
+                      factor: np.ndarray,
+                      gamma: float = GAMMA) -> np.ndarray:
+    '''Pairs to buy from both ctoken pools and redeem for `factor` ctoken each'''
+    (x_long, y_long), (x_short, y_short) = long_ctoken, short_ctoken
+    def marginal(n):
+        return (factor -
+                x_long * y_long / (gamma * (x_long - n)**2) -
+                x_short * y_short / (gamma * (x_short - n)**2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        high = np.minimum(x_long, x_short) * (1 - 1e-9)
+        return np.where(marginal(np.zeros_like(high)) > 0, _bisect(marginal, high), 0.0)
+
+def _swap_out(amount_in: int, path_reserves: Sequence[Tuple[int, int]]) -> Sequence[int]:
+    amounts = [amount_in]
+    for reserve_in, reserve_out in path_reserves:
+        amounts.append(uniswap.get_amount_out(amounts[-1], reserve_in, reserve_out))
+    return amounts
+
+class ArbitrageMonitor:
+    '''
+    Consistency of the FUTL/FUTS, FUTL/ctoken and FUTS/ctoken pools of many series
+    with mintPairs/redeemPairs, which trade one FUTL and one FUTS for the class
+    collateral factor in ctoken.
+
+    Each block the reserves of every pool are read in one batch pinned to the block
+    number, so the call cache answers repeated reads. A class collateral factor is
+    read with them until it is set, which happens once when the class is
+    initialized, and kept from then on. One vectorized pass then sizes four trades for every series: minting
+    pairs and selling both legs, buying both legs and redeeming, and the cycle
+    through the three pools in either direction. Cycles are sized in closed form,
+    the mint and redeem trades by bisection on their marginal profit. Sizes are
+    checked again in exact integer arithmetic before being reported.
+    '''
+    def __init__(self,
+                 uniswap_: uniswap.Uniswap,
+                 registry: FutureTokenRegistry,
+                 series: Iterable[FutureSeries],
+                 min_profit: int = 0):
+        self.__uniswap = uniswap_
+        self.__series = list(series)
+        self.__min_profit = min_profit
+        w3 = uniswap_.router.web3
+        factory = uniswap_.factory.address
+        self.__pools = dict(
+            (name, [w3.eth.contract(address=uniswap.calc_pair_address(factory, *tokens(s)), abi=uniswap._ABI_IUniswapV2Pair) for s in self.__series])
+            for name, tokens in _POOLS
+        )
+        self.__classes = [w3.eth.contract(address=s.fut_class, abi=registry.future_token.abi) for s in self.__series]
+        # Nonzero collateral factors, which never change again, by class index
+        self.__factors = {}
+
+    @property
+    def series(self) -> Sequence[FutureSeries]:
+        return self.__series
+
+    def read(self, block_identifier: Optional[BlockIdentifier] = None) -> TriangleState:
+        w3 = self.__uniswap.router.web3
+        block_number = block_identifier if isinstance(block_identifier, int) else w3.eth.get_block_number()
+        count = len(self.__series)
+        functions = [pool.functions.getReserves() for name, _ in _POOLS for pool in self.__pools[name]]
+        unknown = [i for i in range(count) if i not in self.__factors]
+        functions.extend(self.__classes[i].functions.collateralFactor() for i in unknown)
+        # A pool or class that does not exist yet fails its call
+        results = rpc.batch_call(w3, functions, block_number, allow_failure=True)
+        for i, result in zip(unknown, results[3*count:]):
+            if result:
+                self.__factors[i] = result
+        raw = {}
+        for i, (name, tokens) in enumerate(_POOLS):
+            reserves = []
+            for s, result in zip(self.__series, results[i*count:(i+1)*count]):
+                if result is None:
+                    reserves.append((0, 0))
+                    continue
+                token_a, token_b = tokens(s)
+                reserve0, reserve1, _ = result
+                flipped = web3.main.to_bytes(hexstr=token_b) < web3.main.to_bytes(hexstr=token_a)
+                reserves.append((reserve1, reserve0) if flipped else (reserve0, reserve1))
+            raw[name] = reserves
+        factors = [self.__factors.get(i, 0) for i in range(count)]
+        arrays = dict(
+            (name, (np.array([float(a) for a, _ in reserves]), np.array([float(b) for _, b in reserves])))
+            for name, reserves in raw.items()
+        )
+        active = np.array([calc_collateral_factor(s.expiry, block_number) > 0 and factor > 0 for s, factor in zip(self.__series, factors)], dtype=bool)
+        for a, b in arrays.values():
+            active &= (a > 0) & (b > 0)
+        return TriangleState(block_number, self.__series, factors, arrays['long_ctoken'], arrays['short_ctoken'], arrays['long_short'], active, raw)
+
+    def check(self, state: TriangleState) -> Sequence[Opportunity]:
+        '''Profitable trades of every series, at most the best one per series'''
+        factor = np.array([float(factor) for factor in state.collateral_factor]) / POW_10_18
+        (x_long, y_long), (x_short, y_short), (r_long, r_short) = state.long_ctoken, state.short_ctoken, state.long_short
+        sizes = {
+            MINT_SELL: mint_sell_amount(state.long_ctoken, state.short_ctoken, factor),
+            BUY_REDEEM: buy_redeem_amount(state.long_ctoken, state.short_ctoken, factor),
+            # ctoken -> FUTL -> FUTS -> ctoken
+            CYCLE_LONG: cycle_amount_in([(y_long, x_long), (r_long, r_short), (x_short, y_short)]),
+            # ctoken -> FUTS -> FUTL -> ctoken
+            CYCLE_SHORT: cycle_amount_in([(y_short, x_short), (r_short, r_long), (x_long, y_long)]),
+        }
+        opportunities = []
+        for i in np.flatnonzero(state.active):
+            best = None
+            for kind, size in sizes.items():
+                amount = int(size[i])
+                if amount <= 0:
+                    continue
+                opportunity = self.__exact(state, int(i), kind, amount)
+                if opportunity is not None and opportunity.profit > self.__min_profit and (best is None or opportunity.profit > best.profit):
+                    best = opportunity
+            if best is not None:
+                opportunities.append(best)
+        return opportunities
+
+    def __exact(self, state: TriangleState, i: int, kind: str, amount: int) -> Optional[Opportunity]:
+        (long_fut, long_ctoken), (short_fut, short_ctoken), (long_long, long_short) = (state.raw[name][i] for name, _ in _POOLS)
+        factor = state.collateral_factor[i]
+        try:
+            if kind == MINT_SELL:
+                collateral = (amount * factor + POW_10_18 - 1) // POW_10_18
+                out_long = uniswap.get_amount_out(amount, long_fut, long_ctoken)
+                out_short = uniswap.get_amount_out(amount, short_fut, short_ctoken)
+                amounts, profit = (collateral, out_long, out_short), out_long + out_short - collateral
+            elif kind == BUY_REDEEM:
+                in_long = uniswap.get_amount_in(amount, long_ctoken, long_fut)
+                in_short = uniswap.get_amount_in(amount, short_ctoken, short_fut)
+                collateral = amount * factor // POW_10_18
+                amounts, profit = (in_long, in_short, collateral), collateral - in_long - in_short
+            elif kind == CYCLE_LONG:
+                amounts = _swap_out(amount, ((long_ctoken, long_fut), (long_long, long_short), (short_fut, short_ctoken)))
+                profit = amounts[-1] - amount
+            else:
+                amounts = _swap_out(amount, ((short_ctoken, short_fut), (long_short, long_long), (long_fut, long_ctoken)))
+                profit = amounts[-1] - amount
+        except (AssertionError, ValueError):
+            return None
+        return Opportunity(state.series[i], kind, amount, tuple(amounts), profit, state.block_number)
+
+    def poll(self, block_identifier: Optional[BlockIdentifier] = None) -> Sequence[Opportunity]:
+        return self.check(self.read(block_identifier))
+
+    def __transactions(self, opportunity: Opportunity, tx_from: str, deadline: int) -> Sequence[Sequence[web3.contract.ContractFunction]]:
+        '''Functions to call, in groups that only depend on the groups before them'''
+        w3 = self.__uniswap.router.web3
+        router = self.__uniswap.router
+        s = opportunity.series
+        erc20 = lambda token: w3.eth.contract(address=token, abi=uniswap._ABI_IERC20)
+        fut_class = self.__classes[self.__series.index(s)]
+        if opportunity.kind == MINT_SELL:
+            collateral, out_long, out_short = opportunity.amounts
+            return [
+                [
+                    erc20(s.ctoken).functions.approve(s.fut_class, collateral),
+                    erc20(s.fut_long).functions.approve(router.address, opportunity.amount),
+                    erc20(s.fut_short).functions.approve(router.address, opportunity.amount),
+                ],
+                [fut_class.functions.mintPairs(opportunity.amount, collateral)],
+                [
+                    router.functions.swapExactTokensForTokens(opportunity.amount, out_long, [s.fut_long, s.ctoken], tx_from, deadline),
+                    router.functions.swapExactTokensForTokens(opportunity.amount, out_short, [s.fut_short, s.ctoken], tx_from, deadline),
+                ],
+            ]
+        if opportunity.kind == BUY_REDEEM:
+            in_long, in_short, _ = opportunity.amounts
+            return [
+                [erc20(s.ctoken).functions.approve(router.address, in_long + in_short)],
+                [
+                    router.functions.swapTokensForExactTokens(opportunity.amount, in_long, [s.ctoken, s.fut_long], tx_from, deadline),
+                    router.functions.swapTokensForExactTokens(opportunity.amount, in_short, [s.ctoken, s.fut_short], tx_from, deadline),
+                ],
+                [fut_class.functions.redeemPairs(opportunity.amount)],
+            ]
+        path = [s.ctoken, s.fut_long, s.fut_short, s.ctoken] if opportunity.kind == CYCLE_LONG else [s.ctoken, s.fut_short, s.fut_long, s.ctoken]
+        return [
+            [erc20(s.ctoken).functions.approve(router.address, opportunity.amount)],
+            # Only the cycle is atomic, it reverts unless it still pays at least the input back
+            [router.functions.swapExactTokensForTokens(opportunity.amount, opportunity.amount + 1, path, tx_from, deadline)],
+        ]
+
+    def execute(self,
+                opportunity: Opportunity,
+                tx_from: str,
+                absolute_deadline: Optional[int] = None,
+                relative_deadline: Optional[int] = None,
+                transact: bool = False,
+                tx: Mapping = {}) -> Sequence:
+        '''
+        Receipts of every transaction when transacting, otherwise the unsigned
+        transactions. The mint and redeem trades take several transactions and each
+        swap keeps the output sized at the monitored block as its limit, so a pool
+        moving in between leaves the position half done rather than at a loss.
+
+        Transactions go out in groups, each estimated in one eth_estimateGas batch
+        once the group before it is mined. Later groups cannot be estimated before
+        that, so without transacting tx['gas'] is needed.
+        '''
+        deadline = absolute_deadline
+        if deadline is None:
+            deadline = int(time.time())
+        if relative_deadline:
+            deadline += relative_deadline
+        w3 = self.__uniswap.router.web3
+        tx_from = web3.main.to_checksum_address(tx_from)
+        groups = self.__transactions(opportunity, tx_from, deadline)
+        nonce = tx.get('nonce')
+        if nonce is None:
+            nonce = w3.eth.get_transaction_count(tx_from, 'pending')
+        tx_groups = []
+        for group in groups:
+            tx_dicts = []
+            for function in group:
+                tx_dict = tx.copy(); tx_dict.update({'from': tx_from, 'nonce': nonce})
+                tx_dicts.append(tx_dict)
+                nonce += 1
+            tx_groups.append(tx_dicts)
+        if not transact:
+            if 'gas' not in tx:
+                raise ValueError('later transactions cannot be estimated before earlier ones are mined, pass a gas limit')
+            return [function.build_transaction(tx_dict) for group, tx_dicts in zip(groups, tx_groups) for function, tx_dict in zip(group, tx_dicts)]
+        receipts = []
+        for group, tx_dicts in zip(groups, tx_groups):
+            if 'gas' not in tx:
+                estimates = rpc.batch_estimate_gas(w3, list(zip(group, tx_dicts)))
+                for tx_dict, gas in zip(tx_dicts, estimates):
+                    tx_dict['gas'] = gas * liquidity.GAS_MARGIN[0] // liquidity.GAS_MARGIN[1]
+            tx_hashes = [function.transact(tx_dict) for function, tx_dict in zip(group, tx_dicts)]
+            group_receipts = [w3.eth.wait_for_transaction_receipt(tx_hash) for tx_hash in tx_hashes]
+            receipts.extend(group_receipts)
+            failed = [receipt['transactionHash'] for receipt in group_receipts if receipt['status'] != 1]
+            if failed:
+                raise ValueError(f'transactions failed: {", ".join(web3.main.to_hex(tx_hash) for tx_hash in failed)}')
+        return receipts
+
+    def run(self, on_opportunity: Callable[[Opportunity], None], poll_interval: float = 1.0):
+        '''Check every new block and pass each opportunity found to on_opportunity, which may flag or execute it'''
+        w3 = self.__uniswap.router.web3
+        last = None
+        while True:
+            block_number = w3.eth.get_block_number()
+            if block_number == last:
+                time.sleep(poll_interval)
+                continue
+            last = block_number
+            for opportunity in self.poll(block_number):
+                on_opportunity(opportunity)
@@ -0,0 +1,49 @@
+# SPDX-License-Identifier: UNLICENSED
+import contextvars
+from typing import Optional, Union
+import web3
+
+BlockIdentifier = Union[int, str]
+
+_PINNED_BLOCK = contextvars.ContextVar('pinned_block', default=None)
+
+def current_block_identifier(block_identifier: Optional[BlockIdentifier] = None) -> BlockIdentifier:
+    '''Explicit block identifier if given, otherwise the pinned block, otherwise latest'''
+    if block_identifier is not None:
+        return block_identifier
+    pinned = _PINNED_BLOCK.get()
+    if pinned is not None:
+        return pinned
+    return 'latest'
+
+class BlockContext:
+    '''
+    Pin every Token/Uniswap read made inside the context to a single block number.
+
+        with BlockContext(w3) as block_number:
+            balance = USDC.balanceOf(A)
+            reserves = pair.getReserves()
+    '''
+    def __init__(self, w3: web3.Web3, block_identifier: BlockIdentifier = 'latest'):
+        self.__w3 = w3
+        self.__block_identifier = block_identifier
+        self.__block_number = None
+        self.__tokens = []
+
+    @property
+    def block_number(self) -> Optional[int]:
+        return self.__block_number
+
+    def __enter__(self) -> int:
+        block_identifier = self.__block_identifier
+        if isinstance(block_identifier, int):
+            block_number = block_identifier
+        else:
+            # The header rather than eth_blockNumber, so the call cache sees its hash
+            block_number = self.__w3.eth.get_block(block_identifier).number
+        self.__block_number = block_number
+        self.__tokens.append(_PINNED_BLOCK.set(block_number))
+        return block_number
+
+    def __exit__(self, *exc_info):
+        _PINNED_BLOCK.reset(self.__tokens.pop())
@@ -0,0 +1,207 @@
+# SPDX-License-Identifier: UNLICENSED
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Mapping, Optional, Tuple
+import web3
+from hexbytes import HexBytes
+
+DEFAULT_MAX_ENTRIES = 65536
+DEFAULT_MAX_BYTES = 64 << 20
+# Block hashes remembered to notice a different block at a known height
+MAX_HEADS = 1024
+
+# Views whose result can never change once the contract exists
+IMMUTABLE_SIGNATURES = (
+    'token0()',
+    'token1()',
+    'factory()',
+    'WETH()',
+    'decimals()',
+    'symbol()',
+    'name()',
+)
+
+IMMUTABLE_SELECTORS = frozenset(
+    web3.main.to_hex(web3.main.eth_utils_keccak(text=signature)[:4])
+    for signature in IMMUTABLE_SIGNATURES
+)
+
+_CACHED_TX_KEYS = frozenset(('to', 'data', 'from'))
+
+CallKey = Tuple[str, str, Optional[str], Optional[str]]
+
+class CallCache:
+    '''
+    LRU cache of eth_call results.
+
+    Calls to immutable views are cached regardless of block, everything else only
+    when made against a concrete block number. A block number only names the same
+    block until a reorg or an evm_revert, so the cache watches the block headers
+    and block numbers the node returns: a different hash at a known height, or a
+    head below a height already seen, drops every call made at that height or
+    above.
+    '''
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        assert max_entries > 0, max_entries
+        assert max_bytes > 0, max_bytes
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__entries = OrderedDict()
+        self.__bytes = 0
+        self.__heads = {}
+        # Highest block any cached call or header was at
+        self.__highest = -1
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_entries(self) -> int:
+        return self.__max_entries
+
+    @property
+    def max_bytes(self) -> int:
+        return self.__max_bytes
+
+    @property
+    def size(self) -> int:
+        return self.__bytes
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self.__lock:
+            result = self.__entries.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.__entries.move_to_end(key)
+            return result
+
+    def put(self, key: Hashable, result: str):
+        cost = len(result)
+        if cost > self.__max_bytes:
+            return
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__bytes -= len(previous)
+            self.__entries[key] = result
+            self.__bytes += cost
+            if isinstance(key, tuple) and key[3] is not None:
+                self.__highest = max(self.__highest, int(key[3], 16))
+            while len(self.__entries) > self.__max_entries or self.__bytes > self.__max_bytes:
+                _, evicted = self.__entries.popitem(last=False)
+                self.__bytes -= len(evicted)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+            self.__heads.clear()
+            self.__highest = -1
+
+    def observe_block(self, block_number: int, block_hash: Optional[str] = None):
+        '''Note a block the node returned, by number and hash or just as its head number'''
+        with self.__lock:
+            if block_hash is None:
+                # A head number, which only tells something if it went back
+                if self.__highest > block_number:
+                    self.__invalidate(block_number + 1)
+                return
+            known = self.__heads.get(block_number)
+            if known == block_hash:
+                return
+            if known is not None:
+                self.__invalidate(block_number)
+            self.__heads[block_number] = block_hash
+            self.__highest = max(self.__highest, block_number)
+            if len(self.__heads) > MAX_HEADS:
+                del self.__heads[min(self.__heads)]
+
+    def __invalidate(self, block_number: int):
+        for number in [number for number in self.__heads if number >= block_number]:
+            del self.__heads[number]
+        for key in [key for key in self.__entries if key[3] is not None and int(key[3], 16) >= block_number]:
+            self.__bytes -= len(self.__entries.pop(key))
+        self.__highest = block_number - 1
+
+def call_key(tx: Mapping[str, Any], block_identifier: Any) -> Optional[CallKey]:
+    '''Cache key for an eth_call, or None if its result must not be cached'''
+    if not isinstance(tx, Mapping) or not tx.keys() <= _CACHED_TX_KEYS:
+        return None
+    to = tx.get('to')
+    data = tx.get('data')
+    if not to or not isinstance(data, str):
+        return None
+    sender = tx.get('from')
+    if sender:
+        sender = sender.lower()
+    if data[:10] in IMMUTABLE_SELECTORS:
+        return (to.lower(), data, sender, None)
+    if isinstance(block_identifier, int):
+        return (to.lower(), data, sender, hex(block_identifier))
+    if isinstance(block_identifier, str) and block_identifier.startswith('0x'):
+        return (to.lower(), data, sender, hex(int(block_identifier, 16)))
+    return None
+
+def _to_int(value: Any) -> int:
+    return int(value, 16) if isinstance(value, str) else value
+
+def observe_result(call_cache: CallCache, method: str, result: Any):
+    '''Feed the block a response names to the cache'''
+    if method == 'eth_blockNumber' and result is not None:
+        call_cache.observe_block(_to_int(result))
+    elif method in ('eth_getBlockByNumber', 'eth_getBlockByHash') and isinstance(result, Mapping):
+        # Pending blocks have neither number nor hash yet
+        if result.get('number') is not None and result.get('hash') is not None:
+            block_hash = result['hash'] if isinstance(result['hash'], str) else web3.main.to_hex(result['hash'])
+            call_cache.observe_block(_to_int(result['number']), block_hash.lower())
+
+def is_cacheable_result(result: Any) -> bool:
+    # An empty result usually means there was no code at the address (yet)
+    return isinstance(result, str) and len(result) > 2
+
+_CACHES = weakref.WeakKeyDictionary()
+_CACHES_LOCK = threading.Lock()
+
+def get_cache(w3: web3.Web3) -> Optional[CallCache]:
+    return _CACHES.get(w3)
+
+def eth_call_cache_middleware(make_request: Callable, w3: web3.Web3) -> Callable:
+    def middleware(method, params):
+        if method != 'eth_call':
+            response = make_request(method, params)
+            cache = _CACHES.get(w3)
+            if cache is not None:
+                observe_result(cache, method, response.get('result'))
+            return response
+        cache = _CACHES.get(w3)
+        key = call_key(*params[:2]) if cache is not None and len(params) >= 2 else None
+        if key is None:
+            return make_request(method, params)
+        # Outermost layer, so results are already formatted; the cache itself holds
+        # the raw hex strings that rpc.batch_call shares
+        result = cache.get(key)
+        if result is not None:
+            return {'jsonrpc': '2.0', 'id': 0, 'result': HexBytes(result)}
+        response = make_request(method, params)
+        result = response.get('result')
+        if isinstance(result, bytes):
+            result = web3.main.to_hex(result)
+        if 'error' not in response and is_cacheable_result(result):
+            cache.put(key, result)
+        return response
+    return middleware
+
+def install(w3: web3.Web3, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES) -> CallCache:
+    '''Install the shared eth_call cache on w3; calling it again returns the existing cache'''
+    with _CACHES_LOCK:
+        cache = _CACHES.get(w3)
+        if cache is None:
+            cache = _CACHES[w3] = CallCache(max_entries=max_entries, max_bytes=max_bytes)
+            w3.middleware_onion.add(eth_call_cache_middleware, name='eth_call_cache')
+        return cache
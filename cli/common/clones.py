@@ -0,0 +1,33 @@
+# SPDX-License-Identifier: UNLICENSED
+from typing import Optional
+import web3
+
+# EIP-1167 minimal proxy creation code as emitted by OpenZeppelin Clones
+_CLONE_PREFIX = bytes.fromhex('3d602d80600a3d3981f3363d3d373d3d3d363d73')
+_CLONE_SUFFIX = bytes.fromhex('5af43d82803e903d91602b57fd5bf3')
+
+_INIT_CODE_HASH_CACHE = {}
+
+def clone_init_code_hash(implementation: str) -> bytes:
+    result = _INIT_CODE_HASH_CACHE.get(implementation)
+    if result is None:
+        code = _CLONE_PREFIX + web3.main.to_bytes(hexstr=implementation) + _CLONE_SUFFIX
+        result = _INIT_CODE_HASH_CACHE[implementation] = web3.main.eth_utils_keccak(code)
+    return result
+
+def create2_address(deployer: str, salt: bytes, init_code_hash: bytes) -> str:
+    assert len(salt) == 32, salt
+    data = (
+        b'\xff' +
+        web3.main.to_bytes(hexstr=deployer) +
+        salt +
+        init_code_hash
+    )
+    data = web3.main.eth_utils_keccak(data)
+    data = web3.main.to_hex(data[12:])
+    data = web3.main.to_checksum_address(data)
+    return data
+
+def predict_deterministic_address(implementation: str, salt: bytes, deployer: Optional[str] = None) -> str:
+    '''Python equivalent of Clones.predictDeterministicAddress'''
+    return create2_address(deployer or implementation, salt, clone_init_code_hash(implementation))
@@ -0,0 +1,119 @@
+# SPDX-License-Identifier: UNLICENSED
+from typing import Iterable, NamedTuple, Optional, Sequence
+import web3
+from . import rpc
+from .block import BlockContext, BlockIdentifier, current_block_identifier
+
+POW_10_18 = 10**18
+
+class CTokenState(NamedTuple):
+    block_number: int
+    exchange_rate_stored: int
+    accrual_block_number: int
+    borrow_rate: int
+    total_borrows: int
+    total_reserves: int
+    cash: int
+    total_supply: int
+    reserve_factor: int
+
+def calc_exchange_rate(cash: int, total_borrows: int, total_reserves: int, total_supply: int, initial_exchange_rate: int) -> int:
+    if total_supply == 0:
+        return initial_exchange_rate
+    return (cash + total_borrows - total_reserves) * POW_10_18 // total_supply
+
+def accrue(state: CTokenState, block_number: int) -> CTokenState:
+    '''
+    State after CToken.accrueInterest at block_number, assuming nothing else touches
+    the market in between. Mirrors the truncation of Compound's Exponential math.
+    '''
+    block_delta = block_number - state.accrual_block_number
+    assert block_delta >= 0, (block_number, state.accrual_block_number)
+    if block_delta == 0:
+        return state._replace(block_number=block_number)
+    simple_interest_factor = state.borrow_rate * block_delta
+    interest_accumulated = simple_interest_factor * state.total_borrows // POW_10_18
+    total_borrows = interest_accumulated + state.total_borrows
+    total_reserves = state.reserve_factor * interest_accumulated // POW_10_18 + state.total_reserves
+    return state._replace(
+        block_number=block_number,
+        exchange_rate_stored=calc_exchange_rate(state.cash, total_borrows, total_reserves, state.total_supply, state.exchange_rate_stored),
+        accrual_block_number=block_number,
+        total_borrows=total_borrows,
+        total_reserves=total_reserves,
+    )
+
+class CTokenModel:
+    '''
+    Local model of a cToken's interest accrual.
+
+    One batched read of the stored market state is enough to predict what
+    exchangeRateCurrent would return at any later block, without sending it.
+    '''
+    def __init__(self, contract: web3.contract.Contract):
+        self.__contract = contract
+        self.__state = None
+
+    @property
+    def address(self) -> str:
+        return self.__contract.address
+
+    @property
+    def contract(self) -> web3.contract.Contract:
+        return self.__contract
+
+    @property
+    def state(self) -> CTokenState:
+        if self.__state is None:
+            self.refresh()
+        return self.__state
+
+    def functions(self) -> Sequence[web3.contract.ContractFunction]:
+        functions = self.__contract.functions
+        return [
+            functions.exchangeRateStored(),
+            functions.accrualBlockNumber(),
+            functions.borrowRatePerBlock(),
+            functions.totalBorrows(),
+            functions.totalReserves(),
+            functions.getCash(),
+            functions.totalSupply(),
+            functions.reserveFactorMantissa(),
+        ]
+
+    def load(self, block_number: int, results: Sequence[int]) -> CTokenState:
+        self.__state = CTokenState(block_number, *results)
+        return self.__state
+
+    def refresh(self, block_identifier: Optional[BlockIdentifier] = None) -> CTokenState:
+        return refresh((self,), block_identifier)[0]
+
+    def exchange_rate(self, block_number: Optional[int] = None) -> int:
+        '''Predicted exchangeRateCurrent at block_number, by default the block the state was read at'''
+        state = self.state
+        if block_number is None:
+            block_number = state.block_number
+        return accrue(state, block_number).exchange_rate_stored
+
+    def to_underlying(self, amount: int, block_number: Optional[int] = None) -> int:
+        return amount * self.exchange_rate(block_number) // POW_10_18
+
+    def to_ctoken(self, amount: int, block_number: Optional[int] = None) -> int:
+        # Same truncation as the tokens minted for a deposit of amount
+        return amount * POW_10_18 // self.exchange_rate(block_number)
+
+def refresh(models: Iterable[CTokenModel], block_identifier: Optional[BlockIdentifier] = None) -> Sequence[CTokenState]:
+    '''Read the state of every model in a single batch pinned to one block'''
+    models = list(models)
+    if not models:
+        return []
+    w3 = models[0].contract.web3
+    functions = [model.functions() for model in models]
+    with BlockContext(w3, current_block_identifier(block_identifier)) as block_number:
+        results = rpc.batch_call(w3, [function for group in functions for function in group])
+    states = []
+    offset = 0
+    for model, group in zip(models, functions):
+        states.append(model.load(block_number, results[offset:offset + len(group)]))
+        offset += len(group)
+    return states
@@ -0,0 +1,263 @@
+# SPDX-License-Identifier: UNLICENSED
+import enum
+import time
+from typing import Any, Callable, Iterable, Mapping, NamedTuple, Optional, Sequence
+import web3
+from . import rpc
+
+class TxState(enum.IntEnum):
+    PENDING = 0
+    INCLUDED = 1
+    FINAL = 2
+    DROPPED = 3
+    REPLACED = 4
+
+class TrackedTransaction(NamedTuple):
+    tx_hash: str
+    sender: Optional[str]
+    nonce: Optional[int]
+    state: TxState
+    # Block the transaction was last seen pending in, or included in
+    block_number: int
+    block_hash: Optional[str] = None
+    replaced_by: Optional[str] = None
+
+class Block(NamedTuple):
+    number: int
+    hash: str
+    parent_hash: str
+    # (sender, nonce) of every transaction, by hash
+    transactions: Mapping[str, Any]
+
+def _to_hex(value: Any) -> str:
+    return value.lower() if isinstance(value, str) else web3.main.to_hex(value)
+
+def _parse_block(reply: Mapping[str, Any]) -> Block:
+    return Block(
+        int(reply['number'], 16),
+        _to_hex(reply['hash']),
+        _to_hex(reply['parentHash']),
+        dict(
+            (tx['hash'], (web3.main.to_checksum_address(tx['from']), int(tx['nonce'], 16)))
+            for tx in reply['transactions']
+        ),
+    )
+
+class ConfirmationTracker:
+    '''
+    Follows submitted transactions against new heads until they are final, dropped
+    or replaced.
+
+    A single 'latest' block filter drives every tracked transaction: each new head
+    is fetched once with its transactions, linked to the known chain through its
+    parent hash and matched against the tracked hashes and (sender, nonce) pairs
+    locally. A head that does not extend the known chain is a reorg; the orphaned
+    blocks are unwound and the transactions they included go back to pending until
+    they are seen again on the new branch.
+
+    Callbacks run in the thread calling poll():
+        on_final(tx, receipt), on_dropped(tx), on_replaced(tx), on_reorg(fork_number, depth)
+    '''
+    def __init__(self,
+                 w3: web3.Web3,
+                 confirmations: int = 12,
+                 dropped_after: int = 50,
+                 on_final: Optional[Callable[[TrackedTransaction, Mapping[str, Any]], None]] = None,
+                 on_dropped: Optional[Callable[[TrackedTransaction], None]] = None,
+                 on_replaced: Optional[Callable[[TrackedTransaction], None]] = None,
+                 on_reorg: Optional[Callable[[int, int], None]] = None):
+        assert confirmations > 0, confirmations
+        self.__w3 = w3
+        self.__confirmations = confirmations
+        self.__dropped_after = dropped_after
+        self.__on_final = on_final
+        self.__on_dropped = on_dropped
+        self.__on_replaced = on_replaced
+        self.__on_reorg = on_reorg
+        self.__filter = None
+        self.__transactions = {}
+        # Canonical chain of the last blocks seen, by number
+        self.__blocks = {}
+        self.__head = None
+
+    @property
+    def transactions(self) -> Mapping[str, TrackedTransaction]:
+        return self.__transactions
+
+    @property
+    def head(self) -> Optional[Block]:
+        return self.__head
+
+    def track(self, tx_hashes: Iterable[Any]) -> Sequence[TrackedTransaction]:
+        '''
+        Start following transactions; their sender and nonce are read in one batch.
+        The blocks of those already included are fetched in a second batch and kept
+        with the known chain, so a reorg that orphans them is noticed.
+        '''
+        tx_hashes = [_to_hex(tx_hash) for tx_hash in tx_hashes]
+        replies = rpc.batch_request(self.__w3, [('eth_getTransactionByHash', (tx_hash,)) for tx_hash in tx_hashes])
+        if self.__head is None:
+            self.__start()
+        tracked = []
+        for tx_hash, reply in zip(tx_hashes, replies):
+            if reply is None:
+                # Unknown to the node already, dropped unless it shows up in a block
+                tx = TrackedTransaction(tx_hash, None, None, TxState.PENDING, self.__head.number)
+            else:
+                tx = TrackedTransaction(tx_hash, web3.main.to_checksum_address(reply['from']), int(reply['nonce'], 16), TxState.PENDING, self.__head.number)
+                if reply.get('blockHash'):
+                    tx = tx._replace(state=TxState.INCLUDED, block_number=int(reply['blockNumber'], 16), block_hash=_to_hex(reply['blockHash']))
+            self.__transactions[tx_hash] = tx
+            tracked.append(tx)
+
+        # Older blocks are beyond a reorg under our rules, as in __apply
+        oldest = self.__head.number - self.__confirmations
+        block_hashes = list(dict.fromkeys(
+            tx.block_hash
+            for tx in tracked
+            if tx.state == TxState.INCLUDED and oldest < tx.block_number < self.__head.number and tx.block_number not in self.__blocks
+        ))
+        for block in self.__fetch(block_hashes) if block_hashes else ():
+            if block is not None:
+                self.__blocks.setdefault(block.number, block)
+        return tracked
+
+    def __start(self):
+        self.__filter = self.__w3.eth.filter('latest')
+        block = _parse_block(rpc.batch_request(self.__w3, [('eth_getBlockByNumber', ('latest', True))])[0])
+        self.__blocks = {block.number: block}
+        self.__head = block
+
+    def __fetch(self, block_hashes: Sequence[str]) -> Sequence[Optional[Block]]:
+        replies = rpc.batch_request(self.__w3, [('eth_getBlockByHash', (block_hash, True)) for block_hash in block_hashes])
+        return [None if reply is None else _parse_block(reply) for reply in replies]
+
+    def __connect(self, block: Block) -> Sequence[Block]:
+        '''Blocks to apply so that `block` becomes the head, walking back through parents until the known chain'''
+        branch = [block]
+        while True:
+            child = branch[-1]
+            known = self.__blocks.get(child.number - 1)
+            if known is not None and known.hash == child.parent_hash:
+                break
+            if known is None and (not self.__blocks or child.number - 1 < min(self.__blocks)):
+                # Went past what is remembered
+                break
+            # Missed head or orphaned block, fetch the parent
+            parent, = self.__fetch([child.parent_hash])
+            if parent is None:
+                break
+            branch.append(parent)
+        branch.reverse()
+        return branch
+
+    def __rewind(self, fork_number: int):
+        '''Forget the known chain from fork_number up; what it included is pending again'''
+        depth = 0
+        for number in [number for number in self.__blocks if number >= fork_number]:
+            del self.__blocks[number]
+            depth += 1
+        for tx_hash, tx in self.__transactions.items():
+            if tx.state == TxState.INCLUDED and tx.block_number >= fork_number:
+                self.__transactions[tx_hash] = tx._replace(state=TxState.PENDING, block_hash=None)
+            elif tx.state == TxState.PENDING and tx.replaced_by is not None and tx.block_number >= fork_number:
+                self.__transactions[tx_hash] = tx._replace(replaced_by=None)
+        if depth and self.__on_reorg:
+            self.__on_reorg(fork_number, depth)
+
+    def __apply(self, block: Block):
+        self.__blocks[block.number] = block
+        # Nothing older than the confirmation window can be reorged out under our rules
+        for number in [number for number in self.__blocks if number <= block.number - self.__confirmations - 1]:
+            del self.__blocks[number]
+        by_nonce = dict(
+            ((tx.sender, tx.nonce), tx_hash)
+            for tx_hash, tx in self.__transactions.items()
+            if tx.state == TxState.PENDING and tx.sender is not None
+        )
+        for tx_hash, key in block.transactions.items():
+            tx = self.__transactions.get(tx_hash)
+            if tx is not None:
+                if tx.state == TxState.PENDING:
+                    self.__transactions[tx_hash] = tx._replace(state=TxState.INCLUDED, block_number=block.number, block_hash=block.hash, replaced_by=None)
+                continue
+            replaced = by_nonce.get(key)
+            if replaced is not None:
+                # Same sender and nonce, another hash: final once that block is
+                self.__transactions[replaced] = self.__transactions[replaced]._replace(block_number=block.number, replaced_by=tx_hash)
+
+    def __on_head(self, block: Block):
+        known = self.__blocks.get(block.number)
+        if known is not None and known.hash == block.hash:
+            return
+        branch = self.__connect(block)
+        if any(number >= branch[0].number for number in self.__blocks):
+            self.__rewind(branch[0].number)
+        for b in branch:
+            self.__apply(b)
+        self.__head = block
+
+    def __settle(self):
+        head = self.__head
+        final, dropped, replaced, stale = [], [], [], []
+        for tx_hash, tx in self.__transactions.items():
+            confirmed = head.number - tx.block_number + 1 >= self.__confirmations
+            if tx.state == TxState.INCLUDED:
+                known = self.__blocks.get(tx.block_number)
+                if confirmed and (known is None or known.hash == tx.block_hash):
+                    final.append(tx_hash)
+            elif tx.state == TxState.PENDING and tx.replaced_by is not None:
+                if confirmed:
+                    replaced.append(tx_hash)
+            elif tx.state == TxState.PENDING and head.number - tx.block_number >= self.__dropped_after:
+                stale.append(tx_hash)
+
+        if stale:
+            # Long pending transactions still known to the node are waited for again
+            replies = rpc.batch_request(self.__w3, [('eth_getTransactionByHash', (tx_hash,)) for tx_hash in stale])
+            for tx_hash, reply in zip(stale, replies):
+                if reply is None:
+                    dropped.append(tx_hash)
+                else:
+                    self.__transactions[tx_hash] = self.__transactions[tx_hash]._replace(block_number=head.number)
+
+        receipts = rpc.batch_request(self.__w3, [('eth_getTransactionReceipt', (tx_hash,)) for tx_hash in final]) if final else []
+        for tx_hash, receipt in zip(final, receipts):
+            tx = self.__transactions[tx_hash]
+            if receipt is None:
+                # Orphaned in a block we no longer remember
+                self.__transactions[tx_hash] = tx._replace(state=TxState.PENDING, block_number=head.number, block_hash=None)
+                continue
+            if _to_hex(receipt['blockHash']) != tx.block_hash:
+                # Moved to another block, which has to be confirmed in turn
+                self.__transactions[tx_hash] = tx._replace(block_number=int(receipt['blockNumber'], 16), block_hash=_to_hex(receipt['blockHash']))
+                continue
+            tx = self.__transactions.pop(tx_hash)._replace(state=TxState.FINAL)
+            if self.__on_final:
+                self.__on_final(tx, receipt)
+        for tx_hash in replaced:
+            tx = self.__transactions.pop(tx_hash)._replace(state=TxState.REPLACED)
+            if self.__on_replaced:
+                self.__on_replaced(tx)
+        for tx_hash in dropped:
+            tx = self.__transactions.pop(tx_hash)._replace(state=TxState.DROPPED)
+            if self.__on_dropped:
+                self.__on_dropped(tx)
+
+    def poll(self) -> int:
+        '''Process the heads seen since the last poll, returns how many there were'''
+        if self.__head is None:
+            self.__start()
+        block_hashes = [_to_hex(block_hash) for block_hash in self.__filter.get_new_entries()]
+        blocks = [block for block in self.__fetch(block_hashes) if block is not None] if block_hashes else []
+        for block in blocks:
+            self.__on_head(block)
+        if blocks:
+            self.__settle()
+        return len(blocks)
+
+    def run(self, poll_interval: float = 1.0):
+        '''Poll until every tracked transaction is settled'''
+        while self.__transactions:
+            if not self.poll():
+                time.sleep(poll_interval)
@@ -0,0 +1,120 @@
+# SPDX-License-Identifier: UNLICENSED
+from typing import Iterable, Mapping, NamedTuple, Optional, Sequence, Tuple
+import web3
+from . import rpc
+from .abi import InstanceType
+from .clones import predict_deterministic_address
+
+SERIES_EXPIRY_BITS = 12
+SERIES_EXPIRY_INTERVAL = 1 << SERIES_EXPIRY_BITS
+POW_10_18 = 10**18
+
+def calc_expiry_block(blocks: int) -> int:
+    assert 0 < blocks < (1<<32), blocks
+    return (((blocks - 1) >> SERIES_EXPIRY_BITS) + 1) << SERIES_EXPIRY_BITS
+
+def calc_expiry_blocks(first_block: int, last_block: int) -> Sequence[int]:
+    '''Every valid expiry block in [first_block, last_block]'''
+    return range(calc_expiry_block(first_block), last_block + 1, SERIES_EXPIRY_INTERVAL)
+
+def calc_collateral_factor(expiry_block: int, current_block: int) -> int:
+    if current_block >= expiry_block:
+        return 0
+    interval_delta = 1 + ((expiry_block - 1) >> SERIES_EXPIRY_BITS) - (current_block >> SERIES_EXPIRY_BITS)
+    return interval_delta * 10_000_000_000_000 * 256 * 43 // 219
+
+def calc_settle_value_long_short(expiry_block: int, create_block: int, settle_price: int, create_price: int) -> Tuple[int, int]:
+    factor = calc_collateral_factor(expiry_block, create_block)
+    max_price = create_price + create_price * factor // POW_10_18
+    if settle_price <= create_price:
+        return 0, factor
+    if settle_price >= max_price:
+        return factor, 0
+    value_long = settle_price * POW_10_18 // create_price - POW_10_18
+    return value_long, factor - value_long
+
+def calc_address_salt(ctoken: str, expiry_block: int, instance_type: InstanceType) -> bytes:
+    data = (
+        web3.main.to_bytes(hexstr=ctoken) +
+        expiry_block.to_bytes(32, 'big') +
+        bytes((int(instance_type),))
+    )
+    return web3.main.eth_utils_keccak(data)
+
+def calc_address(main: str, ctoken: str, expiry_block: int, instance_type: InstanceType) -> str:
+    return predict_deterministic_address(main, calc_address_salt(ctoken, expiry_block, instance_type))
+
+class FutureSeries(NamedTuple):
+    ctoken: str
+    expiry: int
+    fut_class: str
+    fut_long: str
+    fut_short: str
+
+class FutureTokenRegistry:
+    def __init__(self, future_token: web3.contract.Contract):
+        self.__future_token = future_token
+        self.__predicted = {}
+        self.__series = {}
+        self.__missing = set()
+
+    @property
+    def future_token(self) -> web3.contract.Contract:
+        return self.__future_token
+
+    def predict(self, ctoken: str, expiry: int) -> FutureSeries:
+        key = (ctoken, expiry)
+        series = self.__predicted.get(key)
+        if series is None:
+            main = self.__future_token.address
+            series = self.__predicted[key] = FutureSeries(
+                ctoken,
+                expiry,
+                calc_address(main, ctoken, expiry, InstanceType.CLASS),
+                calc_address(main, ctoken, expiry, InstanceType.LONG),
+                calc_address(main, ctoken, expiry, InstanceType.SHORT),
+            )
+        return series
+
+    def discover(self,
+                 ctokens: Iterable[str],
+                 expiries: Iterable[int],
+                 block_identifier: Optional[rpc.BlockIdentifier] = None,
+                 refresh: bool = False) -> Mapping[Tuple[str, int], FutureSeries]:
+        '''
+        Find every existing series in the (ctoken, expiry) grid with one batched code check.
+        Series never disappear, so found series are cached for good; missing ones are
+        only checked again when refresh is set.
+        '''
+        expiries = list(expiries)
+        grid = [(ctoken, expiry) for ctoken in ctokens for expiry in expiries]
+        unknown = [
+            key for key in grid
+            if key not in self.__series and (refresh or key not in self.__missing)
+        ]
+        if unknown:
+            predicted = [self.predict(*key) for key in unknown]
+            addresses = [
+                address
+                for series in predicted
+                for address in (series.fut_class, series.fut_long, series.fut_short)
+            ]
+            codes = rpc.batch_get_code(self.__future_token.web3, addresses, block_identifier)
+            for i, (key, series) in enumerate(zip(unknown, predicted)):
+                if all(codes[3*i:3*i+3]):
+                    self.__series[key] = series
+                    self.__missing.discard(key)
+                else:
+                    self.__missing.add(key)
+        return dict(
+            (key, self.__series[key])
+            for key in grid
+            if key in self.__series
+        )
+
+    def find(self, ctoken: str, expiry: int, refresh: bool = False) -> Optional[FutureSeries]:
+        return self.discover((ctoken,), (expiry,), refresh=refresh).get((ctoken, expiry))
+
+    def series(self) -> Sequence[FutureSeries]:
+        '''All series discovered so far'''
+        return sorted(self.__series.values(), key=lambda series: (series.ctoken, series.expiry))
@@ -0,0 +1,218 @@
+# SPDX-License-Identifier: UNLICENSED
+from typing import Mapping, NamedTuple, Optional
+import web3
+from . import twap, uniswap
+from .block import BlockContext
+from .proxy_wallet import PricingData, ProxyWallet
+
+POW_10_18 = 10**18
+BLOCKS_PER_YEAR = 2_102_400
+
+def indicative_price(reserve_ctoken: int, reserve_fut: int) -> int:
+    '''Mid price of one future in ctoken, scaled by 1e18'''
+    assert reserve_fut > 0, reserve_fut
+    return reserve_ctoken * POW_10_18 // reserve_fut
+
+def yield_to_price_slippage(yield_slippage: int,
+                            blocks_to_expiry: int,
+                            exchange_rate: int,
+                            min_exchange_rate: int,
+                            price: int) -> int:
+    '''
+    Price slippage limit for a yield slippage limit, both scaled by 1e18:
+
+        pSlipLimit = ySlipLimit * timeFactor * cxr / (min * indic)
+
+    where timeFactor = blocksToExpiry / blocksInYear and indic is the indicative price.
+    '''
+    assert blocks_to_expiry >= 0, blocks_to_expiry
+    assert min_exchange_rate > 0 and price > 0, (min_exchange_rate, price)
+    return (
+        yield_slippage * blocks_to_expiry * exchange_rate * POW_10_18 //
+        (BLOCKS_PER_YEAR * min_exchange_rate * price)
+    )
+
+def _is_safe_hedge(amount: int, reserve_ctoken: int, reserve_fut: int, max_slippage: int) -> bool:
+    if amount <= 0:
+        return True
+    if amount >= reserve_fut:
+        return False
+    amount_in = uniswap.get_amount_in(amount, reserve_ctoken, reserve_fut)
+    # _swap_short swaps with amountInMax the lesser of amount and amount at the
+    # indicative price plus max_slippage
+    return (
+        amount_in <= amount and
+        amount_in * reserve_fut * POW_10_18 <= amount * reserve_ctoken * (POW_10_18 + max_slippage)
+    )
+
+def max_hedge_amount(reserve_ctoken: int, reserve_fut: int, max_slippage: int) -> int:
+    '''Largest future amount _hedge can buy within max_slippage (scaled by 1e18)'''
+    if reserve_ctoken <= 0 or reserve_fut <= 0:
+        return 0
+    # Closed form in real numbers: average price 1000 rIn / (997 (rOut - a)) must stay
+    # below both rIn / rOut * (1 + p) and the amountInMax = amount budget of 1
+    by_slippage = reserve_fut - 1000 * reserve_fut * POW_10_18 // (997 * (POW_10_18 + max_slippage))
+    by_budget = reserve_fut - 1000 * reserve_ctoken // 997
+    lo, hi = 0, max(0, min(by_slippage, by_budget, reserve_fut - 1)) + 2
+    # getAmountIn rounds up, which makes safety ragged for a few units around the real
+    # bound; the search settles on a safe amount at that edge
+    while lo + 1 < hi:
+        mid = (lo + hi) // 2
+        if _is_safe_hedge(mid, reserve_ctoken, reserve_fut, max_slippage):
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+class HedgePlan(NamedTuple):
+    block_number: int
+    token: str
+    blocks: int
+    amount: int
+    hedge_amount: int
+    amount_in: int
+    price: int
+    indicative_price: int
+    reference_price: Optional[int]
+    slippage: int
+    max_slippage: int
+    max_hedge_amount: int
+    max_amount: int
+    safe: bool
+    pricing: PricingData
+
+def plan_hedge(pricing: PricingData,
+               amount: int,
+               token: str,
+               blocks: int,
+               block_number: int,
+               max_slippage: Optional[int] = None,
+               yield_slippage: Optional[int] = None,
+               min_exchange_rate: Optional[int] = None,
+               reference_price: Optional[int] = None) -> HedgePlan:
+    '''
+    Size a depositAndHedge offline from one getPricing result.
+
+    The slippage limit is either max_slippage directly or derived from yield_slippage;
+    both are scaled by 1e18 and never planned below 1. With neither, only the
+    amountInMax budget applies.
+    A reference_price, such as a TWAP, makes the limit relative to it instead of the
+    spot price, which a single trade can move.
+    '''
+    reserve_ctoken = pricing.reserves_ctoken_short
+    reserve_fut = pricing.reserves_fut_short
+    if reserve_ctoken <= 0 or reserve_fut <= 0:
+        raise ValueError('no liquidity for short future')
+    exchange_rate = pricing.exchange_rate
+    price = indicative_price(reserve_ctoken, reserve_fut)
+    if max_slippage is None and yield_slippage is not None:
+        max_slippage = yield_to_price_slippage(
+            yield_slippage,
+            max(0, pricing.expiry - block_number),
+            exchange_rate,
+            min_exchange_rate or exchange_rate,
+            reference_price or price,
+        )
+    if max_slippage is not None and reference_price is not None:
+        # The contract bounds the average price by the pair's spot price when the
+        # hedge executes, so restate the limit against the spot price read here to
+        # keep the average price within max_slippage of the reference
+        max_slippage = reference_price * (POW_10_18 + max_slippage) // price - POW_10_18
+    if max_slippage is None:
+        # amountIn <= amount already caps the average price at 1 ctoken per future
+        max_slippage = POW_10_18 * POW_10_18 // price - POW_10_18
+    # The contract reads 0 as no bound at all, so the tightest bound it enforces is
+    # 1; a spot price above the reference leaves only that
+    max_slippage = max(1, max_slippage)
+
+    # Depositing a ctoken hedges it directly, anything else is minted at the current rate
+    is_ctoken = web3.main.to_checksum_address(token) == pricing.ctoken
+    hedge_amount = amount if is_ctoken else amount * POW_10_18 // exchange_rate
+    max_hedge = max_hedge_amount(reserve_ctoken, reserve_fut, max_slippage)
+    max_amount = max_hedge if is_ctoken else max_hedge * exchange_rate // POW_10_18
+
+    amount_in = 0
+    average_price = 0
+    slippage = 0
+    if 0 < hedge_amount < reserve_fut:
+        amount_in = uniswap.get_amount_in(hedge_amount, reserve_ctoken, reserve_fut)
+        average_price = amount_in * POW_10_18 // hedge_amount
+        # Rounded up, so the trade as planned sits exactly on the bound
+        slippage = max(0, -(-(amount_in * reserve_fut * POW_10_18) // (hedge_amount * reserve_ctoken)) - POW_10_18)
+
+    return HedgePlan(
+        block_number=block_number,
+        token=token,
+        blocks=blocks,
+        amount=amount,
+        hedge_amount=hedge_amount,
+        amount_in=amount_in,
+        price=average_price,
+        indicative_price=price,
+        reference_price=reference_price,
+        slippage=slippage,
+        max_slippage=max_slippage,
+        max_hedge_amount=max_hedge,
+        max_amount=max_amount,
+        safe=hedge_amount > 0 and _is_safe_hedge(hedge_amount, reserve_ctoken, reserve_fut, max_slippage),
+        pricing=pricing,
+    )
+
+class HedgeEngine:
+    '''
+    Pre-trade sizing for ProxyWallet.depositAndHedge from a single getPricing call.
+    With an oracle tracking the short future pairs, slippage is measured against its TWAP.
+    '''
+    def __init__(self, wallet: ProxyWallet, oracle: Optional[twap.TWAPService] = None):
+        self.__wallet = wallet
+        self.__oracle = oracle
+
+    @property
+    def wallet(self) -> ProxyWallet:
+        return self.__wallet
+
+    def plan(self,
+             amount: int,
+             token: str,
+             blocks: int,
+             max_slippage: Optional[int] = None,
+             yield_slippage: Optional[int] = None,
+             min_exchange_rate: Optional[int] = None,
+             tx_from: Optional[str] = None) -> HedgePlan:
+        with BlockContext(self.__wallet.contract.web3) as block_number:
+            pricing = self.__wallet.getPricing(token, blocks, tx_from=tx_from)
+        reference_price = None
+        if self.__oracle is not None:
+            if pricing.uni_fut_ctoken_short not in self.__oracle.pairs:
+                raise ValueError(f'{pricing.uni_fut_ctoken_short} is not tracked by the oracle')
+            reference_price = self.__oracle.price(pricing.uni_fut_ctoken_short, pricing.fut_short)
+            if reference_price is None:
+                raise ValueError(f'no TWAP yet for {pricing.uni_fut_ctoken_short}')
+        return plan_hedge(
+            pricing, amount, token, blocks, block_number,
+            max_slippage=max_slippage,
+            yield_slippage=yield_slippage,
+            min_exchange_rate=min_exchange_rate,
+            reference_price=reference_price,
+        )
+
+    def execute(self,
+                plan: HedgePlan,
+                absolute_deadline: Optional[int] = None,
+                tx_from: Optional[str] = None,
+                relative_deadline: Optional[int] = None,
+                transact: bool = False,
+                tx: Mapping = {}):
+        if not plan.safe:
+            raise ValueError(f'hedge of {plan.hedge_amount} is not safe, largest safe size is {plan.max_hedge_amount}')
+        return self.__wallet.depositAndHedge(
+            plan.amount,
+            plan.token,
+            plan.blocks,
+            max_slippage=plan.max_slippage,
+            absolute_deadline=absolute_deadline,
+            tx_from=tx_from,
+            relative_deadline=relative_deadline,
+            transact=transact,
+            tx=tx,
+        )
@@ -0,0 +1,257 @@
+# SPDX-License-Identifier: UNLICENSED
+import json
+from pathlib import Path
+from typing import Iterable, Mapping, NamedTuple, Optional, Sequence, Union
+import numpy as np
+import web3
+from . import compound, rpc
+from .uniswap import UniswapToken
+
+# One file per column, appended to in step and memory mapped for reading
+COLUMNS = (
+    ('block', np.uint64),
+    ('timestamp', np.uint64),
+    ('reserve0', np.float64),
+    ('reserve1', np.float64),
+    ('exchange_rate', np.float64),
+)
+
+SYNC_TOPIC = web3.main.to_hex(web3.main.eth_utils_keccak(text='Sync(uint112,uint112)'))
+
+class SeriesView(NamedTuple):
+    '''Read-only slices of the memory mapped columns; nothing is copied'''
+    block: np.ndarray
+    timestamp: np.ndarray
+    reserve0: np.ndarray
+    reserve1: np.ndarray
+    exchange_rate: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.block)
+
+    @property
+    def price(self) -> np.ndarray:
+        '''token1 per token0, in raw units'''
+        return self.reserve1 / self.reserve0
+
+def twap(timestamp: np.ndarray, price: np.ndarray, end_timestamp: Optional[int] = None) -> float:
+    '''
+    Time weighted average of a step function, each price holding until the next sample,
+    the last one until end_timestamp.
+    '''
+    if not len(timestamp):
+        return float('nan')
+    timestamp = timestamp.astype(np.int64)
+    end = int(timestamp[-1]) if end_timestamp is None else end_timestamp
+    weights = np.diff(timestamp, append=end)
+    total = weights.sum()
+    if total <= 0:
+        return float(price[-1])
+    return float((price * weights).sum() / total)
+
+class SeriesStore:
+    '''
+    Append-only columnar time series of one pair's reserves and its cToken exchange rate.
+
+    Rows are kept in block order, so the timestamp and block columns are their own
+    index: a range lookup is a binary search over the memory mapped column.
+    '''
+    def __init__(self, path: Union[str, Path], meta: Optional[Mapping] = None):
+        self.__path = Path(path)
+        self.__path.mkdir(parents=True, exist_ok=True)
+        meta_path = self.__path / 'meta.json'
+        if meta is not None and not meta_path.exists():
+            with meta_path.open('w') as fd:
+                json.dump(dict(meta), fd)
+        self.__columns = None
+        self.__length = None
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    @property
+    def meta(self) -> Mapping:
+        meta_path = self.__path / 'meta.json'
+        if not meta_path.exists():
+            return {}
+        with meta_path.open() as fd:
+            return json.load(fd)
+
+    def __column_path(self, name: str) -> Path:
+        return self.__path / f'{name}.bin'
+
+    def __len__(self) -> int:
+        # A torn append leaves some columns longer than others; only whole rows count
+        return min(
+            (self.__column_path(name).stat().st_size if self.__column_path(name).exists() else 0) // np.dtype(dtype).itemsize
+            for name, dtype in COLUMNS
+        )
+
+    def __map(self) -> Mapping[str, np.ndarray]:
+        length = len(self)
+        if self.__columns is None or self.__length != length:
+            self.__columns = dict(
+                (name, np.memmap(self.__column_path(name), dtype=dtype, mode='r', shape=(length,)) if length else np.empty(0, dtype=dtype))
+                for name, dtype in COLUMNS
+            )
+            self.__length = length
+        return self.__columns
+
+    @property
+    def last_block(self) -> Optional[int]:
+        columns = self.__map()
+        if not len(columns['block']):
+            return None
+        return int(columns['block'][-1])
+
+    def append(self,
+               block: Sequence[int],
+               timestamp: Sequence[int],
+               reserve0: Sequence[float],
+               reserve1: Sequence[float],
+               exchange_rate: Sequence[float]):
+        values = dict(block=block, timestamp=timestamp, reserve0=reserve0, reserve1=reserve1, exchange_rate=exchange_rate)
+        arrays = dict((name, np.asarray(values[name], dtype=dtype)) for name, dtype in COLUMNS)
+        count = len(arrays['block'])
+        assert all(len(array) == count for array in arrays.values()), 'columns must have the same length'
+        if not count:
+            return
+        blocks = arrays['block']
+        last_block = self.last_block
+        assert (np.diff(blocks.astype(np.int64)) > 0).all(), 'blocks must be increasing'
+        assert last_block is None or int(blocks[0]) > last_block, (int(blocks[0]), last_block)
+        length = len(self)
+        for name, dtype in COLUMNS:
+            with self.__column_path(name).open('r+b' if self.__column_path(name).exists() else 'wb') as fd:
+                # Drop any partial row left behind by an interrupted append
+                fd.truncate(length * np.dtype(dtype).itemsize)
+                fd.seek(0, 2)
+                fd.write(arrays[name].tobytes())
+
+    def view(self, start: int = 0, stop: Optional[int] = None) -> SeriesView:
+        columns = self.__map()
+        return SeriesView(*(columns[name][start:stop] for name, _ in COLUMNS))
+
+    def time_range(self, start_timestamp: Optional[int] = None, end_timestamp: Optional[int] = None) -> SeriesView:
+        '''Rows with start_timestamp <= timestamp < end_timestamp'''
+        timestamps = self.__map()['timestamp']
+        start = 0 if start_timestamp is None else int(np.searchsorted(timestamps, start_timestamp, side='left'))
+        stop = None if end_timestamp is None else int(np.searchsorted(timestamps, end_timestamp, side='left'))
+        return self.view(start, stop)
+
+    def block_range(self, first_block: Optional[int] = None, last_block: Optional[int] = None) -> SeriesView:
+        '''Rows with first_block <= block <= last_block'''
+        blocks = self.__map()['block']
+        start = 0 if first_block is None else int(np.searchsorted(blocks, first_block, side='left'))
+        stop = None if last_block is None else int(np.searchsorted(blocks, last_block, side='right'))
+        return self.view(start, stop)
+
+    def at(self, timestamp: int) -> Optional[int]:
+        '''Row index of the state in effect at timestamp'''
+        index = int(np.searchsorted(self.__map()['timestamp'], timestamp, side='right')) - 1
+        return index if index >= 0 else None
+
+    def twap(self, start_timestamp: int, end_timestamp: int) -> float:
+        '''TWAP of token1 per token0 over [start_timestamp, end_timestamp), in raw units'''
+        # Start from the row already in effect at start_timestamp, not the first one after it
+        start = self.at(start_timestamp) or 0
+        stop = int(np.searchsorted(self.__map()['timestamp'], end_timestamp, side='left'))
+        view = self.view(start, stop)
+        if not len(view):
+            return float('nan')
+        timestamp = np.maximum(view.timestamp.astype(np.int64), start_timestamp)
+        return twap(timestamp, view.price, end_timestamp)
+
+class Recorder:
+    '''
+    Fill a SeriesStore for one pair, either by sampling state at given blocks with
+    batched archive reads, or by replaying the pair's Sync logs.
+    '''
+    def __init__(self, store: SeriesStore, pair: UniswapToken, ctoken: Optional[compound.CTokenModel] = None):
+        self.__store = store
+        self.__pair = pair
+        self.__ctoken = ctoken
+
+    @property
+    def store(self) -> SeriesStore:
+        return self.__store
+
+    def __timestamps(self, blocks: Sequence[int]) -> Sequence[int]:
+        replies = rpc.batch_request(self.__pair.contract.web3, [('eth_getBlockByNumber', (hex(block), False)) for block in blocks])
+        return [int(reply['timestamp'], 16) for reply in replies]
+
+    def __exchange_rates(self, blocks: Sequence[int]) -> Sequence[float]:
+        if self.__ctoken is None:
+            return [float('nan')] * len(blocks)
+        functions = self.__ctoken.functions()
+        calls = [(function, block) for block in blocks for function in functions]
+        results = rpc.batch_call_at(self.__ctoken.contract.web3, calls)
+        width = len(functions)
+        rates = []
+        for i, block in enumerate(blocks):
+            state = compound.CTokenState(block, *results[i*width:(i+1)*width])
+            rates.append(float(compound.accrue(state, block).exchange_rate_stored))
+        return rates
+
+    def sample(self, blocks: Iterable[int]):
+        '''Record the state at every block not yet in the store'''
+        last_block = self.__store.last_block
+        blocks = sorted(block for block in set(blocks) if last_block is None or block > last_block)
+        if not blocks:
+            return
+        reserves = rpc.batch_call_at(self.__pair.contract.web3, [(self.__pair.contract.functions.getReserves(), block) for block in blocks])
+        self.__store.append(
+            blocks,
+            self.__timestamps(blocks),
+            [float(reserve0) for reserve0, _, _ in reserves],
+            [float(reserve1) for _, reserve1, _ in reserves],
+            self.__exchange_rates(blocks),
+        )
+
+    def update(self, max_blocks: Optional[int] = None):
+        '''Record every block since the last one stored, up to the current head'''
+        head = self.__pair.contract.web3.eth.block_number
+        last_block = self.__store.last_block
+        first = head if last_block is None else last_block + 1
+        if max_blocks is not None:
+            head = min(head, first + max_blocks - 1)
+        self.sample(range(first, head + 1))
+
+    def replay(self, from_block: int, to_block: int):
+        '''Record the blocks in [from_block, to_block] where the pair's reserves changed'''
+        w3 = self.__pair.contract.web3
+        logs = w3.eth.get_logs({
+            'address': self.__pair.address,
+            'topics': [SYNC_TOPIC],
+            'fromBlock': from_block,
+            'toBlock': to_block,
+        })
+        # Only the last Sync of each block is the state at the end of the block
+        reserves = {}
+        for log in logs:
+            data = web3.main.to_bytes(hexstr=log['data']) if isinstance(log['data'], str) else bytes(log['data'])
+            reserves[log['blockNumber']] = (int.from_bytes(data[:32], 'big'), int.from_bytes(data[32:64], 'big'))
+        last_block = self.__store.last_block
+        blocks = sorted(block for block in reserves if last_block is None or block > last_block)
+        if not blocks:
+            return
+        self.__store.append(
+            blocks,
+            self.__timestamps(blocks),
+            [float(reserves[block][0]) for block in blocks],
+            [float(reserves[block][1]) for block in blocks],
+            self.__exchange_rates(blocks),
+        )
+
+def open_store(root: Union[str, Path], pair: UniswapToken) -> SeriesStore:
+    '''The store for a pair under root, created with its token metadata on first use'''
+    return SeriesStore(Path(root) / pair.address, meta={
+        'pair': pair.address,
+        'token0': pair.token0.address,
+        'token1': pair.token1.address,
+        'symbol0': pair.token0.symbol,
+        'symbol1': pair.token1.symbol,
+        'decimals0': pair.token0.decimals,
+        'decimals1': pair.token1.decimals,
+    })
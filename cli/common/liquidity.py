@@ -0,0 +1,212 @@
+# SPDX-License-Identifier: UNLICENSED
+import time
+from typing import Iterable, Mapping, NamedTuple, Optional, Sequence, Tuple
+import web3
+from . import rpc, simulate, uniswap
+from .block import BlockIdentifier
+from .futures import FutureSeries
+
+POW_10_18 = 10**18
+# Gas limit over eth_estimateGas, for state that changes between estimate and inclusion
+GAS_MARGIN = 3, 2
+
+class Allocation(NamedTuple):
+    '''Desired amounts of one deposit, in raw units'''
+    token_a: str
+    token_b: str
+    amount_a: int
+    amount_b: int
+
+class Deposit(NamedTuple):
+    pair: str
+    token_a: str
+    token_b: str
+    amount_a: int
+    amount_b: int
+    amount_a_min: int
+    amount_b_min: int
+    liquidity: int
+
+class Approval(NamedTuple):
+    token: str
+    amount: int
+
+class LiquidityPlan(NamedTuple):
+    block_number: int
+    tx_from: str
+    approvals: Sequence[Approval]
+    deposits: Sequence[Deposit]
+    steps: Sequence[simulate.StepResult]
+
+    @property
+    def gas(self) -> int:
+        '''Nominal gas of the whole plan, for display; execute() estimates the real limits'''
+        return sum(step.gas for step in self.steps)
+
+def ladder(series: Iterable[FutureSeries], amount_long_short: int, amount_fut: int, amount_ctoken: int) -> Sequence[Allocation]:
+    '''The FUTL/FUTS, FUTL/ctoken and FUTS/ctoken deposits for every series'''
+    allocations = []
+    for s in series:
+        allocations.append(Allocation(s.fut_long, s.fut_short, amount_long_short, amount_long_short))
+        allocations.append(Allocation(s.fut_long, s.ctoken, amount_fut, amount_ctoken))
+        allocations.append(Allocation(s.fut_short, s.ctoken, amount_fut, amount_ctoken))
+    return allocations
+
+def optimal_amounts(amount_a_desired: int, amount_b_desired: int, reserve_a: int, reserve_b: int) -> Tuple[int, int]:
+    '''UniswapV2Router._addLiquidity without the minimum checks'''
+    if reserve_a == 0 and reserve_b == 0:
+        return amount_a_desired, amount_b_desired
+    amount_b_optimal = uniswap.quote(amount_a_desired, reserve_a, reserve_b)
+    if amount_b_optimal <= amount_b_desired:
+        return amount_a_desired, amount_b_optimal
+    return uniswap.quote(amount_b_desired, reserve_b, reserve_a), amount_b_desired
+
+class LiquidityPlanner:
+    '''
+    Add liquidity to many pairs as one operation.
+
+    plan() reads every reserve, balance and allowance involved in a single batch,
+    sizes each deposit, nets the approvals per token and dry-runs the lot locally.
+    execute() then sends the approvals and then the deposits, each group back to
+    back with consecutive nonces and its gas limits estimated in one batch.
+    '''
+    def __init__(self, uniswap_: uniswap.Uniswap):
+        self.__uniswap = uniswap_
+
+    @property
+    def uniswap(self) -> uniswap.Uniswap:
+        return self.__uniswap
+
+    def plan(self,
+             allocations: Iterable[Allocation],
+             tx_from: str,
+             max_slippage: int = 0,
+             block_identifier: Optional[BlockIdentifier] = None) -> LiquidityPlan:
+        '''max_slippage, scaled by 1e18, sets the minimum amounts each deposit accepts'''
+        assert 0 <= max_slippage <= POW_10_18, max_slippage
+        allocations = [
+            Allocation(web3.main.to_checksum_address(a.token_a), web3.main.to_checksum_address(a.token_b), a.amount_a, a.amount_b)
+            for a in allocations
+        ]
+        tx_from = web3.main.to_checksum_address(tx_from)
+        router = self.__uniswap.router.address
+        sim = simulate.Simulator(self.__uniswap, block_identifier)
+        tokens = list(dict.fromkeys(token for a in allocations for token in (a.token_a, a.token_b)))
+        sim.prefetch((tx_from,), tokens, ((a.token_a, a.token_b) for a in allocations))
+
+        # Deposits keep a pair's ratio, so only a pair created within the batch moves it
+        reserves = {}
+        sized = []
+        required = dict((token, 0) for token in tokens)
+        for a in allocations:
+            key = (a.token_a, a.token_b)
+            reserve_a, reserve_b = reserves.get(key) or sim.reserves(*key)
+            amount_a, amount_b = optimal_amounts(a.amount_a, a.amount_b, reserve_a, reserve_b)
+            reserves[key] = reserve_a + amount_a, reserve_b + amount_b
+            reserves[(a.token_b, a.token_a)] = reserve_b + amount_b, reserve_a + amount_a
+            required[a.token_a] += amount_a
+            required[a.token_b] += amount_b
+            sized.append((a, amount_a, amount_b))
+
+        for token, amount in required.items():
+            balance = sim.balance_of(token, tx_from)
+            if balance < amount:
+                raise ValueError(f'{tx_from} holds {balance} of {token}, {amount} needed')
+
+        approvals = [
+            Approval(token, amount)
+            for token, amount in required.items()
+            if sim.allowance(token, tx_from, router) < amount
+        ]
+        for approval in approvals:
+            sim.approve(approval.token, tx_from, router, approval.amount)
+
+        deposits = []
+        for a, amount_a, amount_b in sized:
+            amount_a_min = amount_a * (POW_10_18 - max_slippage) // POW_10_18
+            amount_b_min = amount_b * (POW_10_18 - max_slippage) // POW_10_18
+            amount_a, amount_b, liquidity = sim.add_liquidity(
+                a.token_a, a.token_b,
+                a.amount_a, a.amount_b,
+                amount_a_min, amount_b_min,
+                tx_from,
+            )
+            deposits.append(Deposit(
+                sim.pair_for(a.token_a, a.token_b),
+                a.token_a, a.token_b,
+                amount_a, amount_b,
+                amount_a_min, amount_b_min,
+                liquidity,
+            ))
+        return LiquidityPlan(sim.fork.block_number, tx_from, approvals, deposits, sim.steps)
+
+    def __functions(self, plan: LiquidityPlan, deadline: int) -> Sequence[web3.contract.ContractFunction]:
+        w3 = self.__uniswap.router.web3
+        functions = [
+            w3.eth.contract(address=approval.token, abi=uniswap._ABI_IERC20).functions.approve(self.__uniswap.router.address, approval.amount)
+            for approval in plan.approvals
+        ]
+        functions.extend(
+            self.__uniswap.router.functions.addLiquidity(
+                deposit.token_a, deposit.token_b,
+                deposit.amount_a, deposit.amount_b,
+                deposit.amount_a_min, deposit.amount_b_min,
+                plan.tx_from, deadline,
+            )
+            for deposit in plan.deposits
+        )
+        return functions
+
+    def __estimate(self, functions: Sequence[web3.contract.ContractFunction], tx_dicts: Sequence[Mapping]):
+        missing = [i for i, tx_dict in enumerate(tx_dicts) if 'gas' not in tx_dict]
+        if not missing:
+            return
+        w3 = self.__uniswap.router.web3
+        estimates = rpc.batch_estimate_gas(w3, [(functions[i], tx_dicts[i]) for i in missing])
+        for i, gas in zip(missing, estimates):
+            tx_dicts[i]['gas'] = gas * GAS_MARGIN[0] // GAS_MARGIN[1]
+
+    def execute(self,
+                plan: LiquidityPlan,
+                absolute_deadline: Optional[int] = None,
+                relative_deadline: Optional[int] = None,
+                transact: bool = False,
+                tx: Mapping = {}) -> Sequence:
+        '''
+        Receipts of every transaction when transacting, otherwise the unsigned transactions.
+
+        Deposits can only be estimated once their approvals are mined, so without
+        transacting a plan with approvals needs tx['gas'].
+        '''
+        deadline = absolute_deadline
+        if deadline is None:
+            deadline = int(time.time())
+        if relative_deadline:
+            deadline += relative_deadline
+        w3 = self.__uniswap.router.web3
+        functions = self.__functions(plan, deadline)
+        assert len(functions) == len(plan.steps), 'plan steps do not match its transactions'
+        nonce = tx.get('nonce')
+        if nonce is None:
+            nonce = w3.eth.get_transaction_count(plan.tx_from, 'pending')
+        tx_dicts = []
+        for i, function in enumerate(functions):
+            tx_dict = tx.copy(); tx_dict.update({'from': plan.tx_from, 'nonce': nonce + i})
+            tx_dicts.append(tx_dict)
+        if not transact:
+            if plan.approvals and 'gas' not in tx:
+                raise ValueError('deposits cannot be estimated before their approvals are mined, pass a gas limit')
+            self.__estimate(functions, tx_dicts)
+            return [function.build_transaction(tx_dict) for function, tx_dict in zip(functions, tx_dicts)]
+        receipts = []
+        count = len(plan.approvals)
+        for start, end in ((0, count), (count, len(functions))):
+            if start == end:
+                continue
+            self.__estimate(functions[start:end], tx_dicts[start:end])
+            tx_hashes = [function.transact(tx_dict) for function, tx_dict in zip(functions[start:end], tx_dicts[start:end])]
+            receipts.extend(w3.eth.wait_for_transaction_receipt(tx_hash) for tx_hash in tx_hashes)
+            failed = [receipt['transactionHash'] for receipt in receipts[start:] if receipt['status'] != 1]
+            if failed:
+                raise ValueError(f'transactions failed: {", ".join(web3.main.to_hex(tx_hash) for tx_hash in failed)}')
+        return receipts
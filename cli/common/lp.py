@@ -0,0 +1,128 @@
+# SPDX-License-Identifier: UNLICENSED
+from typing import Iterable, Mapping, NamedTuple, Sequence, Tuple
+import numpy as np
+from . import rpc
+from .uniswap import UniswapToken
+
+class PoolHistory(NamedTuple):
+    blocks: np.ndarray
+    timestamp_last: np.ndarray
+    reserve0: np.ndarray
+    reserve1: np.ndarray
+    total_supply: np.ndarray
+    k_last: np.ndarray
+    # totalSupply including the protocol fee liquidity the next mint or burn will add
+    effective_supply: np.ndarray
+
+    @property
+    def price(self) -> np.ndarray:
+        '''token1 per token0, in raw units'''
+        return self.reserve1 / self.reserve0
+
+    @property
+    def liquidity_value(self) -> np.ndarray:
+        '''sqrt(k) per LP token, which only grows through fees'''
+        return np.sqrt(self.reserve0 * self.reserve1) / self.effective_supply
+
+class PositionHistory(NamedTuple):
+    holder: str
+    balance: np.ndarray
+    share: np.ndarray
+    amount0: np.ndarray
+    amount1: np.ndarray
+    # value in token1 units at the pool price
+    value: np.ndarray
+    fee_growth: np.ndarray
+    impermanent_loss: np.ndarray
+    # value against simply holding the amounts withdrawable at the first block
+    lp_vs_hold: np.ndarray
+
+def protocol_fee_liquidity(reserve0: np.ndarray, reserve1: np.ndarray, total_supply: np.ndarray, k_last: np.ndarray) -> np.ndarray:
+    '''Vectorized UniswapV2Pair._mintFee: liquidity minted to feeTo, zero while the fee is off'''
+    root_k = np.sqrt(reserve0 * reserve1)
+    root_k_last = np.sqrt(k_last)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        liquidity = total_supply * (root_k - root_k_last) / (5 * root_k + root_k_last)
+    return np.where((k_last > 0) & (root_k > root_k_last), liquidity, 0.0)
+
+def impermanent_loss(price_ratio: np.ndarray) -> np.ndarray:
+    '''Loss of a constant product position against holding, from the price change alone'''
+    return 2 * np.sqrt(price_ratio) / (1 + price_ratio) - 1
+
+def _as_float(values: Iterable[int]) -> np.ndarray:
+    return np.array([float(value or 0) for value in values], dtype=np.float64)
+
+class LPAnalytics:
+    '''
+    Pool and LP position analytics for one pair over many blocks.
+
+    Reserves, totalSupply, kLast and holder balances for every block are read in a
+    single batch of archive calls pinned to explicit block numbers, so repeated
+    reports are answered from the shared call cache.
+    '''
+    def __init__(self, pair: UniswapToken):
+        self.__pair = pair
+
+    @property
+    def pair(self) -> UniswapToken:
+        return self.__pair
+
+    def fetch(self, blocks: Sequence[int], holders: Iterable[str] = ()) -> Tuple[PoolHistory, Mapping[str, PositionHistory]]:
+        blocks = list(blocks)
+        holders = list(holders)
+        functions = self.__pair.contract.functions
+        pool_functions = (functions.getReserves(), functions.totalSupply(), functions.kLast())
+        holder_functions = [functions.balanceOf(holder) for holder in holders]
+        width = len(pool_functions) + len(holder_functions)
+        calls = [
+            (function, block)
+            for block in blocks
+            for function in pool_functions + tuple(holder_functions)
+        ]
+        results = rpc.batch_call_at(self.__pair.contract.web3, calls)
+        rows = [results[i*width:(i+1)*width] for i in range(len(blocks))]
+
+        reserve0 = _as_float(row[0][0] for row in rows)
+        reserve1 = _as_float(row[0][1] for row in rows)
+        total_supply = _as_float(row[1] for row in rows)
+        k_last = _as_float(row[2] for row in rows)
+        pool = PoolHistory(
+            blocks=np.array(blocks, dtype=np.int64),
+            timestamp_last=np.array([row[0][2] for row in rows], dtype=np.int64),
+            reserve0=reserve0,
+            reserve1=reserve1,
+            total_supply=total_supply,
+            k_last=k_last,
+            effective_supply=total_supply + protocol_fee_liquidity(reserve0, reserve1, total_supply, k_last),
+        )
+
+        positions = {}
+        for i, holder in enumerate(holders):
+            balance = _as_float(row[len(pool_functions) + i] for row in rows)
+            positions[holder] = self.position(pool, holder, balance)
+        return pool, positions
+
+    def position(self, pool: PoolHistory, holder: str, balance: np.ndarray) -> PositionHistory:
+        scale0 = 10.0 ** -self.__pair.token0.decimals
+        scale1 = 10.0 ** -self.__pair.token1.decimals
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = np.where(pool.effective_supply > 0, balance / pool.effective_supply, 0.0)
+            amount0 = share * pool.reserve0 * scale0
+            amount1 = share * pool.reserve1 * scale1
+            price = pool.price * scale1 / scale0
+            liquidity_value = pool.liquidity_value
+            fee_growth = liquidity_value / liquidity_value[0] - 1
+            hold_value = amount0[0] * price + amount1[0]
+            value = amount0 * price + amount1
+            lp_vs_hold = value / hold_value - 1
+        return PositionHistory(
+            holder=holder,
+            balance=balance,
+            share=share,
+            amount0=amount0,
+            amount1=amount1,
+            value=value,
+            fee_growth=fee_growth,
+            impermanent_loss=impermanent_loss(price / price[0]),
+            lp_vs_hold=lp_vs_hold,
+        )
@@ -0,0 +1,98 @@
+# SPDX-License-Identifier: UNLICENSED
+import sys
+import json
+from decimal import Decimal
+from typing import Any, Mapping, Optional, TextIO
+import web3
+
+# Receipt fields that are noise for downstream consumers
+_RECEIPT_SKIP = frozenset(('logsBloom',))
+
+def _default(x: Any) -> Any:
+    # Called by the encoder only for values it cannot serialise itself, so nested
+    # AttributeDicts are converted one shallow level at a time while encoding.
+    if isinstance(x, bytes):
+        return web3.main.to_hex(x)
+    if isinstance(x, Decimal):
+        return str(x)
+    if isinstance(x, Mapping):
+        return dict(x)
+    if isinstance(x, (set, frozenset)):
+        return list(x)
+    raise TypeError(f'Object of type {type(x).__name__} is not JSON serializable')
+
+class NDJSONWriter:
+    def __init__(self, stream: Optional[TextIO] = None, include_logs: bool = False):
+        self.__stream = stream or sys.stdout
+        self.__include_logs = include_logs
+        self.__encoder = json.JSONEncoder(
+            separators=(',', ':'),
+            check_circular=False,
+            default=_default,
+        )
+
+    def write(self, record_type: str, record: Mapping[str, Any]):
+        line = self.__encoder.encode({'type': record_type, **record})
+        self.__stream.write(line)
+        self.__stream.write('\n')
+
+    def flush(self):
+        self.__stream.flush()
+
+    def block(self, block_number: int):
+        self.write('block', {'blockNumber': block_number})
+
+    def receipt(self, receipt: Mapping[str, Any]):
+        skip = _RECEIPT_SKIP if self.__include_logs else _RECEIPT_SKIP | {'logs'}
+        self.write('receipt', dict(
+            (k, v)
+            for k, v in receipt.items()
+            if k not in skip
+        ))
+
+    def balance(self, account: str, symbol: str, decimals: int, balance: Decimal, token: Optional[str] = None):
+        self.write('balance', {
+            'account': account,
+            'token': token,
+            'symbol': symbol,
+            'decimals': decimals,
+            'balance': balance,
+        })
+
+    def reserves(self,
+                 pair: str,
+                 symbol0: str,
+                 symbol1: str,
+                 reserve0: Decimal,
+                 reserve1: Decimal,
+                 account: Optional[str] = None,
+                 block_timestamp_last: Optional[int] = None):
+        self.write('reserves', {
+            'pair': pair,
+            'account': account,
+            'symbol0': symbol0,
+            'symbol1': symbol1,
+            'reserve0': reserve0,
+            'reserve1': reserve1,
+            'blockTimestampLast': block_timestamp_last,
+        })
+
+    def lp_position(self,
+                    pair: str,
+                    account: str,
+                    symbol0: str,
+                    symbol1: str,
+                    liquidity: Decimal,
+                    share: Decimal,
+                    amount0: Decimal,
+                    amount1: Decimal):
+        self.write('lp_position', {
+            'pair': pair,
+            'account': account,
+            'symbol0': symbol0,
+            'symbol1': symbol1,
+            'liquidity': liquidity,
+            'share': share,
+            'amount0': amount0,
+            'amount1': amount1,
+        })
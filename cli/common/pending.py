@@ -0,0 +1,260 @@
+# SPDX-License-Identifier: UNLICENSED
+from typing import Any, Iterable, Mapping, NamedTuple, Optional, Sequence, Tuple
+import web3
+from . import rpc, uniswap
+from .block import BlockIdentifier, current_block_identifier
+
+# Router swap functions taking an exact input, and whether that input is msg.value
+_EXACT_IN = {
+    'swapExactTokensForTokens': False,
+    'swapExactTokensForETH': False,
+    'swapExactTokensForTokensSupportingFeeOnTransferTokens': False,
+    'swapExactTokensForETHSupportingFeeOnTransferTokens': False,
+    'swapExactETHForTokens': True,
+    'swapExactETHForTokensSupportingFeeOnTransferTokens': True,
+}
+# Router swap functions asking an exact output, and whether the maximum input is msg.value
+_EXACT_OUT = {
+    'swapTokensForExactTokens': False,
+    'swapTokensForExactETH': False,
+    'swapETHForExactTokens': True,
+}
+
+class PendingSwap(NamedTuple):
+    tx_hash: str
+    sender: str
+    nonce: int
+    gas_price: int
+    path: Sequence[str]
+    # Exact input and minimum output, or maximum input and exact output
+    exact_in: bool
+    amount_in: int
+    amount_out: int
+    deadline: int
+
+def _int(value: Any) -> int:
+    return int(value, 16) if isinstance(value, str) else value
+
+def _gas_price(tx: Mapping[str, Any]) -> int:
+    return _int(tx.get('maxFeePerGas') or tx.get('gasPrice') or 0)
+
+def decode_router_transaction(router: web3.contract.Contract, tx: Mapping[str, Any]) -> Optional[PendingSwap]:
+    '''The swap a pending router transaction makes, None for anything else'''
+    if not tx.get('to') or web3.main.to_checksum_address(tx['to']) != router.address:
+        return None
+    try:
+        function, args = router.decode_function_input(tx['input'])
+    except ValueError:
+        return None
+    name = function.fn_name
+    path = [web3.main.to_checksum_address(token) for token in args.get('path', ())]
+    if len(path) < 2:
+        return None
+    tx_hash = tx['hash'] if isinstance(tx['hash'], str) else web3.main.to_hex(tx['hash'])
+    head = (tx_hash, web3.main.to_checksum_address(tx['from']), _int(tx['nonce']), _gas_price(tx), path)
+    value = _int(tx.get('value', 0))
+    if name in _EXACT_IN:
+        amount_in = value if _EXACT_IN[name] else args['amountIn']
+        return PendingSwap(*head, True, amount_in, args['amountOutMin'], args['deadline'])
+    if name in _EXACT_OUT:
+        amount_in_max = value if _EXACT_OUT[name] else args['amountInMax']
+        return PendingSwap(*head, False, amount_in_max, args['amountOut'], args['deadline'])
+    return None
+
+def decode_pair_transaction(pair: web3.contract.Contract, token0: str, token1: str, tx: Mapping[str, Any]) -> Optional[PendingSwap]:
+    '''
+    A direct IUniswapV2Pair.swap. The input is sent to the pair beforehand and is
+    not part of the call, so it is taken to be the least the pair accepts.
+    '''
+    if not tx.get('to') or web3.main.to_checksum_address(tx['to']) != pair.address:
+        return None
+    try:
+        function, args = pair.decode_function_input(tx['input'])
+    except ValueError:
+        return None
+    if function.fn_name != 'swap' or bool(args['amount0Out']) == bool(args['amount1Out']):
+        return None
+    tx_hash = tx['hash'] if isinstance(tx['hash'], str) else web3.main.to_hex(tx['hash'])
+    path, amount_out = ([token1, token0], args['amount0Out']) if args['amount0Out'] else ([token0, token1], args['amount1Out'])
+    return PendingSwap(tx_hash, web3.main.to_checksum_address(tx['from']), _int(tx['nonce']), _gas_price(tx), path, False, 2**256 - 1, amount_out, 2**256 - 1)
+
+class PendingState:
+    '''
+    Reserves of a set of pairs as mined, and as projected once the pending swaps
+    touching them are mined in gas price order.
+
+    sync() reads the mined reserves of every pair in one batch. The projection is
+    rebuilt only when the pending set changes; a swap whose limits would make it
+    revert, or that routes through a pair not tracked here, is left out. Quotes
+    look reserves up in a dict either way, so pending quotes cost the same as mined
+    ones.
+    '''
+    def __init__(self, uniswap_: uniswap.Uniswap, pairs: Iterable[Tuple[str, str]]):
+        self.__uniswap = uniswap_
+        factory = uniswap_.factory.address
+        # (token_in, token_out) -> (pair, token_in is token0)
+        self.__pairs = {}
+        for token_a, token_b in pairs:
+            token_a = web3.main.to_checksum_address(token_a)
+            token_b = web3.main.to_checksum_address(token_b)
+            token0, token1 = sorted((token_a, token_b), key=lambda token: web3.main.to_bytes(hexstr=token))
+            pair = uniswap.calc_pair_address(factory, token0, token1)
+            self.__pairs[(token0, token1)] = (pair, True)
+            self.__pairs[(token1, token0)] = (pair, False)
+        self.__pair_contracts = dict(
+            (pair, uniswap_.router.web3.eth.contract(address=pair, abi=uniswap._ABI_IUniswapV2Pair))
+            for pair, _ in self.__pairs.values()
+        )
+        self.__tokens = dict(
+            (pair, key)
+            for key, (pair, is_token0) in self.__pairs.items()
+            if is_token0
+        )
+        self.__mined = {}
+        self.__projected = None
+        self.__swaps = {}
+        self.__block_number = None
+        self.__timestamp = 0
+
+    @property
+    def block_number(self) -> Optional[int]:
+        return self.__block_number
+
+    @property
+    def swaps(self) -> Mapping[str, PendingSwap]:
+        return self.__swaps
+
+    def sync(self, block_identifier: Optional[BlockIdentifier] = None, mined: Iterable[str] = ()) -> int:
+        '''Load the mined reserves and forget the pending transactions that were mined since'''
+        w3 = self.__uniswap.router.web3
+        block = rpc.batch_request(w3, [('eth_getBlockByNumber', (rpc.format_block_identifier(current_block_identifier(block_identifier)), False))])[0]
+        block_number = int(block['number'], 16)
+        pairs = list(self.__pair_contracts)
+        results = rpc.batch_call(w3, [self.__pair_contracts[pair].functions.getReserves() for pair in pairs], block_number)
+        self.__mined = dict((pair, (reserve0, reserve1)) for pair, (reserve0, reserve1, _) in zip(pairs, results))
+        self.__block_number = block_number
+        self.__timestamp = int(block['timestamp'], 16)
+        for tx_hash in list(mined) + list(block['transactions']):
+            self.__swaps.pop(tx_hash, None)
+        self.__projected = None
+        return block_number
+
+    def add(self, transactions: Iterable[Mapping[str, Any]]) -> int:
+        '''Decode pending transactions to the router or a tracked pair, returns how many are swaps'''
+        router = self.__uniswap.router
+        count = 0
+        for tx in transactions:
+            swap = decode_router_transaction(router, tx)
+            if swap is None and tx.get('to'):
+                pair = web3.main.to_checksum_address(tx['to'])
+                if pair in self.__pair_contracts:
+                    swap = decode_pair_transaction(self.__pair_contracts[pair], *self.__tokens[pair], tx)
+            if swap is None:
+                continue
+            # A replacement with the same nonce supersedes the earlier transaction
+            for tx_hash, other in list(self.__swaps.items()):
+                if (other.sender, other.nonce) == (swap.sender, swap.nonce):
+                    del self.__swaps[tx_hash]
+            self.__swaps[swap.tx_hash] = swap
+            count += 1
+        if count:
+            self.__projected = None
+        return count
+
+    def remove(self, tx_hashes: Iterable[str]):
+        for tx_hash in tx_hashes:
+            if self.__swaps.pop(tx_hash, None) is not None:
+                self.__projected = None
+
+    def __project(self) -> Mapping[str, Tuple[int, int]]:
+        reserves = dict(self.__mined)
+        # Highest paying first, then each sender's transactions in nonce order
+        for swap in sorted(self.__swaps.values(), key=lambda swap: (-swap.gas_price, swap.sender, swap.nonce)):
+            if swap.deadline < self.__timestamp:
+                continue
+            try:
+                self.__apply(reserves, swap)
+            except (AssertionError, ValueError, KeyError):
+                # Reverts or routes outside the tracked pairs
+                continue
+        return reserves
+
+    def __apply(self, reserves: Mapping[str, Tuple[int, int]], swap: PendingSwap):
+        hops = list(zip(swap.path, swap.path[1:]))
+        if swap.exact_in:
+            amounts = self.__amounts_out(reserves, swap.amount_in, swap.path)
+            if amounts[-1] < swap.amount_out:
+                raise ValueError('UniswapV2Router: INSUFFICIENT_OUTPUT_AMOUNT')
+        else:
+            amounts = self.__amounts_in(reserves, swap.amount_out, swap.path)
+            if amounts[0] > swap.amount_in:
+                raise ValueError('UniswapV2Router: EXCESSIVE_INPUT_AMOUNT')
+        for (token_in, token_out), amount_in, amount_out in zip(hops, amounts, amounts[1:]):
+            pair, is_token0 = self.__pairs[(token_in, token_out)]
+            reserve0, reserve1 = reserves[pair]
+            if is_token0:
+                reserves[pair] = reserve0 + amount_in, reserve1 - amount_out
+            else:
+                reserves[pair] = reserve0 - amount_out, reserve1 + amount_in
+
+    def __reserves(self, reserves: Mapping[str, Tuple[int, int]], token_in: str, token_out: str) -> Tuple[int, int]:
+        pair, is_token0 = self.__pairs[(token_in, token_out)]
+        reserve0, reserve1 = reserves[pair]
+        return (reserve0, reserve1) if is_token0 else (reserve1, reserve0)
+
+    def __amounts_out(self, reserves: Mapping[str, Tuple[int, int]], amount_in: int, path: Sequence[str]) -> Sequence[int]:
+        assert len(path) >= 2, 'UniswapV2Library: INVALID_PATH'
+        amounts = [amount_in]
+        for token_in, token_out in zip(path, path[1:]):
+            amounts.append(uniswap.get_amount_out(amounts[-1], *self.__reserves(reserves, token_in, token_out)))
+        return amounts
+
+    def __amounts_in(self, reserves: Mapping[str, Tuple[int, int]], amount_out: int, path: Sequence[str]) -> Sequence[int]:
+        assert len(path) >= 2, 'UniswapV2Library: INVALID_PATH'
+        amounts = [amount_out]
+        for token_in, token_out in reversed(list(zip(path, path[1:]))):
+            amounts.insert(0, uniswap.get_amount_in(amounts[0], *self.__reserves(reserves, token_in, token_out)))
+        return amounts
+
+    def __state(self, pending: bool) -> Mapping[str, Tuple[int, int]]:
+        if not pending:
+            return self.__mined
+        if self.__projected is None:
+            self.__projected = self.__project()
+        return self.__projected
+
+    def reserves(self, token_a: str, token_b: str, pending: bool = True) -> Tuple[int, int]:
+        return self.__reserves(self.__state(pending), token_a, token_b)
+
+    def get_amounts_out(self, amount_in: int, path: Sequence[str], pending: bool = True) -> Sequence[int]:
+        '''Raw amounts along path, as UniswapV2Router.getAmountsOut on the mined or projected reserves'''
+        return self.__amounts_out(self.__state(pending), amount_in, path)
+
+    def get_amounts_in(self, amount_out: int, path: Sequence[str], pending: bool = True) -> Sequence[int]:
+        return self.__amounts_in(self.__state(pending), amount_out, path)
+
+class PendingWatcher:
+    '''
+    Feeds a PendingState from the node's pending transaction filter, e.g. ganache
+    or anvil standing in for a mempool. Each poll fetches the new transactions in
+    one batch.
+    '''
+    def __init__(self, w3: web3.Web3, state: PendingState):
+        self.__w3 = w3
+        self.__state = state
+        self.__filter = None
+
+    def poll(self) -> int:
+        if self.__filter is None:
+            self.__filter = self.__w3.eth.filter('pending')
+        tx_hashes = [
+            tx_hash if isinstance(tx_hash, str) else web3.main.to_hex(tx_hash)
+            for tx_hash in self.__filter.get_new_entries()
+        ]
+        if not tx_hashes:
+            return 0
+        replies = rpc.batch_request(self.__w3, [('eth_getTransactionByHash', (tx_hash,)) for tx_hash in tx_hashes], raise_on_error=False)
+        return self.__state.add(
+            reply for reply in replies
+            if isinstance(reply, Mapping) and reply.get('blockHash') is None
+        )
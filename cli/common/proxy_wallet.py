@@ -0,0 +1,206 @@
+# SPDX-License-Identifier: UNLICENSED
+import time
+from typing import Iterable, Mapping, NamedTuple, Optional, Sequence
+import web3
+from . import cache, rpc
+from .clones import predict_deterministic_address
+from .uniswap import _ABI_IERC20
+from .block import BlockIdentifier, current_block_identifier
+
+ETH_TOKEN_ADDRESS = '0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE'
+# max_slippage the contract reads as no bound besides 1 ctoken per future
+NO_SLIPPAGE_LIMIT = 0
+
+def calc_wallet_salt(owner: str) -> bytes:
+    return bytes(12) + web3.main.to_bytes(hexstr=owner)
+
+def calc_wallet_address(master: str, owner: str) -> str:
+    '''Python equivalent of ProxyWallet.getWalletAddress called by owner'''
+    return predict_deterministic_address(master, calc_wallet_salt(owner))
+
+def calc_wallet_addresses(master: str, owners: Iterable[str]) -> Mapping[str, str]:
+    return dict((owner, calc_wallet_address(master, owner)) for owner in owners)
+
+class PricingData(NamedTuple):
+    exchange_rate: int
+    expiry: int
+    reserves_fut_long: int
+    reserves_ctoken_long: int
+    reserves_fut_short: int
+    reserves_ctoken_short: int
+    timestamp_fut_ctoken_long: int
+    timestamp_fut_ctoken_short: int
+    ctoken: str
+    fut_class: str
+    fut_long: str
+    fut_short: str
+    uni_fut_ctoken_long: str
+    uni_fut_ctoken_short: str
+
+class BalanceData(NamedTuple):
+    balance_token: int
+    balance_ctoken: int
+    balance_future_long: int
+    balance_future_short: int
+    expiry: int
+    token: str
+    ctoken: str
+    fut_class: str
+    fut_long: str
+    fut_short: str
+
+class HedgeOrder(NamedTuple):
+    token: str
+    amount: int
+    blocks: int
+
+def group_orders(orders: Iterable[HedgeOrder]) -> Sequence[HedgeOrder]:
+    '''Orders with orders of the same token made adjacent, as depositAndHedgeMany expects'''
+    groups = {}
+    for order in orders:
+        token = web3.main.to_checksum_address(order.token)
+        groups.setdefault(token, []).append(HedgeOrder(token, order.amount, order.blocks))
+    return [order for group in groups.values() for order in group]
+
+class ProxyWallet:
+    def __init__(self, contract: web3.contract.Contract):
+        cache.install(contract.web3)
+        self.__contract = contract
+
+    @property
+    def address(self) -> str:
+        return self.__contract.address
+
+    @property
+    def contract(self) -> web3.contract.Contract:
+        return self.__contract
+
+    def owner(self) -> str:
+        return self.__contract.functions.owner().call()
+
+    def getWalletOrNull(self, owner: str) -> Optional['ProxyWallet']:
+        address = self.__contract.functions.getWalletOrNull().call({'from': owner})
+        if not any(web3.main.to_bytes(hexstr=address)):
+            return None
+        return ProxyWallet(self.__contract.web3.eth.contract(address=address, abi=self.__contract.abi))
+
+    def walletAddress(self, owner: str) -> str:
+        return calc_wallet_address(self.address, owner)
+
+    def walletsOrNull(self, owners: Iterable[str], block_identifier: Optional[BlockIdentifier] = None) -> Mapping[str, Optional['ProxyWallet']]:
+        '''getWalletOrNull of every owner, with the addresses computed locally and their code read in one batch'''
+        addresses = calc_wallet_addresses(self.address, owners)
+        if not addresses:
+            return {}
+        w3 = self.__contract.web3
+        codes = rpc.batch_get_code(w3, addresses.values(), block_identifier)
+        return dict(
+            (owner, ProxyWallet(w3.eth.contract(address=address, abi=self.__contract.abi)) if code else None)
+            for (owner, address), code in zip(addresses.items(), codes)
+        )
+
+    def getPricing(self, token: str, blocks: int, tx_from: Optional[str] = None, block_identifier: Optional[BlockIdentifier] = None) -> PricingData:
+        # getPricing accrues interest through exchangeRateCurrent, so it is only ever simulated
+        tx_dict = {'from': tx_from} if tx_from else {}
+        function = self.__contract.functions.getPricing(token, blocks)
+        return PricingData(*function.call(tx_dict, block_identifier=current_block_identifier(block_identifier)))
+
+    def getBalancesForTokenExpiry(self, token: str, blocks: int, block_identifier: Optional[BlockIdentifier] = None) -> BalanceData:
+        function = self.__contract.functions.getBalancesForTokenExpiry(token, blocks)
+        return BalanceData(*function.call(block_identifier=current_block_identifier(block_identifier)))
+
+    def depositAndHedge(self,
+                        amount: int,
+                        token: str,
+                        blocks: int,
+                        max_slippage: int,
+                        absolute_deadline: Optional[int] = None,
+                        tx_from: Optional[str] = None,
+                        relative_deadline: Optional[int] = None,
+                        transact: bool = False,
+                        tx: Mapping = {}):
+        '''
+        The hedge reverts if its average price is more than max_slippage (scaled by
+        1e18) above the spot price of the short future pair. The contract reads 0 as
+        no bound besides 1 ctoken per future, so it has to be asked for explicitly
+        with NO_SLIPPAGE_LIMIT.
+        '''
+        deadline = absolute_deadline
+        if deadline is None:
+            deadline = int(time.time())
+        if relative_deadline:
+            deadline += relative_deadline
+        tx_from = tx_from or tx.get('from') or self.__contract.web3.eth.default_account
+        function = self.__contract.functions.depositAndHedge(amount, token, blocks, max_slippage, deadline)
+        tx_dict = tx.copy(); tx_dict.update({'from': tx_from})
+        if token == ETH_TOKEN_ADDRESS:
+            tx_dict['value'] = amount
+        if transact:
+            tx_hash = function.transact(tx_dict)
+            receipt = self.__contract.web3.eth.get_transaction_receipt(tx_hash)
+            return receipt
+        else:
+            return function.call(tx_dict)
+
+    def approvalsForOrders(self, orders: Iterable[HedgeOrder], owner: str, block_identifier: Optional[BlockIdentifier] = None) -> Mapping[str, int]:
+        '''Total amount of every ERC20 token the wallet still has to be approved for, read in one batch'''
+        totals = {}
+        for order in orders:
+            if order.token != ETH_TOKEN_ADDRESS:
+                token = web3.main.to_checksum_address(order.token)
+                totals[token] = totals.get(token, 0) + order.amount
+        if not totals:
+            return {}
+        w3 = self.__contract.web3
+        functions = [
+            w3.eth.contract(address=token, abi=_ABI_IERC20).functions.allowance(owner, self.address)
+            for token in totals
+        ]
+        allowances = rpc.batch_call(w3, functions, block_identifier)
+        return dict(
+            (token, amount)
+            for (token, amount), allowance in zip(totals.items(), allowances)
+            if allowance < amount
+        )
+
+    def depositAndHedgeMany(self,
+                            orders: Iterable[HedgeOrder],
+                            max_slippage: int,
+                            absolute_deadline: Optional[int] = None,
+                            tx_from: Optional[str] = None,
+                            relative_deadline: Optional[int] = None,
+                            transact: bool = False,
+                            tx: Mapping = {}):
+        '''
+        Deposit and hedge every order in one transaction. When transacting, each
+        token is first approved once for the total of its orders. max_slippage
+        applies to every hedge as in depositAndHedge.
+        '''
+        deadline = absolute_deadline
+        if deadline is None:
+            deadline = int(time.time())
+        if relative_deadline:
+            deadline += relative_deadline
+        w3 = self.__contract.web3
+        tx_from = tx_from or tx.get('from') or w3.eth.default_account
+        orders = group_orders(orders)
+        assert orders, 'no orders'
+        approvals = self.approvalsForOrders(orders, tx_from)
+        function = self.__contract.functions.depositAndHedgeMany(orders, max_slippage, deadline)
+        tx_dict = tx.copy(); tx_dict.update({'from': tx_from})
+        tx_dict['value'] = sum(order.amount for order in orders if order.token == ETH_TOKEN_ADDRESS)
+        if not transact:
+            if approvals:
+                raise ValueError(f'{self.address} must first be approved for {", ".join(f"{amount} of {token}" for token, amount in approvals.items())}')
+            return function.call(tx_dict)
+        approve_dict = dict((key, value) for key, value in tx.items() if key not in ('gas', 'nonce', 'value'))
+        approve_dict.update({'from': tx_from})
+        tx_hashes = [
+            w3.eth.contract(address=token, abi=_ABI_IERC20).functions.approve(self.address, amount).transact(approve_dict)
+            for token, amount in approvals.items()
+        ]
+        failed = [receipt['transactionHash'] for receipt in map(w3.eth.wait_for_transaction_receipt, tx_hashes) if receipt['status'] != 1]
+        if failed:
+            raise ValueError(f'approvals failed: {", ".join(web3.main.to_hex(tx_hash) for tx_hash in failed)}')
+        tx_hash = function.transact(tx_dict)
+        return w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -0,0 +1,116 @@
+# SPDX-License-Identifier: UNLICENSED
+import json
+from typing import Any, Iterable, Mapping, Optional, Sequence, Tuple, Union
+import web3
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3._utils.request import make_post_request
+from . import cache
+from .block import BlockIdentifier, current_block_identifier
+
+BATCH_SIZE = 500
+
+def format_block_identifier(block_identifier: Optional[BlockIdentifier] = None) -> str:
+    block_identifier = current_block_identifier(block_identifier)
+    if isinstance(block_identifier, int):
+        return hex(block_identifier)
+    return block_identifier
+
+def batch_request(w3: web3.Web3, requests: Sequence[Tuple[str, Sequence[Any]]], raise_on_error: bool = True) -> Sequence[Any]:
+    provider = w3.provider
+    endpoint_uri = getattr(provider, 'endpoint_uri', None)
+    call_cache = cache.get_cache(w3)
+    results = [None] * len(requests)
+    for offset in range(0, len(requests), BATCH_SIZE):
+        payload = [
+            {'jsonrpc': '2.0', 'id': offset + i, 'method': method, 'params': list(params)}
+            for i, (method, params) in enumerate(requests[offset:offset + BATCH_SIZE])
+        ]
+        if isinstance(provider, web3.HTTPProvider) and endpoint_uri:
+            raw_response = make_post_request(endpoint_uri, json.dumps(payload).encode(), **dict(provider.get_request_kwargs()))
+            replies = json.loads(raw_response)
+        else:
+            replies = None
+        if not isinstance(replies, list):
+            # provider or node without batch support, one request at a time
+            replies = [
+                dict(provider.make_request(item['method'], item['params']), id=item['id'])
+                for item in payload
+            ]
+        for reply in replies:
+            index = reply['id']
+            if 'error' in reply:
+                error = ValueError(reply['error'])
+                if raise_on_error:
+                    raise error
+                results[index] = error
+            else:
+                results[index] = reply['result']
+                if call_cache is not None:
+                    cache.observe_result(call_cache, requests[index][0], reply['result'])
+    return results
+
+def encode_call(function: web3.contract.ContractFunction) -> Mapping:
+    return {'to': function.address, 'data': function._encode_transaction_data()}
+
+def decode_call(w3: web3.Web3, function: web3.contract.ContractFunction, data: Union[str, bytes]) -> Any:
+    if isinstance(data, str):
+        data = web3.main.to_bytes(hexstr=data)
+    output_types = get_abi_output_types(function.abi)
+    output_data = w3.codec.decode_abi(output_types, data)
+    normalized_data = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, output_data)
+    if len(normalized_data) == 1:
+        return normalized_data[0]
+    return normalized_data
+
+def batch_call(w3: web3.Web3,
+               functions: Sequence[web3.contract.ContractFunction],
+               block_identifier: Optional[BlockIdentifier] = None,
+               allow_failure: bool = False) -> Sequence[Any]:
+    block = format_block_identifier(block_identifier)
+    return batch_call_at(w3, [(function, block) for function in functions], allow_failure=allow_failure)
+
+def batch_call_at(w3: web3.Web3,
+                  calls: Sequence[Tuple[web3.contract.ContractFunction, BlockIdentifier]],
+                  allow_failure: bool = False) -> Sequence[Any]:
+    '''Like batch_call, but every call names its own block, e.g. for archive reads across many blocks'''
+    requests = [('eth_call', (encode_call(function), format_block_identifier(block))) for function, block in calls]
+    call_cache = cache.get_cache(w3)
+    if call_cache is None:
+        replies = batch_request(w3, requests, raise_on_error=not allow_failure)
+    else:
+        # Only send what the shared call cache cannot answer
+        keys = [cache.call_key(*params) for _, params in requests]
+        replies = [None if key is None else call_cache.get(key) for key in keys]
+        misses = [i for i, reply in enumerate(replies) if reply is None]
+        for i, reply in zip(misses, batch_request(w3, [requests[i] for i in misses], raise_on_error=not allow_failure)):
+            replies[i] = reply
+            if keys[i] is not None and cache.is_cacheable_result(reply):
+                call_cache.put(keys[i], reply)
+    results = []
+    for (function, _), reply in zip(calls, replies):
+        if isinstance(reply, Exception):
+            results.append(None)
+            continue
+        try:
+            results.append(decode_call(w3, function, reply))
+        except Exception:
+            if not allow_failure:
+                raise
+            results.append(None)
+    return results
+
+def batch_get_code(w3: web3.Web3, addresses: Iterable[str], block_identifier: Optional[BlockIdentifier] = None) -> Sequence[bytes]:
+    block = format_block_identifier(block_identifier)
+    replies = batch_request(w3, [('eth_getCode', (address, block)) for address in addresses])
+    return [web3.main.to_bytes(hexstr=reply) for reply in replies]
+
+def batch_estimate_gas(w3: web3.Web3, calls: Sequence[Tuple[web3.contract.ContractFunction, Mapping]]) -> Sequence[int]:
+    '''eth_estimateGas of every (function, tx) in one batch, each against the node's current state'''
+    requests = []
+    for function, tx in calls:
+        params = dict(encode_call(function), **{'from': tx['from']})
+        if tx.get('value'):
+            params['value'] = hex(tx['value'])
+        requests.append(('eth_estimateGas', (params,)))
+    return [int(reply, 16) for reply in batch_request(w3, requests)]
@@ -0,0 +1,156 @@
+# SPDX-License-Identifier: UNLICENSED
+import os
+import concurrent.futures
+from multiprocessing import shared_memory
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence, Tuple
+import web3
+from . import rpc
+from .block import BlockIdentifier, current_block_identifier
+from .uniswap import calc_pair_address
+
+SHARD_SIZE = 2048
+WORD_SIZE = 32
+
+_SELECTOR_BALANCE_OF = '0x70a08231'
+_SELECTOR_GET_RESERVES = '0x0902f1ac'
+
+# Per worker process connection, set up once by the pool initializer
+_WORKER_W3 = None
+
+def _init_worker(provider_uri: str):
+    global _WORKER_W3
+    _WORKER_W3 = web3.Web3(web3.HTTPProvider(provider_uri))
+
+def _encode_balance_of(account: str) -> str:
+    return _SELECTOR_BALANCE_OF + account[2:].lower().rjust(64, '0')
+
+def _write_results(shm_name: str, offset: int, count: int, words: int, replies: Sequence[Any]):
+    # Each item takes `words` raw 32 byte words, followed by one status byte per item
+    # after the data region; failed or empty replies leave the item zeroed
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        item_size = words * WORD_SIZE
+        status_base = count * item_size
+        for i, reply in enumerate(replies):
+            if isinstance(reply, Exception) or not reply or len(reply) < 2 + 2 * item_size:
+                continue
+            index = offset + i
+            shm.buf[index*item_size:(index+1)*item_size] = bytes.fromhex(reply[2:2 + 2*item_size])
+            shm.buf[status_base + index] = 1
+    finally:
+        shm.close()
+
+def _scan_balances_shard(shm_name: str, offset: int, count: int, items: Sequence[Tuple[str, Optional[str]]], block: str):
+    requests = []
+    for account, token in items:
+        if token is None:
+            requests.append(('eth_getBalance', (account, block)))
+        else:
+            requests.append(('eth_call', ({'to': token, 'data': _encode_balance_of(account)}, block)))
+    replies = rpc.batch_request(_WORKER_W3, requests, raise_on_error=False)
+    # eth_getBalance returns an unpadded quantity
+    replies = [
+        '0x' + reply[2:].rjust(64, '0') if token is None and isinstance(reply, str) else reply
+        for (_, token), reply in zip(items, replies)
+    ]
+    _write_results(shm_name, offset, count, 1, replies)
+
+def _scan_reserves_shard(shm_name: str, offset: int, count: int, factory: str, items: Sequence[Tuple[str, str]], block: str):
+    requests = [
+        ('eth_call', ({'to': calc_pair_address(factory, token_a, token_b), 'data': _SELECTOR_GET_RESERVES}, block))
+        for token_a, token_b in items
+    ]
+    replies = rpc.batch_request(_WORKER_W3, requests, raise_on_error=False)
+    _write_results(shm_name, offset, count, 3, replies)
+
+class ScanExecutor:
+    '''
+    Fan large read-only scans out over a pool of worker processes.
+
+    Every worker keeps its own pooled HTTP connection, encodes and batches its shard
+    of calls, and writes the raw result words straight into one shared memory block,
+    so only the compact results cross the process boundary. Every call in a scan is
+    pinned to a single block.
+    '''
+    def __init__(self, provider_uri: str, processes: Optional[int] = None, shard_size: int = SHARD_SIZE):
+        assert shard_size > 0, shard_size
+        self.__w3 = web3.Web3(web3.HTTPProvider(provider_uri))
+        self.__shard_size = shard_size
+        self.__pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes or os.cpu_count(),
+            initializer=_init_worker,
+            initargs=(provider_uri,),
+        )
+
+    def __enter__(self) -> 'ScanExecutor':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.__pool.shutdown()
+
+    def resolve_block(self, block_identifier: Optional[BlockIdentifier] = None) -> int:
+        block_identifier = current_block_identifier(block_identifier)
+        if isinstance(block_identifier, int):
+            return block_identifier
+        if block_identifier == 'latest':
+            return self.__w3.eth.block_number
+        return self.__w3.eth.get_block(block_identifier).number
+
+    def __run(self, shard: Callable, items: Sequence[Any], words: int, block: int, *args) -> Sequence[Optional[Sequence[int]]]:
+        count = len(items)
+        if not count:
+            return []
+        item_size = words * WORD_SIZE
+        shm = shared_memory.SharedMemory(create=True, size=count * (item_size + 1))
+        try:
+            shm.buf[:count * (item_size + 1)] = bytes(count * (item_size + 1))
+            futures = [
+                self.__pool.submit(shard, shm.name, offset, count, *args, items[offset:offset + self.__shard_size], hex(block))
+                for offset in range(0, count, self.__shard_size)
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+            data = shm.buf
+            status_base = count * item_size
+            results = []
+            for index in range(count):
+                if not data[status_base + index]:
+                    results.append(None)
+                    continue
+                base = index * item_size
+                results.append(tuple(
+                    int.from_bytes(data[base + i*WORD_SIZE:base + (i+1)*WORD_SIZE], 'big')
+                    for i in range(words)
+                ))
+            del data
+            return results
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def balances(self,
+                 accounts: Iterable[str],
+                 tokens: Iterable[Optional[str]],
+                 block_identifier: Optional[BlockIdentifier] = None) -> Mapping[Tuple[str, Optional[str]], Optional[int]]:
+        '''Raw balance of every (account, token) pair; a token of None means ETH'''
+        tokens = list(tokens)
+        items = [(account, token) for account in accounts for token in tokens]
+        block = self.resolve_block(block_identifier)
+        results = self.__run(_scan_balances_shard, items, 1, block)
+        return dict(
+            (item, result and result[0])
+            for item, result in zip(items, results)
+        )
+
+    def reserves(self,
+                 factory: str,
+                 pairs: Iterable[Tuple[str, str]],
+                 block_identifier: Optional[BlockIdentifier] = None) -> Mapping[Tuple[str, str], Optional[Tuple[int, int, int]]]:
+        '''Raw getReserves() of every predicted pair; None where no pair exists'''
+        items = list(pairs)
+        block = self.resolve_block(block_identifier)
+        results = self.__run(_scan_reserves_shard, items, 3, block, factory)
+        return dict(zip(items, results))
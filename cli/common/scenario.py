@@ -0,0 +1,229 @@
+# SPDX-License-Identifier: UNLICENSED
+import math
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from .futures import SERIES_EXPIRY_BITS
+
+BLOCKS_PER_YEAR = 2_102_400
+DEFAULT_BATCH_SIZE = 1 << 17
+
+# Collateral factor per expiry interval, as in FutureToken.calcCollateralFactor
+_FACTOR_PER_INTERVAL = 10_000_000_000_000 * 256 * 43 // 219 / 1e18
+
+# A sampler draws `size` terminal exchange rates, relative to the rate at creation
+Sampler = Callable[[np.random.Generator, int], np.ndarray]
+
+def collateral_factor(expiry_block, current_block) -> np.ndarray:
+    '''Vectorized calcCollateralFactor, as a fraction rather than scaled by 1e18'''
+    expiry_block = np.asarray(expiry_block, dtype=np.int64)
+    current_block = np.asarray(current_block, dtype=np.int64)
+    interval_delta = 1 + ((expiry_block - 1) >> SERIES_EXPIRY_BITS) - (current_block >> SERIES_EXPIRY_BITS)
+    return np.where(current_block >= expiry_block, 0.0, interval_delta * _FACTOR_PER_INTERVAL)
+
+def settle_values(factor, ratio) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Vectorized calcSettleValueLongShort for settle_price / create_price = ratio.
+    The long side takes the rate growth capped at the collateral factor, the short
+    side the rest of the collateral.
+    '''
+    value_long = np.clip(np.asarray(ratio) - 1.0, 0.0, factor)
+    return value_long, factor - value_long
+
+def gbm(drift: float, volatility: float, blocks: int) -> Sampler:
+    '''Terminal rates of a geometric Brownian motion over `blocks`, with annualised parameters'''
+    t = blocks / BLOCKS_PER_YEAR
+    mean = (drift - volatility * volatility / 2) * t
+    scale = volatility * math.sqrt(t)
+    def sample(rng: np.random.Generator, size: int) -> np.ndarray:
+        return np.exp(rng.normal(mean, scale, size))
+    return sample
+
+def bootstrap(rates: Sequence[float], blocks: int, step_blocks: int) -> Sampler:
+    '''
+    Terminal rates built by resampling historical log growth over `step_blocks`
+    from a series of exchange rates sampled every `step_blocks`.
+    '''
+    log_returns = np.diff(np.log(np.asarray(rates, dtype=np.float64)))
+    assert len(log_returns) > 0, 'need at least two historical rates'
+    steps = max(1, round(blocks / step_blocks))
+    def sample(rng: np.random.Generator, size: int) -> np.ndarray:
+        total = np.zeros(size)
+        for _ in range(steps):
+            total += log_returns[rng.integers(0, len(log_returns), size)]
+        return np.exp(total)
+    return sample
+
+class Position(NamedTuple):
+    kind: str
+    amount: float
+    cost: float
+    reserve_fut: float = 0.0
+    reserve_ctoken: float = 0.0
+
+class Portfolio:
+    '''
+    Positions in one future class, all in ctoken units: FUTL/FUTS balances, shares of
+    the FUTL/ctoken and FUTS/ctoken Uniswap pools, and plain ctoken.
+    '''
+    def __init__(self):
+        self.__positions: List[Position] = []
+
+    @property
+    def positions(self) -> Sequence[Position]:
+        return tuple(self.__positions)
+
+    @property
+    def cost(self) -> float:
+        return sum(position.cost for position in self.__positions)
+
+    def add_ctoken(self, amount: float, cost: Optional[float] = None) -> 'Portfolio':
+        self.__positions.append(Position('ctoken', amount, amount if cost is None else cost))
+        return self
+
+    def add_long(self, amount: float, cost: float) -> 'Portfolio':
+        self.__positions.append(Position('long', amount, cost))
+        return self
+
+    def add_short(self, amount: float, cost: float) -> 'Portfolio':
+        self.__positions.append(Position('short', amount, cost))
+        return self
+
+    def add_lp(self, side: str, share: float, reserve_fut: float, reserve_ctoken: float, cost: Optional[float] = None) -> 'Portfolio':
+        assert side in ('long', 'short'), side
+        assert 0 <= share <= 1, share
+        if cost is None:
+            cost = 2 * share * reserve_ctoken
+        self.__positions.append(Position(f'lp_{side}', share, cost, reserve_fut, reserve_ctoken))
+        return self
+
+    def value(self, value_long: np.ndarray, value_short: np.ndarray) -> np.ndarray:
+        '''Settlement value in ctoken for each scenario'''
+        total = np.zeros(np.shape(value_long))
+        for position in self.__positions:
+            if position.kind == 'ctoken':
+                total += position.amount
+            elif position.kind == 'long':
+                total += position.amount * value_long
+            elif position.kind == 'short':
+                total += position.amount * value_short
+            else:
+                # Arbitraged to the settle price p, a constant product pool is worth 2 sqrt(k p)
+                price = value_long if position.kind == 'lp_long' else value_short
+                k = position.reserve_fut * position.reserve_ctoken
+                total += position.amount * 2 * np.sqrt(k * price)
+        return total
+
+class Moments:
+    '''Streaming mean and variance, merged batch by batch'''
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values: np.ndarray):
+        count = len(values)
+        if not count:
+            return
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        delta = mean - self.mean
+        total = self.count + count
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+class ScenarioResult(NamedTuple):
+    scenarios: int
+    factor: float
+    ratio: Moments
+    value_long: Moments
+    value_short: Moments
+    pnl: Moments
+    benchmark_pnl: Optional[Moments]
+    samples: Optional[np.ndarray]
+
+    @property
+    def hedge_effectiveness(self) -> Optional[float]:
+        '''Share of the benchmark's P&L variance removed by the portfolio'''
+        if self.benchmark_pnl is None or self.benchmark_pnl.variance == 0:
+            return None
+        return 1 - self.pnl.variance / self.benchmark_pnl.variance
+
+    def quantiles(self, q: Sequence[float]) -> np.ndarray:
+        assert self.samples is not None, 'run with keep_samples=True'
+        return np.quantile(self.samples, q)
+
+class ScenarioEngine:
+    '''
+    Monte-Carlo settlement of a future class over simulated cToken exchange rates.
+
+    Scenarios are generated and valued in batches of batch_size, so memory stays
+    bounded however many are run; only float32 P&L samples are kept, on request.
+    '''
+    def __init__(self,
+                 expiry_block: int,
+                 create_block: int,
+                 sampler: Sampler,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 seed: Optional[int] = None):
+        assert batch_size > 0, batch_size
+        self.__factor = float(collateral_factor(expiry_block, create_block))
+        self.__sampler = sampler
+        self.__batch_size = batch_size
+        self.__rng = np.random.default_rng(seed)
+
+    @property
+    def factor(self) -> float:
+        return self.__factor
+
+    def run(self,
+            portfolio: Portfolio,
+            scenarios: int,
+            benchmark: Optional[Portfolio] = None,
+            keep_samples: bool = False) -> ScenarioResult:
+        '''
+        P&L is measured in underlying, with the exchange rate at creation as 1, so a
+        ctoken position carries the rate risk that the futures hedge.
+        '''
+        ratio_moments = Moments()
+        long_moments = Moments()
+        short_moments = Moments()
+        pnl_moments = Moments()
+        benchmark_moments = Moments() if benchmark is not None else None
+        samples = np.empty(scenarios, dtype=np.float32) if keep_samples else None
+        cost = portfolio.cost
+        for offset in range(0, scenarios, self.__batch_size):
+            size = min(self.__batch_size, scenarios - offset)
+            ratio = self.__sampler(self.__rng, size)
+            value_long, value_short = settle_values(self.__factor, ratio)
+            pnl = portfolio.value(value_long, value_short) * ratio - cost
+            ratio_moments.update(ratio)
+            long_moments.update(value_long)
+            short_moments.update(value_short)
+            pnl_moments.update(pnl)
+            if benchmark is not None:
+                benchmark_moments.update(benchmark.value(value_long, value_short) * ratio - benchmark.cost)
+            if samples is not None:
+                samples[offset:offset + size] = pnl
+        return ScenarioResult(
+            scenarios=scenarios,
+            factor=self.__factor,
+            ratio=ratio_moments,
+            value_long=long_moments,
+            value_short=short_moments,
+            pnl=pnl_moments,
+            benchmark_pnl=benchmark_moments,
+            samples=samples,
+        )
@@ -0,0 +1,711 @@
+# SPDX-License-Identifier: UNLICENSED
+import math
+from decimal import Decimal
+from typing import Any, Callable, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+import web3
+from . import rpc, uniswap
+from .block import BlockContext, BlockIdentifier, current_block_identifier
+from .token import Token
+
+UINT256_MAX = (1<<256)-1
+MINIMUM_LIQUIDITY = 10**3
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+# Every UniswapV2 LP token has 18 decimals
+LP_QUANTUM = Decimal((0, (1,), -18))
+
+# Nominal gas per step, rough mainnet figures for comparing plans with each
+# other. They are not estimates of any transaction: use eth_estimateGas, e.g.
+# rpc.batch_estimate_gas, for gas limits
+GAS = {
+    'approve': 46_000,
+    'transfer': 51_000,
+    'transferFrom': 60_000,
+    'deposit': 45_000,
+    'swap': 105_000,
+    'swap_hop': 60_000,
+    'swap_eth': 12_000,
+    'createPair': 2_000_000,
+    'addLiquidity': 150_000,
+    'addLiquidity_first': 200_000,
+    'removeLiquidity': 160_000,
+}
+
+class StepResult(NamedTuple):
+    name: str
+    output: Any
+    gas: int
+
+class Fork:
+    '''
+    Token balances, allowances and pair state copied lazily from one block.
+
+    Whatever a simulation reads is fetched once and kept; prefetch() loads a known
+    working set in a single batch. Writes only ever touch the local copy.
+    '''
+    def __init__(self, w3: web3.Web3, block_identifier: Optional[BlockIdentifier] = None):
+        self.__w3 = w3
+        with BlockContext(w3, current_block_identifier(block_identifier)) as block_number:
+            self.__block_number = block_number
+        self.__state = {}
+        self.__journal: Optional[List[Tuple[Tuple, Any]]] = None
+        self.__fetches = 0
+
+    @property
+    def block_number(self) -> int:
+        return self.__block_number
+
+    @property
+    def fetches(self) -> int:
+        '''Number of round trips to the node so far'''
+        return self.__fetches
+
+    def __erc20(self, token: str) -> web3.contract.Contract:
+        return self.__w3.eth.contract(address=token, abi=uniswap._ABI_IERC20)
+
+    def __pair(self, pair: str) -> web3.contract.Contract:
+        return self.__w3.eth.contract(address=pair, abi=uniswap._ABI_IUniswapV2Pair)
+
+    def __calls(self, key: Tuple) -> Sequence[Tuple[Tuple, Optional[web3.contract.ContractFunction]]]:
+        kind = key[0]
+        if kind == 'balance':
+            return [(key, self.__erc20(key[1]).functions.balanceOf(key[2]))]
+        if kind == 'allowance':
+            return [(key, self.__erc20(key[1]).functions.allowance(key[2], key[3]))]
+        if kind == 'supply':
+            return [(key, self.__erc20(key[1]).functions.totalSupply())]
+        if kind == 'pair':
+            functions = self.__pair(key[1]).functions
+            return [(key, functions.getReserves()), (('k_last', key[1]), functions.kLast())]
+        raise KeyError(key)
+
+    def prefetch(self, keys: Iterable[Tuple]):
+        '''Load every missing key in one batch'''
+        keys = [key for key in dict.fromkeys(keys) if key not in self.__state]
+        if not keys:
+            return
+        # Pair state is only readable once we know the pair exists
+        pairs = list(dict.fromkeys(
+            key[1] for key in keys
+            if key[0] in ('pair', 'code') and ('code', key[1]) not in self.__state
+        ))
+        codes = rpc.batch_get_code(self.__w3, pairs, self.__block_number) if pairs else []
+        for pair, code in zip(pairs, codes):
+            self.__state[('code', pair)] = len(code) > 0
+        calls = []
+        eth = []
+        for key in keys:
+            if key[0] == 'code':
+                continue
+            if key[0] == 'pair' and not self.__state[('code', key[1])]:
+                self.__state[key] = (0, 0)
+                self.__state[('k_last', key[1])] = 0
+            elif key[0] in ('supply', 'balance', 'allowance') and self.__state.get(('code', key[1])) is False:
+                # LP token of a pair that has not been created yet
+                self.__state[key] = 0
+            elif key[0] == 'eth':
+                eth.append(key)
+            else:
+                calls.extend(call for call in self.__calls(key) if call[0] not in self.__state)
+        results = rpc.batch_call(self.__w3, [function for _, function in calls], self.__block_number) if calls else []
+        for (key, _), result in zip(calls, results):
+            self.__state[key] = tuple(result[:2]) if key[0] == 'pair' else result
+        if eth:
+            balances = rpc.batch_request(self.__w3, [('eth_getBalance', (key[1], hex(self.__block_number))) for key in eth])
+            for key, balance in zip(eth, balances):
+                self.__state[key] = int(balance, 16)
+        self.__fetches += 1
+
+    def get(self, key: Tuple) -> Any:
+        if key not in self.__state:
+            self.prefetch((('pair', key[1]) if key[0] == 'k_last' else key,))
+        return self.__state[key]
+
+    def set(self, key: Tuple, value: Any):
+        if self.__journal is not None:
+            self.__journal.append((key, self.get(key)))
+        self.__state[key] = value
+
+    def atomic(self, function: Callable[[], Any]) -> Any:
+        '''Run function as one transaction: any exception undoes its writes'''
+        assert self.__journal is None, 'transactions do not nest'
+        self.__journal = []
+        try:
+            return function()
+        except BaseException:
+            for key, value in reversed(self.__journal):
+                self.__state[key] = value
+            raise
+        finally:
+            self.__journal = None
+
+class Simulator:
+    '''
+    Local execution of ERC20 and UniswapV2 router calls on top of a Fork.
+
+    Token and router semantics, including revert reasons, the 0.3% fee, minimum
+    liquidity and the protocol fee, are modelled in Python rather than run as
+    bytecode, so only plain ERC20 tokens and the stock UniswapV2 router and pairs
+    are simulated faithfully; fee-on-transfer or rebasing tokens are not. Amounts
+    are raw integers and every step returns its output and nominal gas from GAS.
+    '''
+    def __init__(self, uniswap_: uniswap.Uniswap, block_identifier: Optional[BlockIdentifier] = None):
+        self.__uniswap = uniswap_
+        self.__router = uniswap_.router.address
+        self.__factory = uniswap_.factory.address
+        self.__weth = uniswap_.weth
+        self.__fork = Fork(uniswap_.router.web3, block_identifier)
+        self.__fee_to = None
+        self.__steps: List[StepResult] = []
+
+    @property
+    def fork(self) -> Fork:
+        return self.__fork
+
+    @property
+    def uniswap(self) -> uniswap.Uniswap:
+        return self.__uniswap
+
+    @property
+    def steps(self) -> Sequence[StepResult]:
+        return tuple(self.__steps)
+
+    @property
+    def gas(self) -> int:
+        '''Nominal gas of the steps so far, see GAS'''
+        return sum(step.gas for step in self.__steps)
+
+    def pair_for(self, token_a: str, token_b: str) -> str:
+        return uniswap.calc_pair_address(self.__factory, token_a, token_b)
+
+    def prefetch(self, accounts: Iterable[str], tokens: Iterable[str], pairs: Iterable[Tuple[str, str]] = ()):
+        '''Load balances and router allowances of accounts, and the state of pairs, in one batch'''
+        accounts = list(accounts)
+        tokens = list(tokens)
+        keys = [('eth', account) for account in accounts]
+        for token in tokens:
+            keys.append(('supply', token))
+            for account in accounts:
+                keys.append(('balance', token, account))
+                keys.append(('allowance', token, account, self.__router))
+        for token_a, token_b in pairs:
+            pair = self.pair_for(token_a, token_b)
+            keys.append(('pair', pair))
+            keys.append(('supply', pair))
+            keys.extend(('balance', token, pair) for token in (token_a, token_b, pair))
+            keys.extend(('balance', pair, account) for account in accounts)
+            keys.extend(('allowance', pair, account, self.__router) for account in accounts)
+        self.__fork.prefetch(keys)
+
+    def __step(self, name: str, gas: int, function: Callable[[], Any]) -> Any:
+        output = self.__fork.atomic(function)
+        self.__steps.append(StepResult(name, output, gas))
+        return output
+
+    # ERC20
+
+    def balance_of(self, token: str, account: str) -> int:
+        return self.__fork.get(('balance', token, account))
+
+    def allowance(self, token: str, owner: str, spender: str) -> int:
+        return self.__fork.get(('allowance', token, owner, spender))
+
+    def total_supply(self, token: str) -> int:
+        return self.__fork.get(('supply', token))
+
+    def eth_balance(self, account: str) -> int:
+        return self.__fork.get(('eth', account))
+
+    def __move(self, token: str, sender: str, recipient: str, amount: int):
+        balance = self.balance_of(token, sender)
+        if balance < amount:
+            raise ValueError('ERC20: transfer amount exceeds balance')
+        self.__fork.set(('balance', token, sender), balance - amount)
+        self.__fork.set(('balance', token, recipient), self.balance_of(token, recipient) + amount)
+
+    def __spend(self, token: str, owner: str, spender: str, amount: int):
+        allowance = self.allowance(token, owner, spender)
+        if allowance < amount:
+            raise ValueError('ERC20: transfer amount exceeds allowance')
+        if allowance != UINT256_MAX:
+            self.__fork.set(('allowance', token, owner, spender), allowance - amount)
+
+    def __transfer_from(self, token: str, spender: str, sender: str, recipient: str, amount: int):
+        self.__spend(token, sender, spender, amount)
+        self.__move(token, sender, recipient, amount)
+
+    def approve(self, token: str, owner: str, spender: str, value: int) -> bool:
+        def run():
+            self.__fork.set(('allowance', token, owner, spender), value)
+            return True
+        return self.__step('approve', GAS['approve'], run)
+
+    def increase_allowance(self, token: str, owner: str, spender: str, increment: int) -> bool:
+        def run():
+            self.__fork.set(('allowance', token, owner, spender), self.allowance(token, owner, spender) + increment)
+            return True
+        return self.__step('increaseAllowance', GAS['approve'], run)
+
+    def decrease_allowance(self, token: str, owner: str, spender: str, decrement: int) -> bool:
+        def run():
+            allowance = self.allowance(token, owner, spender)
+            if allowance < decrement:
+                raise ValueError('ERC20: decreased allowance below zero')
+            self.__fork.set(('allowance', token, owner, spender), allowance - decrement)
+            return True
+        return self.__step('decreaseAllowance', GAS['approve'], run)
+
+    def transfer(self, token: str, sender: str, recipient: str, value: int) -> bool:
+        def run():
+            self.__move(token, sender, recipient, value)
+            return True
+        return self.__step('transfer', GAS['transfer'], run)
+
+    def transfer_from(self, token: str, spender: str, sender: str, recipient: str, value: int) -> bool:
+        def run():
+            self.__transfer_from(token, spender, sender, recipient, value)
+            return True
+        return self.__step('transferFrom', GAS['transferFrom'], run)
+
+    def deposit(self, account: str, value: int) -> bool:
+        '''WETH.deposit'''
+        def run():
+            self.__pay_eth(account, value)
+            self.__mint(self.__weth, account, value)
+            return True
+        return self.__step('deposit', GAS['deposit'], run)
+
+    def __pay_eth(self, account: str, value: int):
+        balance = self.eth_balance(account)
+        if balance < value:
+            raise ValueError('insufficient funds for transfer')
+        self.__fork.set(('eth', account), balance - value)
+
+    def __mint(self, token: str, account: str, amount: int):
+        self.__fork.set(('supply', token), self.total_supply(token) + amount)
+        self.__fork.set(('balance', token, account), self.balance_of(token, account) + amount)
+
+    def __burn(self, token: str, account: str, amount: int):
+        self.__fork.set(('balance', token, account), self.balance_of(token, account) - amount)
+        self.__fork.set(('supply', token), self.total_supply(token) - amount)
+
+    # UniswapV2Pair
+
+    def reserves(self, token_a: str, token_b: str) -> Tuple[int, int]:
+        '''Reserves of token_a and token_b, zero for a pair that does not exist yet'''
+        reserve0, reserve1 = self.__fork.get(('pair', self.pair_for(token_a, token_b)))
+        return (reserve0, reserve1) if self.__sorted(token_a, token_b)[0] == token_a else (reserve1, reserve0)
+
+    def __sorted(self, token_a: str, token_b: str) -> Tuple[str, str]:
+        if web3.main.to_bytes(hexstr=token_b) < web3.main.to_bytes(hexstr=token_a):
+            return token_b, token_a
+        return token_a, token_b
+
+    def __fee_on(self) -> bool:
+        if self.__fee_to is None:
+            self.__fee_to = self.__uniswap.factory.functions.feeTo().call(block_identifier=self.__fork.block_number)
+        return int(self.__fee_to, 16) != 0
+
+    def __sync(self, pair: str, token0: str, token1: str):
+        self.__fork.set(('pair', pair), (self.balance_of(token0, pair), self.balance_of(token1, pair)))
+
+    def __mint_fee(self, pair: str, reserve0: int, reserve1: int) -> bool:
+        fee_on = self.__fee_on()
+        k_last = self.__fork.get(('k_last', pair))
+        if fee_on:
+            if k_last:
+                root_k = math.isqrt(reserve0 * reserve1)
+                root_k_last = math.isqrt(k_last)
+                if root_k > root_k_last:
+                    liquidity = self.total_supply(pair) * (root_k - root_k_last) // (5 * root_k + root_k_last)
+                    if liquidity > 0:
+                        self.__mint(pair, self.__fee_to, liquidity)
+        elif k_last:
+            self.__fork.set(('k_last', pair), 0)
+        return fee_on
+
+    def __pair_mint(self, pair: str, token0: str, token1: str, to: str) -> int:
+        reserve0, reserve1 = self.__fork.get(('pair', pair))
+        amount0 = self.balance_of(token0, pair) - reserve0
+        amount1 = self.balance_of(token1, pair) - reserve1
+        fee_on = self.__mint_fee(pair, reserve0, reserve1)
+        total_supply = self.total_supply(pair)
+        if total_supply == 0:
+            liquidity = math.isqrt(amount0 * amount1) - MINIMUM_LIQUIDITY
+            if liquidity > 0:
+                self.__mint(pair, ZERO_ADDRESS, MINIMUM_LIQUIDITY)
+        else:
+            liquidity = min(amount0 * total_supply // reserve0, amount1 * total_supply // reserve1)
+        if liquidity <= 0:
+            raise ValueError('UniswapV2: INSUFFICIENT_LIQUIDITY_MINTED')
+        self.__mint(pair, to, liquidity)
+        self.__sync(pair, token0, token1)
+        if fee_on:
+            reserve0, reserve1 = self.__fork.get(('pair', pair))
+            self.__fork.set(('k_last', pair), reserve0 * reserve1)
+        return liquidity
+
+    def __pair_burn(self, pair: str, token0: str, token1: str, to: str) -> Tuple[int, int]:
+        reserve0, reserve1 = self.__fork.get(('pair', pair))
+        balance0 = self.balance_of(token0, pair)
+        balance1 = self.balance_of(token1, pair)
+        liquidity = self.balance_of(pair, pair)
+        fee_on = self.__mint_fee(pair, reserve0, reserve1)
+        total_supply = self.total_supply(pair)
+        amount0 = liquidity * balance0 // total_supply
+        amount1 = liquidity * balance1 // total_supply
+        if amount0 <= 0 or amount1 <= 0:
+            raise ValueError('UniswapV2: INSUFFICIENT_LIQUIDITY_BURNED')
+        self.__burn(pair, pair, liquidity)
+        self.__move(token0, pair, to, amount0)
+        self.__move(token1, pair, to, amount1)
+        self.__sync(pair, token0, token1)
+        if fee_on:
+            reserve0, reserve1 = self.__fork.get(('pair', pair))
+            self.__fork.set(('k_last', pair), reserve0 * reserve1)
+        return amount0, amount1
+
+    def __pair_swap(self, pair: str, token0: str, token1: str, amount0_out: int, amount1_out: int, to: str):
+        if amount0_out <= 0 and amount1_out <= 0:
+            raise ValueError('UniswapV2: INSUFFICIENT_OUTPUT_AMOUNT')
+        reserve0, reserve1 = self.__fork.get(('pair', pair))
+        if amount0_out >= reserve0 or amount1_out >= reserve1:
+            raise ValueError('UniswapV2: INSUFFICIENT_LIQUIDITY')
+        if amount0_out > 0:
+            self.__move(token0, pair, to, amount0_out)
+        if amount1_out > 0:
+            self.__move(token1, pair, to, amount1_out)
+        balance0 = self.balance_of(token0, pair)
+        balance1 = self.balance_of(token1, pair)
+        amount0_in = max(0, balance0 - (reserve0 - amount0_out))
+        amount1_in = max(0, balance1 - (reserve1 - amount1_out))
+        if amount0_in <= 0 and amount1_in <= 0:
+            raise ValueError('UniswapV2: INSUFFICIENT_INPUT_AMOUNT')
+        balance0_adjusted = balance0 * 1000 - amount0_in * 3
+        balance1_adjusted = balance1 * 1000 - amount1_in * 3
+        if balance0_adjusted * balance1_adjusted < reserve0 * reserve1 * 1000**2:
+            raise ValueError('UniswapV2: K')
+        self.__sync(pair, token0, token1)
+
+    # UniswapV2Router02
+
+    def get_amounts_out(self, amount_in: int, path: Sequence[str]) -> Sequence[int]:
+        assert len(path) >= 2, 'UniswapV2Library: INVALID_PATH'
+        amounts = [amount_in]
+        for token_in, token_out in zip(path, path[1:]):
+            amounts.append(uniswap.get_amount_out(amounts[-1], *self.reserves(token_in, token_out)))
+        return amounts
+
+    def get_amounts_in(self, amount_out: int, path: Sequence[str]) -> Sequence[int]:
+        assert len(path) >= 2, 'UniswapV2Library: INVALID_PATH'
+        amounts = [amount_out]
+        for token_in, token_out in reversed(list(zip(path, path[1:]))):
+            amounts.insert(0, uniswap.get_amount_in(amounts[0], *self.reserves(token_in, token_out)))
+        return amounts
+
+    def __swap(self, amounts: Sequence[int], path: Sequence[str], to: str):
+        for i, (token_in, token_out) in enumerate(zip(path, path[1:])):
+            token0, token1 = self.__sorted(token_in, token_out)
+            amount_out = amounts[i + 1]
+            amount0_out, amount1_out = (0, amount_out) if token_in == token0 else (amount_out, 0)
+            recipient = self.pair_for(token_out, path[i + 2]) if i < len(path) - 2 else to
+            self.__pair_swap(self.pair_for(token_in, token_out), token0, token1, amount0_out, amount1_out, recipient)
+
+    def __swap_gas(self, path: Sequence[str]) -> int:
+        return GAS['swap'] + GAS['swap_hop'] * (len(path) - 2)
+
+    def swap_exact_tokens_for_tokens(self, amount_in: int, amount_out_min: int, path: Sequence[str], sender: str, to: Optional[str] = None) -> Sequence[int]:
+        def run():
+            amounts = self.get_amounts_out(amount_in, path)
+            if amounts[-1] < amount_out_min:
+                raise ValueError('UniswapV2Router: INSUFFICIENT_OUTPUT_AMOUNT')
+            self.__transfer_from(path[0], self.__router, sender, self.pair_for(path[0], path[1]), amounts[0])
+            self.__swap(amounts, path, to or sender)
+            return amounts
+        return self.__step('swapExactTokensForTokens', self.__swap_gas(path), run)
+
+    def swap_tokens_for_exact_tokens(self, amount_out: int, amount_in_max: int, path: Sequence[str], sender: str, to: Optional[str] = None) -> Sequence[int]:
+        def run():
+            amounts = self.get_amounts_in(amount_out, path)
+            if amounts[0] > amount_in_max:
+                raise ValueError('UniswapV2Router: EXCESSIVE_INPUT_AMOUNT')
+            self.__transfer_from(path[0], self.__router, sender, self.pair_for(path[0], path[1]), amounts[0])
+            self.__swap(amounts, path, to or sender)
+            return amounts
+        return self.__step('swapTokensForExactTokens', self.__swap_gas(path), run)
+
+    def swap_exact_eth_for_tokens(self, value: int, amount_out_min: int, path: Sequence[str], sender: str, to: Optional[str] = None) -> Sequence[int]:
+        def run():
+            if path[0] != self.__weth:
+                raise ValueError('UniswapV2Router: INVALID_PATH')
+            amounts = self.get_amounts_out(value, path)
+            if amounts[-1] < amount_out_min:
+                raise ValueError('UniswapV2Router: INSUFFICIENT_OUTPUT_AMOUNT')
+            self.__pay_eth(sender, value)
+            self.__mint(self.__weth, self.pair_for(path[0], path[1]), value)
+            self.__swap(amounts, path, to or sender)
+            return amounts
+        return self.__step('swapExactETHForTokens', self.__swap_gas(path) + GAS['swap_eth'], run)
+
+    def __add_liquidity_amounts(self, token_a: str, token_b: str, amount_a_desired: int, amount_b_desired: int, amount_a_min: int, amount_b_min: int) -> Tuple[int, int]:
+        reserve_a, reserve_b = self.reserves(token_a, token_b)
+        if reserve_a == 0 and reserve_b == 0:
+            return amount_a_desired, amount_b_desired
+        amount_b_optimal = uniswap.quote(amount_a_desired, reserve_a, reserve_b)
+        if amount_b_optimal <= amount_b_desired:
+            if amount_b_optimal < amount_b_min:
+                raise ValueError('UniswapV2Router: INSUFFICIENT_B_AMOUNT')
+            return amount_a_desired, amount_b_optimal
+        amount_a_optimal = uniswap.quote(amount_b_desired, reserve_b, reserve_a)
+        assert amount_a_optimal <= amount_a_desired
+        if amount_a_optimal < amount_a_min:
+            raise ValueError('UniswapV2Router: INSUFFICIENT_A_AMOUNT')
+        return amount_a_optimal, amount_b_desired
+
+    def add_liquidity(self,
+                      token_a: str,
+                      token_b: str,
+                      amount_a_desired: int,
+                      amount_b_desired: int,
+                      amount_a_min: int,
+                      amount_b_min: int,
+                      sender: str,
+                      to: Optional[str] = None) -> Tuple[int, int, int]:
+        pair = self.pair_for(token_a, token_b)
+        # A pair created earlier in the simulation has no code on the fork, only supply
+        exists = self.__fork.get(('code', pair)) or self.total_supply(pair) > 0
+        first = self.total_supply(pair) == 0 if exists else True
+        gas = GAS['addLiquidity_first' if first else 'addLiquidity'] + (0 if exists else GAS['createPair'])
+        def run():
+            amount_a, amount_b = self.__add_liquidity_amounts(token_a, token_b, amount_a_desired, amount_b_desired, amount_a_min, amount_b_min)
+            self.__transfer_from(token_a, self.__router, sender, pair, amount_a)
+            self.__transfer_from(token_b, self.__router, sender, pair, amount_b)
+            token0, token1 = self.__sorted(token_a, token_b)
+            liquidity = self.__pair_mint(pair, token0, token1, to or sender)
+            return amount_a, amount_b, liquidity
+        return self.__step('addLiquidity', gas, run)
+
+    def remove_liquidity(self,
+                         token_a: str,
+                         token_b: str,
+                         liquidity: int,
+                         amount_a_min: int,
+                         amount_b_min: int,
+                         sender: str,
+                         to: Optional[str] = None) -> Tuple[int, int]:
+        pair = self.pair_for(token_a, token_b)
+        def run():
+            self.__transfer_from(pair, self.__router, sender, pair, liquidity)
+            token0, token1 = self.__sorted(token_a, token_b)
+            amount0, amount1 = self.__pair_burn(pair, token0, token1, to or sender)
+            amount_a, amount_b = (amount0, amount1) if token_a == token0 else (amount1, amount0)
+            if amount_a < amount_a_min:
+                raise ValueError('UniswapV2Router: INSUFFICIENT_A_AMOUNT')
+            if amount_b < amount_b_min:
+                raise ValueError('UniswapV2Router: INSUFFICIENT_B_AMOUNT')
+            return amount_a, amount_b
+        return self.__step('removeLiquidity', GAS['removeLiquidity'], run)
+
+    def run(self, steps: Iterable[Tuple[str, Mapping[str, Any]]]) -> Sequence[StepResult]:
+        '''Run (method, kwargs) steps in order; a reverting step raises and leaves earlier ones applied'''
+        results = []
+        for method, kwargs in steps:
+            getattr(self, method)(**kwargs)
+            results.append(self.__steps[-1])
+        return results
+
+def _resolve_tx_from(w3: web3.Web3, tx_from: Optional[str], tx: Mapping) -> str:
+    tx_from = tx_from or tx.get('from') or w3.eth.default_account
+    assert web3.main.is_address(tx_from), tx_from
+    return web3.main.to_checksum_address(tx_from)
+
+class SimulatedToken(Token):
+    '''
+    Token whose reads and transact=False calls run on a Simulator instead of the
+    node, so a sequence of calls sees the effects of the ones before it.
+    '''
+    def __init__(self, simulator: Simulator, token: Token):
+        super().__init__(token.contract)
+        self.__simulator = simulator
+
+    def balanceOf(self, address: str, block_identifier: Optional[BlockIdentifier] = None) -> Decimal:
+        assert web3.main.is_address(address), address
+        return self.to_dec(self.__simulator.balance_of(self.address, address))
+
+    def allowance(self, owner: str, spender: str, block_identifier: Optional[BlockIdentifier] = None) -> Decimal:
+        assert web3.main.is_address(owner), owner
+        assert web3.main.is_address(spender), spender
+        return self.to_dec(self.__simulator.allowance(self.address, owner, spender))
+
+    def totalSupply(self, block_identifier: Optional[BlockIdentifier] = None) -> Decimal:
+        return self.to_dec(self.__simulator.total_supply(self.address))
+
+    def __tx_from(self, tx_from: Optional[str], transact: bool, tx: Mapping) -> str:
+        assert not transact, 'simulated tokens do not send transactions'
+        return _resolve_tx_from(self.contract.web3, tx_from, tx)
+
+    def approve(self, spender: str, value: Decimal, tx_from: Optional[str] = None, transact: bool = False, tx: Mapping = {}) -> bool:
+        assert web3.main.is_address(spender), spender
+        return self.__simulator.approve(self.address, self.__tx_from(tx_from, transact, tx), spender, self.to_int(value))
+
+    def decreaseAllowance(self, spender: str, decrement: Decimal, tx_from: Optional[str] = None, transact: bool = False, tx: Mapping = {}) -> bool:
+        assert web3.main.is_address(spender), spender
+        return self.__simulator.decrease_allowance(self.address, self.__tx_from(tx_from, transact, tx), spender, self.to_int(decrement))
+
+    def increaseAllowance(self, spender: str, increment: Decimal, tx_from: Optional[str] = None, transact: bool = False, tx: Mapping = {}) -> bool:
+        assert web3.main.is_address(spender), spender
+        return self.__simulator.increase_allowance(self.address, self.__tx_from(tx_from, transact, tx), spender, self.to_int(increment))
+
+    def transfer(self, to: str, value: Decimal, tx_from: Optional[str] = None, transact: bool = False, tx: Mapping = {}) -> bool:
+        assert web3.main.is_address(to), to
+        return self.__simulator.transfer(self.address, self.__tx_from(tx_from, transact, tx), to, self.to_int(value))
+
+    def transferFrom(self, from_: str, to: str, value: Decimal, tx_from: Optional[str] = None, transact: bool = False, tx: Mapping = {}) -> bool:
+        assert web3.main.is_address(from_), from_
+        assert web3.main.is_address(to), to
+        return self.__simulator.transfer_from(self.address, self.__tx_from(tx_from, transact, tx), from_, to, self.to_int(value))
+
+class SimulatedUniswap(uniswap.Uniswap):
+    '''
+    Uniswap whose quotes and transact=False swaps and liquidity calls run on a
+    Simulator. Takes the same arguments as Uniswap and returns the same values as
+    its eth_call path; deadlines are not checked. Router methods the Simulator
+    does not model raise NotImplementedError rather than read the node.
+    '''
+    def __init__(self, simulator: Simulator, tokens: Optional[Mapping[str, Token]] = {}):
+        super().__init__(simulator.uniswap.factory, simulator.uniswap.router, tokens)
+        self.__simulator = simulator
+        self.__tokens = {}
+
+    @property
+    def simulator(self) -> Simulator:
+        return self.__simulator
+
+    def token(self, token: Token) -> SimulatedToken:
+        '''The SimulatedToken of token, one per address'''
+        if isinstance(token, SimulatedToken):
+            return token
+        simulated = self.__tokens.get(token.address)
+        if simulated is None:
+            simulated = self.__tokens[token.address] = SimulatedToken(self.__simulator, token)
+        return simulated
+
+    def __tx_from_to(self, tx_from: Optional[str], to: Optional[str], transact: bool, tx: Mapping) -> Tuple[str, str]:
+        assert not transact, 'simulated swaps do not send transactions'
+        tx_from = _resolve_tx_from(self.router.web3, tx_from, tx)
+        return tx_from, web3.main.to_checksum_address(to) if to else tx_from
+
+    def __approve(self, amount: Decimal, token: Token, tx_from: str, approve: bool):
+        if not approve:
+            return
+        token = self.token(token)
+        increase = amount - token.allowance(tx_from, self.router.address)
+        if increase > 0:
+            token.increaseAllowance(self.router.address, increase, tx_from=tx_from)
+
+    def getAmountsIn(self, amountOut: Decimal, path: Sequence[Token], block_identifier: Optional[BlockIdentifier] = None) -> Sequence[Decimal]:
+        raw_amounts = self.__simulator.get_amounts_in(path[-1].to_int(amountOut), [token.address for token in path])
+        return tuple(token.to_dec(raw_amount) for token, raw_amount in zip(path, raw_amounts))
+
+    def getAmountsOut(self, amountIn: Decimal, path: Sequence[Token], block_identifier: Optional[BlockIdentifier] = None) -> Sequence[Decimal]:
+        raw_amounts = self.__simulator.get_amounts_out(path[0].to_int(amountIn), [token.address for token in path])
+        return tuple(token.to_dec(raw_amount) for token, raw_amount in zip(path, raw_amounts))
+
+    def swapExactTokensForTokens(self,
+                                 amountIn: Decimal,
+                                 amountOutMin: Decimal,
+                                 path: Sequence[Token],
+                                 to: Optional[str] = None,
+                                 absolute_deadline: Optional[int] = None,
+                                 tx_from: Optional[str] = None,
+                                 relative_deadline: Optional[int] = None,
+                                 approve: bool = False,
+                                 transact: bool = False,
+                                 tx: Mapping = {}) -> Sequence[Decimal]:
+        tx_from, to = self.__tx_from_to(tx_from, to, transact, tx)
+        self.__approve(amountIn, path[0], tx_from, approve)
+        raw_amounts = self.__simulator.swap_exact_tokens_for_tokens(
+            path[0].to_int(amountIn), path[-1].to_int(amountOutMin), [token.address for token in path], tx_from, to)
+        return tuple(token.to_dec(raw_amount) for token, raw_amount in zip(path, raw_amounts))
+
+    def swapTokensForExactTokens(self,
+                                 amountOut: Decimal,
+                                 amountInMax: Decimal,
+                                 path: Sequence[Token],
+                                 to: Optional[str] = None,
+                                 absolute_deadline: Optional[int] = None,
+                                 tx_from: Optional[str] = None,
+                                 relative_deadline: Optional[int] = None,
+                                 approve: bool = False,
+                                 transact: bool = False,
+                                 tx: Mapping = {}) -> Sequence[Decimal]:
+        tx_from, to = self.__tx_from_to(tx_from, to, transact, tx)
+        self.__approve(amountInMax, path[0], tx_from, approve)
+        raw_amounts = self.__simulator.swap_tokens_for_exact_tokens(
+            path[-1].to_int(amountOut), path[0].to_int(amountInMax), [token.address for token in path], tx_from, to)
+        return tuple(token.to_dec(raw_amount) for token, raw_amount in zip(path, raw_amounts))
+
+    def addLiquidity(self,
+                     tokenA: Token,
+                     tokenB: Token,
+                     amountADesired: Decimal,
+                     amountBDesired: Decimal,
+                     amountAMin: Decimal,
+                     amountBMin: Decimal,
+                     to: Optional[str] = None,
+                     absolute_deadline: Optional[int] = None,
+                     tx_from: Optional[str] = None,
+                     relative_deadline: Optional[int] = None,
+                     approve: bool = False,
+                     transact: bool = False,
+                     tx: Mapping = {}) -> Tuple[Decimal, Decimal, Decimal]:
+        tx_from, to = self.__tx_from_to(tx_from, to, transact, tx)
+        self.__approve(amountADesired, tokenA, tx_from, approve)
+        self.__approve(amountBDesired, tokenB, tx_from, approve)
+        raw_amountA, raw_amountB, raw_liquidity = self.__simulator.add_liquidity(
+            tokenA.address, tokenB.address,
+            tokenA.to_int(amountADesired), tokenB.to_int(amountBDesired),
+            tokenA.to_int(amountAMin), tokenB.to_int(amountBMin),
+            tx_from, to)
+        return tokenA.to_dec(raw_amountA), tokenB.to_dec(raw_amountB), Decimal(raw_liquidity) * LP_QUANTUM
+
+    def removeLiquidity(self,
+                        tokenA: Token,
+                        tokenB: Token,
+                        liquidity: Decimal,
+                        amountAMin: Decimal,
+                        amountBMin: Decimal,
+                        to: Optional[str] = None,
+                        absolute_deadline: Optional[int] = None,
+                        tx_from: Optional[str] = None,
+                        relative_deadline: Optional[int] = None,
+                        approve: bool = False,
+                        transact: bool = False,
+                        tx: Mapping = {}) -> Tuple[Decimal, Decimal]:
+        tx_from, to = self.__tx_from_to(tx_from, to, transact, tx)
+        pair = self.__simulator.pair_for(tokenA.address, tokenB.address)
+        if approve:
+            increase = int(liquidity / LP_QUANTUM) - self.__simulator.allowance(pair, tx_from, self.router.address)
+            if increase > 0:
+                self.__simulator.increase_allowance(pair, tx_from, self.router.address, increase)
+        raw_amountA, raw_amountB = self.__simulator.remove_liquidity(
+            tokenA.address, tokenB.address, int(liquidity / LP_QUANTUM),
+            tokenA.to_int(amountAMin), tokenB.to_int(amountBMin),
+            tx_from, to)
+        return tokenA.to_dec(raw_amountA), tokenB.to_dec(raw_amountB)
+
+def _not_simulated(name: str) -> Callable:
+    def method(self, *args, **kwargs):
+        raise NotImplementedError(f'{name} is not simulated')
+    method.__name__ = name
+    return method
+
+for _name in (
+    'createPair', 'getOrCreatePair',
+    'swapETHForExactTokens', 'swapExactETHForTokens', 'swapExactETHForTokensSupportingFeeOnTransferTokens',
+    'swapExactTokensForETH', 'swapTokensForExactETH',
+    'swapExactTokensForETHSupportingFeeOnTransferTokens', 'swapExactTokensForTokensSupportingFeeOnTransferTokens',
+    'addLiquidityETH', 'removeLiquidityETH', 'removeLiquidityETHSupportingFeeOnTransferTokens',
+    'removeLiquidityWithPermit', 'removeLiquidityETHWithPermit', 'removeLiquidityETHWithPermitSupportingFeeOnTransferTokens',
+):
+    setattr(SimulatedUniswap, _name, _not_simulated(_name))
+del _name
@@ -5,13 +5,13 @@ from decimal import Decimal
 from pathlib import Path
 from typing import Mapping, Optional
 import web3
+from . import cache
+from .block import BlockIdentifier, current_block_identifier
 
 class Token:
     def __init__(self, contract: web3.contract.Contract):
+        cache.install(contract.web3)
         self.__contract = contract
-        self.__symbol = None
-        self.__name = None
-        self.__decimals = None
         self.__multiplier = None
         self.__quantum = None
 
@@ -35,25 +35,21 @@ class Token:
 
     @property
     def symbol(self) -> str:
-        if self.__symbol is None:
-            self.__symbol = self.__contract.functions.symbol().call()
-            if isinstance(self.__symbol, bytes):
-                self.__symbol = self.__symbol.rstrip(b'\0').decode()
-        return self.__symbol
+        symbol = self.__contract.functions.symbol().call()
+        if isinstance(symbol, bytes):
+            symbol = symbol.rstrip(b'\0').decode()
+        return symbol
 
     @property
     def name(self) -> str:
-        if self.__name is None:
-            self.__name = self.__contract.functions.name().call()
-            if isinstance(self.__name, bytes):
-                self.__name = self.__name.rstrip(b'\0').decode()
-        return self.__name
+        name = self.__contract.functions.name().call()
+        if isinstance(name, bytes):
+            name = name.rstrip(b'\0').decode()
+        return name
 
     @property
     def decimals(self) -> str:
-        if self.__decimals is None:
-            self.__decimals = self.__contract.functions.decimals().call()
-        return self.__decimals
+        return self.__contract.functions.decimals().call()
 
     @property
     def multiplier(self) -> Decimal:
@@ -67,22 +63,22 @@ class Token:
             self.__quantum = Decimal((0, (1,), -self.decimals))
         return self.__quantum
 
-    def balanceOf(self, address: str) -> Decimal:
+    def balanceOf(self, address: str, block_identifier: Optional[BlockIdentifier] = None) -> Decimal:
         assert web3.main.is_address(address), address
         function = self.__contract.functions.balanceOf(address)
-        balance = function.call()
+        balance = function.call(block_identifier=current_block_identifier(block_identifier))
         return self.to_dec(balance)
 
-    def allowance(self, owner: str, spender: str) -> Decimal:
+    def allowance(self, owner: str, spender: str, block_identifier: Optional[BlockIdentifier] = None) -> Decimal:
         assert web3.main.is_address(owner), owner
         assert web3.main.is_address(spender), spender
         function = self.__contract.functions.allowance(owner, spender)
-        allowance = function.call()
+        allowance = function.call(block_identifier=current_block_identifier(block_identifier))
         return self.to_dec(allowance)
 
-    def totalSupply(self) -> Decimal:
+    def totalSupply(self, block_identifier: Optional[BlockIdentifier] = None) -> Decimal:
         function = self.__contract.functions.totalSupply()
-        supply = function.call()
+        supply = function.call(block_identifier=current_block_identifier(block_identifier))
         return self.to_dec(supply)
 
     def approve(self, spender: str, value: Decimal, tx_from: Optional[str] = None, transact: bool = False, tx: Mapping = {}) -> bool:
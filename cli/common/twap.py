@@ -0,0 +1,156 @@
+# SPDX-License-Identifier: UNLICENSED
+from typing import Iterable, Mapping, NamedTuple, Optional, Sequence, Tuple
+import web3
+from . import rpc
+from .block import BlockContext, BlockIdentifier, current_block_identifier
+from .uniswap import UniswapToken
+
+Q112 = 1 << 112
+_UINT32 = 1 << 32
+_UINT256 = 1 << 256
+POW_10_18 = 10**18
+
+class Observation(NamedTuple):
+    timestamp: int
+    price0_cumulative: int
+    price1_cumulative: int
+
+def encode_price(numerator: int, denominator: int) -> int:
+    '''UQ112x112 price as stored by the pair'''
+    return numerator * Q112 // denominator
+
+def current_cumulative_prices(price0_cumulative: int,
+                              price1_cumulative: int,
+                              reserve0: int,
+                              reserve1: int,
+                              block_timestamp_last: int,
+                              block_timestamp: int) -> Observation:
+    '''
+    UniswapV2OracleLibrary.currentCumulativePrices: the accumulators as they would be
+    at block_timestamp, had the pair been synced in that block.
+    '''
+    time_elapsed = (block_timestamp - block_timestamp_last) % _UINT32
+    if time_elapsed and reserve0 and reserve1:
+        price0_cumulative = (price0_cumulative + encode_price(reserve1, reserve0) * time_elapsed) % _UINT256
+        price1_cumulative = (price1_cumulative + encode_price(reserve0, reserve1) * time_elapsed) % _UINT256
+    return Observation(block_timestamp, price0_cumulative, price1_cumulative)
+
+def average_prices(first: Observation, last: Observation) -> Tuple[int, int]:
+    '''UQ112x112 average price0 and price1 between two observations'''
+    time_elapsed = last.timestamp - first.timestamp
+    assert time_elapsed > 0, time_elapsed
+    # Accumulators are meant to overflow, differences stay correct modulo 2**256
+    price0 = ((last.price0_cumulative - first.price0_cumulative) % _UINT256) // time_elapsed
+    price1 = ((last.price1_cumulative - first.price1_cumulative) % _UINT256) // time_elapsed
+    return price0, price1
+
+class SlidingWindowOracle:
+    '''
+    Observations of one pair in a ring of `granularity` buckets spanning window_size
+    seconds, as in Uniswap's ExampleSlidingWindowOracle. Each bucket keeps its first
+    observation, so a query reads exactly two slots.
+    '''
+    def __init__(self, window_size: int, granularity: int):
+        assert granularity > 1, granularity
+        assert window_size % granularity == 0, 'window_size must be a multiple of granularity'
+        self.__window_size = window_size
+        self.__granularity = granularity
+        self.__period_size = window_size // granularity
+        self.__observations: Sequence[Optional[Observation]] = [None] * granularity
+        self.__latest: Optional[Observation] = None
+
+    @property
+    def window_size(self) -> int:
+        return self.__window_size
+
+    @property
+    def latest(self) -> Optional[Observation]:
+        return self.__latest
+
+    def __index(self, timestamp: int) -> int:
+        return (timestamp // self.__period_size) % self.__granularity
+
+    def update(self, observation: Observation):
+        index = self.__index(observation.timestamp)
+        current = self.__observations[index]
+        if current is None or observation.timestamp - current.timestamp > self.__period_size:
+            self.__observations[index] = observation
+        if self.__latest is None or observation.timestamp > self.__latest.timestamp:
+            self.__latest = observation
+
+    def first_in_window(self, timestamp: int) -> Optional[Observation]:
+        # The bucket after the current one is the oldest in the window
+        observation = self.__observations[(self.__index(timestamp) + 1) % self.__granularity]
+        if observation is None or timestamp - observation.timestamp > self.__window_size:
+            return None
+        return observation
+
+    def consult(self, timestamp: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        '''UQ112x112 TWAP of price0 and price1 over the window ending at the latest observation'''
+        latest = self.__latest
+        if latest is None:
+            return None
+        first = self.first_in_window(latest.timestamp if timestamp is None else timestamp)
+        if first is None or first.timestamp >= latest.timestamp:
+            return None
+        return average_prices(first, latest)
+
+class TWAPService:
+    '''
+    Time weighted prices for a set of pairs, kept in memory.
+
+    update() reads price0CumulativeLast, price1CumulativeLast and getReserves of every
+    tracked pair plus the block timestamp in one batch; queries never touch the node.
+    '''
+    def __init__(self, pairs: Iterable[UniswapToken], window_size: int = 3600, granularity: int = 12):
+        self.__pairs = dict((pair.address, pair) for pair in pairs)
+        self.__oracles = dict(
+            (address, SlidingWindowOracle(window_size, granularity))
+            for address in self.__pairs
+        )
+
+    @property
+    def pairs(self) -> Mapping[str, UniswapToken]:
+        return self.__pairs
+
+    def oracle(self, pair: str) -> SlidingWindowOracle:
+        return self.__oracles[pair]
+
+    def update(self, block_identifier: Optional[BlockIdentifier] = None) -> Optional[int]:
+        if not self.__pairs:
+            return None
+        pairs = list(self.__pairs.values())
+        w3 = pairs[0].contract.web3
+        with BlockContext(w3, current_block_identifier(block_identifier)) as block_number:
+            functions = [
+                function
+                for pair in pairs
+                for function in (
+                    pair.contract.functions.price0CumulativeLast(),
+                    pair.contract.functions.price1CumulativeLast(),
+                    pair.contract.functions.getReserves(),
+                )
+            ]
+            results = rpc.batch_call(w3, functions)
+            block_timestamp = int(rpc.batch_request(w3, [('eth_getBlockByNumber', (hex(block_number), False))])[0]['timestamp'], 16)
+        for i, pair in enumerate(pairs):
+            price0_cumulative, price1_cumulative, (reserve0, reserve1, block_timestamp_last) = results[3*i:3*i+3]
+            self.__oracles[pair.address].update(current_cumulative_prices(
+                price0_cumulative, price1_cumulative,
+                reserve0, reserve1,
+                block_timestamp_last, block_timestamp,
+            ))
+        return block_number
+
+    def consult(self, pair: str) -> Optional[Tuple[int, int]]:
+        return self.__oracles[pair].consult()
+
+    def price(self, pair: str, base: str) -> Optional[int]:
+        '''TWAP of one `base` token in the other token of the pair, in raw units scaled by 1e18'''
+        prices = self.consult(pair)
+        if prices is None:
+            return None
+        base = web3.main.to_checksum_address(base)
+        token0 = self.__pairs[pair].token0.address
+        price = prices[0] if base == token0 else prices[1]
+        return price * POW_10_18 // Q112
@@ -8,6 +8,8 @@ from decimal import Decimal
 from pathlib import Path
 from typing import Any, Mapping, Optional, Sequence, Tuple
 import web3
+from . import cache
+from .block import BlockIdentifier, current_block_identifier
 from .token import Token
 
 _ABI = dict(
@@ -45,6 +47,44 @@ Wg==
 _ABI_IUniswapV2Pair = _ABI['IUniswapV2Pair']
 _ABI_IERC20 = _ABI['IERC20']
 
+PAIR_INIT_CODE_HASH = '0x96e8ac4277198ff8b6f785478aa9a39f403cb768dd02cbee326c3e7da348845f'
+
+def calc_pair_address(factory: str, address0: str, address1: str) -> str:
+    data0 = web3.main.to_bytes(hexstr=address0)
+    data1 = web3.main.to_bytes(hexstr=address1)
+    if data1 < data0:
+        data0, data1 = data1, data0
+    data = (
+        b'\xff' +
+        web3.main.to_bytes(hexstr=factory) +
+        web3.main.eth_utils_keccak(data0 + data1) +
+        web3.main.to_bytes(hexstr=PAIR_INIT_CODE_HASH)
+    )
+    data = web3.main.eth_utils_keccak(data)
+    data = web3.main.to_hex(data[12:])
+    data = web3.main.to_checksum_address(data)
+    return data
+
+# Local equivalents of the UniswapV2Library pure functions, on raw integer amounts
+
+def quote(amount_a: int, reserve_a: int, reserve_b: int) -> int:
+    assert amount_a > 0, amount_a
+    assert reserve_a > 0 and reserve_b > 0, (reserve_a, reserve_b)
+    return amount_a * reserve_b // reserve_a
+
+def get_amount_out(amount_in: int, reserve_in: int, reserve_out: int) -> int:
+    assert amount_in > 0, amount_in
+    assert reserve_in > 0 and reserve_out > 0, (reserve_in, reserve_out)
+    amount_in_with_fee = amount_in * 997
+    return amount_in_with_fee * reserve_out // (reserve_in * 1000 + amount_in_with_fee)
+
+def get_amount_in(amount_out: int, reserve_in: int, reserve_out: int) -> int:
+    assert amount_out > 0, amount_out
+    assert reserve_in > 0 and reserve_out > 0, (reserve_in, reserve_out)
+    if amount_out >= reserve_out:
+        raise ValueError('UniswapV2Library: INSUFFICIENT_LIQUIDITY')
+    return reserve_in * amount_out * 1000 // ((reserve_out - amount_out) * 997) + 1
+
 class UniswapToken(Token):
     def __init__(self, contract: web3.contract.Contract, tokens: Optional[Mapping[str, Token]] = None):
         super().__init__(contract)
@@ -52,43 +92,53 @@ class UniswapToken(Token):
         self.__token1 = None
         self.__tokens = tokens
 
+    def __token(self, address: str) -> Token:
+        if self.__tokens:
+            return self.__tokens[address]
+        return Token(self.contract.web3.eth.contract(address=address, abi=_ABI_IERC20))
+
+    # A pair's tokens never change, so each is looked up and built once per pair
     @property
     def token0(self) -> Token:
         if self.__token0 is None:
-            address = self.contract.functions.token0().call()
-            if self.__tokens:
-                self.__token0 = self.__tokens[address]
-            else:
-                self.__token0 = Token(self.contract.web3.eth.contract(address=address, abi=_ABI_IERC20))
+            self.__token0 = self.__token(self.contract.functions.token0().call())
         return self.__token0
 
     @property
     def token1(self) -> Token:
         if self.__token1 is None:
-            address = self.contract.functions.token1().call()
-            if self.__tokens:
-                self.__token1 = self.__tokens[address]
-            else:
-                self.__token1 = Token(self.contract.web3.eth.contract(address=address, abi=_ABI_IERC20))
+            self.__token1 = self.__token(self.contract.functions.token1().call())
         return self.__token1
 
-    def getReserves(self) -> Tuple[Decimal, Decimal, Decimal]:
-        raw_amount0, raw_amount1, raw_liquidity = self.contract.functions.getReserves().call()
+    def getReserves(self, block_identifier: Optional[BlockIdentifier] = None) -> Tuple[Decimal, Decimal, int]:
+        function = self.contract.functions.getReserves()
+        raw_amount0, raw_amount1, block_timestamp_last = function.call(block_identifier=current_block_identifier(block_identifier))
         amount0 = self.token0.to_dec(raw_amount0)
         amount1 = self.token1.to_dec(raw_amount1)
-        liquidity = self.to_dec(raw_liquidity)
-        return amount0, amount1, liquidity
+        return amount0, amount1, block_timestamp_last
+
+    def kLast(self, block_identifier: Optional[BlockIdentifier] = None) -> int:
+        return self.contract.functions.kLast().call(block_identifier=current_block_identifier(block_identifier))
+
+    def price0CumulativeLast(self, block_identifier: Optional[BlockIdentifier] = None) -> int:
+        '''UQ112x112 accumulator of token1 per token0, as of blockTimestampLast'''
+        return self.contract.functions.price0CumulativeLast().call(block_identifier=current_block_identifier(block_identifier))
+
+    def price1CumulativeLast(self, block_identifier: Optional[BlockIdentifier] = None) -> int:
+        '''UQ112x112 accumulator of token0 per token1, as of blockTimestampLast'''
+        return self.contract.functions.price1CumulativeLast().call(block_identifier=current_block_identifier(block_identifier))
 
 class Uniswap:
     def __init__(self,
                  factory: Optional[web3.contract.Contract],
                  router: Optional[web3.contract.Contract],
                  tokens: Optional[Mapping[str, Token]] = {}):
+        for contract in (factory, router):
+            if contract is not None:
+                cache.install(contract.web3)
         self.__factory = factory
         self.__router = router
         self.__tokens = tokens
-        self.__weth = None
-        self.__factory_checked = False
         self.__uniswap_token_cache = {}
 
     def to_int(self, amount: Decimal) -> int:
@@ -104,34 +154,17 @@ class Uniswap:
 
     @property
     def factory(self) -> web3.contract.Contract:
-        if not self.__factory_checked:
-            factory_address = self.__router.functions.factory().call()
-            if factory_address != self.__factory.address:
-                raise ValueError('router/factory mismatch')
-            self.__factory_checked = True
+        factory_address = self.__router.functions.factory().call()
+        if factory_address != self.__factory.address:
+            raise ValueError('router/factory mismatch')
         return self.__factory
 
     @property
     def weth(self) -> str:
-        if self.__weth is None:
-            self.__weth = self.WETH()
-        return self.__weth
+        return self.WETH()
 
     def calcPairAddress(self, address0: str, address1: str) -> str:
-        data0 = web3.main.to_bytes(hexstr=address0)
-        data1 = web3.main.to_bytes(hexstr=address1)
-        if data1 < data0:
-            data0, data1 = data1, data0
-        data = (
-            b'\xff' +
-            web3.main.to_bytes(hexstr=self.factory.address) +
-            web3.main.eth_utils_keccak(data0 + data1) +
-            web3.main.to_bytes(hexstr='0x96e8ac4277198ff8b6f785478aa9a39f403cb768dd02cbee326c3e7da348845f')
-        )
-        data = web3.main.eth_utils_keccak(data)
-        data = web3.main.to_hex(data[12:])
-        data = web3.main.to_checksum_address(data)
-        return data
+        return calc_pair_address(self.factory.address, address0, address1)
 
 #    def getPair(self, tokenA: Token, tokenB: Token) -> web3.contract.Contract:
     def getPairUnchecked(self, tokenA: Token, tokenB: Token) -> UniswapToken:
@@ -143,8 +176,9 @@ class Uniswap:
             token = self.__uniswap_token_cache[address] = UniswapToken(contract, self.__tokens)
         return token
 
-    def getPair(self, tokenA: Token, tokenB: Token) -> Optional[UniswapToken]:
-        address = self.factory.functions.getPair(tokenA.address, tokenB.address).call()
+    def getPair(self, tokenA: Token, tokenB: Token, block_identifier: Optional[BlockIdentifier] = None) -> Optional[UniswapToken]:
+        function = self.factory.functions.getPair(tokenA.address, tokenB.address)
+        address = function.call(block_identifier=current_block_identifier(block_identifier))
         if any(web3.main.to_bytes(hexstr=address)):
             token = self.__uniswap_token_cache.get(address)
             if token is None:
@@ -191,46 +225,47 @@ class Uniswap:
               tokenB: Token,
               amountA: Decimal,
               reserveA: Decimal,
-              reserveB: Decimal) -> Decimal:
+              reserveB: Decimal,
+              block_identifier: Optional[BlockIdentifier] = None) -> Decimal:
         raw_amountA = tokenA.to_int(amountA)
         raw_reserveA = tokenA.to_int(reserveA)
         raw_reserveB = tokenB.to_int(reserveB)
         function = self.__router.functions.quote(raw_amountA, raw_reserveA, raw_reserveB)
-        raw_amountB = function.call()
+        raw_amountB = function.call(block_identifier=current_block_identifier(block_identifier))
         amountB = tokenB.to_dec(raw_amountB)
         return amountB
 
-    def getAmountIn(self, amountOut: Decimal, reserveIn: Decimal, reserveOut: Decimal, tokenIn: Token, tokenOut: Token) -> Decimal:
+    def getAmountIn(self, amountOut: Decimal, reserveIn: Decimal, reserveOut: Decimal, tokenIn: Token, tokenOut: Token, block_identifier: Optional[BlockIdentifier] = None) -> Decimal:
         raw_amountOut = tokenOut.to_int(amountOut)
         raw_reserveIn = tokenIn.to_int(reserveIn)
         raw_reserveOut = tokenOut.to_int(reserveOut)
         function = self.__router.functions.getAmountIn(raw_amountOut, raw_reserveIn, raw_reserveOut)
-        raw_amountIn = function.call()
+        raw_amountIn = function.call(block_identifier=current_block_identifier(block_identifier))
         amountIn = tokenIn.to_dec(raw_amountIn)
         return amountIn
 
-    def getAmountOut(self, amountIn: Decimal, reserveIn: Decimal, reserveOut: Decimal, tokenIn: Token, tokenOut: Token) -> Decimal:
+    def getAmountOut(self, amountIn: Decimal, reserveIn: Decimal, reserveOut: Decimal, tokenIn: Token, tokenOut: Token, block_identifier: Optional[BlockIdentifier] = None) -> Decimal:
         raw_amountIn = tokenIn.to_int(amountIn)
         raw_reserveIn = tokenIn.to_int(reserveIn)
         raw_reserveOut = tokenOut.to_int(reserveOut)
         function = self.__router.functions.getAmountOut(raw_amountIn, raw_reserveIn, raw_reserveOut)
-        raw_amountOut = function.call()
+        raw_amountOut = function.call(block_identifier=current_block_identifier(block_identifier))
         amountOut = tokenOut.to_dec(raw_amountOut)
         return amountOut
 
-    def getAmountsIn(self, amountOut: Decimal, path: Sequence[Token]) -> Sequence[Decimal]:
+    def getAmountsIn(self, amountOut: Decimal, path: Sequence[Token], block_identifier: Optional[BlockIdentifier] = None) -> Sequence[Decimal]:
         raw_amountOut = path[-1].to_int(amountOut)
         raw_path = [token.address for token in path]
         function = self.__router.functions.getAmountsIn(raw_amountOut, raw_path)
-        raw_amounts = function.call()
+        raw_amounts = function.call(block_identifier=current_block_identifier(block_identifier))
         amounts = tuple(token.to_dec(raw_amount) for token, raw_amount in zip(path, raw_amounts))
         return amounts
 
-    def getAmountsOut(self, amountIn: Decimal, path: Sequence[Token]) -> Sequence[Decimal]:
+    def getAmountsOut(self, amountIn: Decimal, path: Sequence[Token], block_identifier: Optional[BlockIdentifier] = None) -> Sequence[Decimal]:
         raw_amountIn = path[0].to_int(amountIn)
         raw_path = [token.address for token in path]
         function = self.__router.functions.getAmountsOut(raw_amountIn, raw_path)
-        raw_amounts = function.call()
+        raw_amounts = function.call(block_identifier=current_block_identifier(block_identifier))
         amounts = tuple(token.to_dec(raw_amount) for token, raw_amount in zip(path, raw_amounts))
         return amounts
 
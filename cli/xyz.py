@@ -2,6 +2,7 @@
 import common
 import sys
 import json
+import argparse
 import web3
 from decimal import Decimal
 from pprint import pprint
@@ -24,6 +25,9 @@ def xlate_attr_dict(x: Any) -> Mapping:
     return x
 
 def dump_tx_receipt(x):
+    if OUTPUT is not None:
+        OUTPUT.receipt(x)
+        return
     try:
         y = xlate_attr_dict(x)
         del y['blockHash']
@@ -41,17 +45,57 @@ def dump_tx_receipt(x):
         raise
 
 def dump_account_balances(accounts, tokens):
-    for account in accounts:
-        for token in tokens:
-            if token is None:
-                symbol = 'ETH'
-                decimals = 18
-                balance = WETH.to_dec(w3.eth.get_balance(account))
-            else:
-                symbol = token.symbol
-                decimals = token.decimals
-                balance = token.balanceOf(account)
-            print('%s %-28s [%02d] %32s' % (account, symbol, decimals, balance,))
+    with common.block.BlockContext(w3) as block_number:
+        for account in accounts:
+            for token in tokens:
+                if token is None:
+                    symbol = 'ETH'
+                    decimals = 18
+                    balance = WETH.to_dec(w3.eth.get_balance(account, block_number))
+                else:
+                    symbol = token.symbol
+                    decimals = token.decimals
+                    balance = token.balanceOf(account)
+                if OUTPUT is not None:
+                    OUTPUT.balance(account, symbol, decimals, balance, token=token and token.address)
+                else:
+                    print('%s %-28s [%02d] %32s' % (account, symbol, decimals, balance,))
+
+def dump_reserves(account, pair):
+    with common.block.BlockContext(w3):
+        reserve0, reserve1, timestamp = pair.getReserves()
+        liquidity = pair.balanceOf(account)
+        total_supply = pair.totalSupply()
+    share = liquidity / total_supply if total_supply else Decimal(0)
+    amount0 = (reserve0 * share).quantize(pair.token0.quantum)
+    amount1 = (reserve1 * share).quantize(pair.token1.quantum)
+    if OUTPUT is not None:
+        OUTPUT.reserves(pair.address, pair.token0.symbol, pair.token1.symbol, reserve0, reserve1, account=account, block_timestamp_last=timestamp)
+        OUTPUT.lp_position(pair.address, account, pair.token0.symbol, pair.token1.symbol, liquidity, share, amount0, amount1)
+        return
+    print('%s %-8s %-28s [%02d] %32s' % (account, pair.symbol, pair.token0.symbol, pair.token0.decimals, reserve0,))
+    print('%s %-8s %-28s [%02d] %32s' % (account, pair.symbol, pair.token1.symbol, pair.token1.decimals, reserve1,))
+    print('%s %-8s %-28s      %32s' % (account, pair.symbol, 'blockTimestampLast', timestamp,))
+    print('%s %-8s %-28s [%02d] %32s' % (account, pair.symbol, 'liquidity', pair.decimals, liquidity,))
+    print('%s %-8s %-28s [%02d] %32s' % (account, pair.symbol, pair.token0.symbol, pair.token0.decimals, amount0,))
+    print('%s %-8s %-28s [%02d] %32s' % (account, pair.symbol, pair.token1.symbol, pair.token1.decimals, amount1,))
+    print()
+
+def dump_block():
+    if OUTPUT is not None:
+        OUTPUT.block(w3.eth.block_number)
+    else:
+        print(f'Ethereum block: {w3.eth.block_number}')
+
+def dump_separator():
+    if OUTPUT is None:
+        print()
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--ndjson', action='store_true', help='write newline-delimited JSON records instead of text')
+parser.add_argument('--ndjson-logs', action='store_true', help='include receipt logs in NDJSON records')
+ARGS = parser.parse_args()
+OUTPUT = common.ndjson.NDJSONWriter(sys.stdout, include_logs=ARGS.ndjson_logs) if ARGS.ndjson else None
 
 w3 = web3.Web3(web3.HTTPProvider())
 
@@ -71,24 +115,23 @@ WETH = TOKENS[CONTRACTS['token-weth'].address]
 USDC = TOKENS[CONTRACTS['token-usdc'].address]
 CUSDC = TOKENS[CONTRACTS['compound-cusdc'].address]
 FUT = common.abi.load_deployed_FutureToken(w3)
+FUTURES = common.futures.FutureTokenRegistry(FUT)
 
 A = w3.eth.accounts[1]
 
-print(f'Ethereum block: {w3.eth.block_number}')
-print()
+dump_block()
+dump_separator()
 
 if 1:
-    EXPIRY = FUT.functions.calcNextExpiryAfter(512).call()
-    cls = FUT.functions.getExpiryClassLongShort(CUSDC.address, EXPIRY).call()
-    cls_check = tuple(any(web3.main.to_bytes(hexstr=text)) for text in cls)
-    if not any(cls_check):
+    EXPIRY = common.futures.calc_expiry_block(w3.eth.block_number + 512)
+    series = FUTURES.find(CUSDC.address, EXPIRY)
+    if series is None:
         tx_hash = FUT.functions.getOrCreateExpiryClassLongShort(CUSDC.address, EXPIRY).transact({'from': A})
         receipt = w3.eth.get_transaction_receipt(tx_hash)
         dump_tx_receipt(receipt)
-        cls = FUT.functions.getExpiryClassLongShort(CUSDC.address, EXPIRY).call()
-        cls_check = tuple(any(web3.main.to_bytes(hexstr=text)) for text in cls)
-    assert all(cls_check)
-    FUT_C, FUT_L, FUT_S = (w3.eth.contract(address=address, abi=FUT.abi) for address in cls)
+        series = FUTURES.find(CUSDC.address, EXPIRY, refresh=True)
+    assert series is not None
+    FUT_C, FUT_L, FUT_S = (w3.eth.contract(address=address, abi=FUT.abi) for address in (series.fut_class, series.fut_long, series.fut_short))
     if FUT_L.address in TOKENS:
         FUTL = TOKENS[FUT_L.address]
     else:
@@ -103,14 +146,14 @@ if 1:
     FUTS_CUSDC = UNISWAP.getOrCreatePair(FUTS, CUSDC, tx_from=A, transact=True)
     FUTL_FUTS = UNISWAP.getOrCreatePair(FUTL, FUTS, tx_from=A, transact=True)
     dump_account_balances((A,), (None, WETH, USDC, CUSDC, FUTL, FUTS, FUTL_CUSDC, FUTS_CUSDC, FUTL_FUTS))
-    print()
+    dump_separator()
 
     balance = CUSDC.balanceOf(A)
     if balance < 10_000:
         receipt = UNISWAP.swapETHForExactTokens(10_000 - balance, Decimal('0.25'), [WETH, CUSDC], tx_from=A, relative_deadline=RELATIVE_DEADLINE, transact=True)
         dump_tx_receipt(receipt)
     dump_account_balances((A,), (None, WETH, USDC, CUSDC, FUTL, FUTS, FUTL_CUSDC, FUTS_CUSDC, FUTL_FUTS))
-    print()
+    dump_separator()
 
     balance = min(FUTL.balanceOf(A), FUTS.balanceOf(A))
     if balance < 100_000:
@@ -120,7 +163,7 @@ if 1:
         receipt = w3.eth.get_transaction_receipt(tx_hash)
         dump_tx_receipt(receipt)
     dump_account_balances((A,), (None, WETH, USDC, CUSDC, FUTL, FUTS, FUTL_CUSDC, FUTS_CUSDC, FUTL_FUTS))
-    print()
+    dump_separator()
 
     balance = FUTL_FUTS.balanceOf(A)
     if balance <= 0:
@@ -129,7 +172,7 @@ if 1:
         receipt = UNISWAP.addLiquidity(FUTL, FUTS, amount, amount, amount, amount, tx_from=A, relative_deadline=RELATIVE_DEADLINE, approve=True, transact=True)
         dump_tx_receipt(receipt)
     dump_account_balances((A,), (None, WETH, USDC, CUSDC, FUTL, FUTS, FUTL_CUSDC, FUTS_CUSDC, FUTL_FUTS))
-    print()
+    dump_separator()
 
     balance = FUTL_CUSDC.balanceOf(A)
     if balance <= 0:
@@ -138,7 +181,7 @@ if 1:
         receipt = UNISWAP.addLiquidity(FUTL, CUSDC, amount, amount_cusdc, amount, amount_cusdc, tx_from=A, relative_deadline=RELATIVE_DEADLINE, approve=True, transact=True)
         dump_tx_receipt(receipt)
     dump_account_balances((A,), (None, WETH, USDC, CUSDC, FUTL, FUTS, FUTL_CUSDC, FUTS_CUSDC, FUTL_FUTS))
-    print()
+    dump_separator()
 
     balance = FUTS_CUSDC.balanceOf(A)
     if balance <= 0:
@@ -147,13 +190,11 @@ if 1:
         receipt = UNISWAP.addLiquidity(FUTS, CUSDC, amount, amount_cusdc, amount, amount_cusdc, tx_from=A, relative_deadline=RELATIVE_DEADLINE, approve=True, transact=True)
         dump_tx_receipt(receipt)
     dump_account_balances((A,), (None, WETH, USDC, CUSDC, FUTL, FUTS, FUTL_CUSDC, FUTS_CUSDC, FUTL_FUTS))
-    print()
+    dump_separator()
 
     for pair in (FUTL_FUTS, FUTL_CUSDC, FUTS_CUSDC):
-        balance0, balance1, liquidity = pair.getReserves()
-        print('%s %-8s %-28s [%02d] %32s' % (A, pair.symbol, pair.token0.symbol, pair.token0.decimals, balance0,))
-        print('%s %-8s %-28s [%02d] %32s' % (A, pair.symbol, pair.token1.symbol, pair.token1.decimals, balance1,))
-        print('%s %-8s %-28s [%02d] %32s' % (A, pair.symbol, '', pair.decimals, liquidity,))
-        print()
+        dump_reserves(A, pair)
 
-print(f'Ethereum block: {w3.eth.block_number}')
+dump_block()
+if OUTPUT is not None:
+    OUTPUT.flush()
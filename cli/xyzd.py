@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# SPDX-License-Identifier: UNLICENSED
+'''
+Long running CLI daemon which keeps the web3 connection, contracts, token
+metadata, pairs and reserves warm between requests.
+
+    xyzd.py [--socket PATH] serve [--provider URI] [--allow-from ADDRESS ...]
+    xyzd.py [--socket PATH] call COMMAND [JSON-ARGS]
+
+Requests and responses are newline-delimited JSON over a local Unix socket:
+{"id": 1, "command": "balances", "args": {"accounts": ["0x..."], "tokens": ["USDC"]}}
+
+The socket lives in $XDG_RUNTIME_DIR when set and is only accessible to its
+owner. Transactions may only be sent from the --allow-from accounts, by default
+the node's first account.
+'''
+import common
+import io
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+import threading
+import socketserver
+import web3
+from decimal import Decimal
+from typing import Any, Callable, Mapping, Optional, Sequence
+
+RELATIVE_DEADLINE = 300
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), 'xyzd.sock')
+
+class WarmState:
+    def __init__(self, provider_uri: Optional[str] = None, allow_from: Sequence[str] = ()):
+        self.w3 = web3.Web3(web3.HTTPProvider(provider_uri))
+        self.allow_from = frozenset(
+            web3.main.to_checksum_address(account)
+            for account in (allow_from or self.w3.eth.accounts[:1])
+        )
+        self.contracts = common.abi.load_contracts(self.w3)
+        self.tokens = dict(
+            (contract.address, common.token.Token(contract))
+            for name, contract in self.contracts.items()
+            if name.startswith('token-') or (
+                name.startswith('compound-') and name != 'compound-comptroller'
+            ))
+        self.uniswap = common.uniswap.Uniswap(
+            router=self.contracts['uniswap-v2-router'],
+            factory=self.contracts['uniswap-v2-factory'],
+            tokens=self.tokens,
+        )
+        self.weth = self.tokens[self.contracts['token-weth'].address]
+        self.fut = common.abi.load_deployed_FutureToken(self.w3)
+        self.futures = common.futures.FutureTokenRegistry(self.fut)
+        proxy_wallets = common.abi.find_deployments(self.w3, 'ProxyWallet')
+        self.proxy_wallet = common.proxy_wallet.ProxyWallet(proxy_wallets[0]) if proxy_wallets else None
+        self.__symbols = None
+        self.__ctoken_models = {}
+        self.__reserves = {}
+        self.__reserves_block = None
+        self.__lock = threading.Lock()
+
+    def token(self, name: str) -> common.token.Token:
+        if web3.main.is_address(name):
+            address = web3.main.to_checksum_address(name)
+            token = self.tokens.get(address)
+            if token is None:
+                contract = self.w3.eth.contract(address=address, abi=self.weth.contract.abi)
+                token = self.tokens[address] = common.token.Token(contract)
+                if self.__symbols is not None:
+                    self.__symbols[token.symbol] = token
+            return token
+        if self.__symbols is None:
+            self.__symbols = dict((token.symbol, token) for token in self.tokens.values())
+        return self.__symbols[name]
+
+    def reserves(self, pair: common.uniswap.UniswapToken) -> Sequence[Decimal]:
+        # Reserves only change between blocks, so keep them until the head moves
+        block_number = self.w3.eth.block_number
+        with self.__lock:
+            if block_number != self.__reserves_block:
+                self.__reserves.clear()
+                self.__reserves_block = block_number
+            result = self.__reserves.get(pair.address)
+        if result is None:
+            result = pair.getReserves()
+            with self.__lock:
+                self.__reserves[pair.address] = result
+        return result
+
+    def ctoken_model(self, token: common.token.Token) -> common.compound.CTokenModel:
+        model = self.__ctoken_models.get(token.address)
+        if model is None:
+            model = self.__ctoken_models[token.address] = common.compound.CTokenModel(token.contract)
+        return model
+
+    def wallet(self, owner: str) -> common.proxy_wallet.ProxyWallet:
+        if self.proxy_wallet is None:
+            raise ValueError('no ProxyWallet deployed')
+        wallet = self.proxy_wallet.getWalletOrNull(owner)
+        if wallet is None:
+            raise ValueError(f'no proxy wallet for {owner}')
+        return wallet
+
+def _tx_from(state: WarmState, args: Mapping[str, Any]) -> str:
+    tx_from = web3.main.to_checksum_address(args.get('from') or state.w3.eth.accounts[0])
+    if tx_from not in state.allow_from:
+        raise ValueError(f'sending from {tx_from} is not allowed')
+    return tx_from
+
+def _receipt_or_result(result: Any) -> Any:
+    if isinstance(result, Mapping):
+        return dict(result)
+    return result
+
+def command_block(state: WarmState, args: Mapping[str, Any]) -> Any:
+    return {'blockNumber': state.w3.eth.block_number}
+
+def command_balances(state: WarmState, args: Mapping[str, Any]) -> Any:
+    results = []
+    with common.block.BlockContext(state.w3, args.get('block', 'latest')) as block_number:
+        for account in args.get('accounts') or state.w3.eth.accounts:
+            for name in args.get('tokens', ('ETH',)):
+                if name == 'ETH':
+                    balance = state.weth.to_dec(state.w3.eth.get_balance(account, block_number))
+                    results.append({'blockNumber': block_number, 'account': account, 'token': None, 'symbol': 'ETH', 'decimals': 18, 'balance': balance})
+                else:
+                    token = state.token(name)
+                    results.append({'blockNumber': block_number, 'account': account, 'token': token.address, 'symbol': token.symbol, 'decimals': token.decimals, 'balance': token.balanceOf(account)})
+    return results
+
+def command_reserves(state: WarmState, args: Mapping[str, Any]) -> Any:
+    results = []
+    for name_a, name_b in args['pairs']:
+        pair = state.uniswap.getPairUnchecked(state.token(name_a), state.token(name_b))
+        reserve0, reserve1, timestamp = state.reserves(pair)
+        results.append({'pair': pair.address, 'symbol0': pair.token0.symbol, 'symbol1': pair.token1.symbol, 'reserve0': reserve0, 'reserve1': reserve1, 'blockTimestampLast': timestamp})
+    return results
+
+def command_exchange_rates(state: WarmState, args: Mapping[str, Any]) -> Any:
+    ctokens = [state.token(name) for name in args['tokens']]
+    models = [state.ctoken_model(ctoken) for ctoken in ctokens]
+    common.compound.refresh(models, args.get('block'))
+    results = []
+    for ctoken, model in zip(ctokens, models):
+        block_number = args.get('at_block', model.state.block_number)
+        results.append({'blockNumber': block_number, 'token': ctoken.address, 'symbol': ctoken.symbol, 'exchangeRate': model.exchange_rate(block_number)})
+    return results
+
+def command_quote(state: WarmState, args: Mapping[str, Any]) -> Any:
+    path = [state.token(name) for name in args['path']]
+    if 'amount_in' in args:
+        return state.uniswap.getAmountsOut(Decimal(args['amount_in']), path)
+    return state.uniswap.getAmountsIn(Decimal(args['amount_out']), path)
+
+def command_swap(state: WarmState, args: Mapping[str, Any]) -> Any:
+    path = [state.token(name) for name in args['path']]
+    kwargs = dict(
+        path=path,
+        tx_from=_tx_from(state, args),
+        relative_deadline=RELATIVE_DEADLINE,
+        approve=args.get('approve', True),
+        transact=args.get('transact', False),
+    )
+    if 'amount_in' in args:
+        result = state.uniswap.swapExactTokensForTokens(Decimal(args['amount_in']), Decimal(args.get('amount_out_min', 0)), **kwargs)
+    else:
+        result = state.uniswap.swapTokensForExactTokens(Decimal(args['amount_out']), Decimal(args['amount_in_max']), **kwargs)
+    return _receipt_or_result(result)
+
+def command_add_liquidity(state: WarmState, args: Mapping[str, Any]) -> Any:
+    token_a = state.token(args['token_a'])
+    token_b = state.token(args['token_b'])
+    amount_a = Decimal(args['amount_a'])
+    amount_b = Decimal(args['amount_b'])
+    result = state.uniswap.addLiquidity(
+        token_a, token_b,
+        amount_a, amount_b,
+        Decimal(args.get('amount_a_min', amount_a)), Decimal(args.get('amount_b_min', amount_b)),
+        tx_from=_tx_from(state, args),
+        relative_deadline=RELATIVE_DEADLINE,
+        approve=args.get('approve', True),
+        transact=args.get('transact', False),
+    )
+    return _receipt_or_result(result)
+
+def command_add_liquidity_many(state: WarmState, args: Mapping[str, Any]) -> Any:
+    allocations = []
+    for item in args['allocations']:
+        token_a = state.token(item['token_a'])
+        token_b = state.token(item['token_b'])
+        allocations.append(common.liquidity.Allocation(
+            token_a.address, token_b.address,
+            token_a.to_int(Decimal(item['amount_a'])), token_b.to_int(Decimal(item['amount_b'])),
+        ))
+    planner = common.liquidity.LiquidityPlanner(state.uniswap)
+    plan = planner.plan(allocations, _tx_from(state, args), max_slippage=int(args.get('max_slippage', 0)))
+    if args.get('plan_only', False):
+        return {
+            'blockNumber': plan.block_number,
+            'approvals': [approval._asdict() for approval in plan.approvals],
+            'deposits': [deposit._asdict() for deposit in plan.deposits],
+            'gas': plan.gas,
+        }
+    tx = {'gas': int(args['gas'])} if args.get('gas') else {}
+    results = planner.execute(plan, relative_deadline=RELATIVE_DEADLINE, transact=args.get('transact', False), tx=tx)
+    return [_receipt_or_result(result) for result in results]
+
+def command_hedge(state: WarmState, args: Mapping[str, Any]) -> Any:
+    tx_from = _tx_from(state, args)
+    token = state.token(args['token'])
+    engine = common.hedge.HedgeEngine(state.wallet(tx_from))
+    plan = engine.plan(
+        token.to_int(Decimal(args['amount'])),
+        token.address,
+        int(args['blocks']),
+        max_slippage=args.get('max_slippage'),
+        yield_slippage=args.get('yield_slippage'),
+        tx_from=tx_from,
+    )
+    if args.get('plan_only', False):
+        return plan._replace(pricing=plan.pricing._asdict())._asdict()
+    result = engine.execute(
+        plan,
+        tx_from=tx_from,
+        relative_deadline=RELATIVE_DEADLINE,
+        transact=args.get('transact', False),
+    )
+    return _receipt_or_result(result)
+
+COMMANDS: Mapping[str, Callable[[WarmState, Mapping[str, Any]], Any]] = {
+    'block': command_block,
+    'balances': command_balances,
+    'reserves': command_reserves,
+    'exchange_rates': command_exchange_rates,
+    'quote': command_quote,
+    'swap': command_swap,
+    'add_liquidity': command_add_liquidity,
+    'add_liquidity_many': command_add_liquidity_many,
+    'hedge': command_hedge,
+}
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        stream = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+        output = common.ndjson.NDJSONWriter(stream, include_logs=True)
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request_id = None
+            try:
+                request = json.loads(line)
+                request_id = request.get('id')
+                command = COMMANDS[request['command']]
+                result = command(self.server.state, request.get('args', {}))
+                output.write('result', {'id': request_id, 'result': result})
+            except Exception as exc:
+                output.write('error', {'id': request_id, 'error': f'{type(exc).__name__}: {exc}'})
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, state: WarmState):
+        self.state = state
+        super().__init__(path, RequestHandler)
+
+    def server_bind(self):
+        # Nobody else may connect, not even between bind and chmod
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+        os.chmod(self.server_address, 0o600)
+
+def serve(path: str, provider_uri: Optional[str] = None, allow_from: Sequence[str] = ()):
+    state = WarmState(provider_uri, allow_from)
+    if os.path.exists(path):
+        os.unlink(path)
+    with Server(path, state) as server:
+        print(f'xyzd listening on {path}', file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+def call(path: str, command: str, args: Mapping[str, Any]):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps({'id': 1, 'command': command, 'args': args}).encode() + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('r') as fd:
+            for line in fd:
+                sys.stdout.write(line)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    parser_serve = subparsers.add_parser('serve')
+    parser_serve.add_argument('--provider', default=None)
+    parser_serve.add_argument('--allow-from', action='append', default=[], metavar='ADDRESS')
+    parser_call = subparsers.add_parser('call')
+    parser_call.add_argument('command', choices=sorted(COMMANDS))
+    parser_call.add_argument('args', nargs='?', default='{}')
+    args = parser.parse_args()
+    if args.mode == 'serve':
+        serve(args.socket, args.provider, args.allow_from)
+    else:
+        call(args.socket, args.command, json.loads(args.args))
+
+if __name__ == '__main__':
+    main()
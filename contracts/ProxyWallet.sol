@@ -96,9 +96,12 @@ contract ProxyWallet is ProxyWalletImpl {
     using Clones for address;
     using Address for address;
 
-    FutureToken internal _future_token;
-    ComptrollerInterface _compound_comptroller;
-    IUniswapV2Router02 internal _uniswap_router;
+    // Immutables are part of the master's code, so clones read them without
+    // an SLOAD or a call back to the master
+    FutureToken internal immutable _future_token;
+    ComptrollerInterface immutable _compound_comptroller;
+    IUniswapV2Router02 internal immutable _uniswap_router;
+    IUniswapV2Factory internal immutable _uniswap_factory;
 
     mapping(address => CTokenInterface) internal _token_to_ctoken;
     ICEther internal _cether;
@@ -111,6 +114,8 @@ contract ProxyWallet is ProxyWalletImpl {
 	_future_token = future_token;
 	_compound_comptroller = compound_comptroller;
 	_uniswap_router = uniswap_router;
+	// Router address may have no code on a development chain
+	_uniswap_factory = IUniswapV2Factory(address(uniswap_router).isContract() ? uniswap_router.factory() : address(0));
 
 	// Code below moved to separate post construction functions due to gas limits
 	/*
@@ -437,6 +442,67 @@ contract ProxyWallet is ProxyWalletImpl {
 	return true;
     }
 
+    struct HedgeOrder {
+	address token;
+	uint amount;
+	uint blocks;
+    }
+
+    // Orders of the same token must be adjacent, each run of them shares one
+    // ctoken lookup and one router approval. max_slippage bounds every swap on
+    // its own, against the spot price left by the swaps before it
+    function depositAndHedgeMany(HedgeOrder[] calldata orders, uint max_slippage, uint deadline) external payable onlyOwner returns (bool) {
+	uint count = orders.length;
+	require(count > 0); // dev: no orders
+
+	uint ether_amount = 0;
+	for (uint i = 0; i < count; ++i)
+	    if (orders[i].token == ETH_TOKEN_ADDRESS)
+		ether_amount += orders[i].amount;
+	require(msg.value >= ether_amount); // dev: supplied ether less than amount required
+	if (msg.value > ether_amount) {
+	    (bool sent, /*bytes memory data*/) = msg.sender.call{value: msg.value - ether_amount}("");
+	    require(sent); // dev: failed to refund excess deposit amount
+	}
+
+	for (uint start = 0; start < count; )
+	    start = _deposit_and_hedge_run(orders, start, max_slippage, deadline);
+	return true;
+    }
+
+    function _deposit_and_hedge_run(HedgeOrder[] calldata orders, uint start, uint max_slippage, uint deadline) internal returns (uint end) {
+	address token = orders[start].token;
+	ProxyCommonData memory data = _getProxyCommonData(token);
+
+	end = start;
+	while (end < orders.length && orders[end].token == token)
+	    ++end;
+
+	uint[] memory minted = new uint[](end - start);
+	uint total_minted = 0;
+	for (uint i = start; i < end; ++i) {
+	    minted[i - start] = _deposit_any(orders[i].amount, token, data.ctoken);
+	    total_minted += minted[i - start];
+	}
+
+	require(data.ctoken.approve(address(data.uniswap_router), total_minted)); // dev: set ctoken allowance for uniswap failed
+	uint total_out = 0;
+	for (uint i = start; i < end; ++i) {
+	    (uint amount_out, ) = _swap_short(minted[i - start], orders[i].blocks, max_slippage, deadline, data);
+	    total_out += amount_out;
+	}
+	if (total_out < total_minted)
+	    require(data.ctoken.approve(address(data.uniswap_router), 0)); // dev: reset ctoken allowance for uniswap failed
+    }
+
+    function _deposit_any(uint amount, address token, CTokenInterface ctoken) internal returns (uint) {
+	if (token == ETH_TOKEN_ADDRESS)
+	    return _deposit_ether(amount, ICEther(payable(address(ctoken))));
+	if (token != address(ctoken))
+	    return _deposit_erc20(amount, IERC20(token), ICErc20(address(ctoken)));
+	return _deposit_ctoken(amount, ICErc20(address(ctoken)));
+    }
+
     /*
       @KP  To get the % price slippage limit from a yield slippage limit :
 
@@ -455,6 +521,34 @@ contract ProxyWallet is ProxyWalletImpl {
     //    }
 
     function _hedge(uint amount, uint blocks, uint max_slippage, uint deadline, ProxyCommonData memory data) internal returns (uint amount_out, uint amount_in) {
+	// _swap_short never pays more than amount, max_slippage can only lower that
+	uint amountInMax = amount;
+	require(data.ctoken.approve(address(data.uniswap_router), amountInMax)); // dev: set ctoken allowance for uniswap failed
+	(amount_out, amount_in) = _swap_short(amount, blocks, max_slippage, deadline, data);
+	if (amount_out < amountInMax)
+	    require(data.ctoken.approve(address(data.uniswap_router), 0)); // dev: reset ctoken allowance for uniswap failed
+    }
+
+    // Largest ctoken amount to pay for `amount` of the short future: at most 1 ctoken per
+    // future, and with max_slippage (scaled by 1e18, 0 for none) an average price at most
+    // max_slippage above the pair's spot price
+    function _calcAmountInMax(uint amount, address fut_short, uint max_slippage, ProxyCommonData memory data) view internal returns (uint amountInMax) {
+	amountInMax = amount;
+	if (max_slippage == 0)
+	    return amountInMax;
+	address pair = data.uniswap_factory.getPair(fut_short, address(data.ctoken));
+	require(pair != address(0)); // dev: no uniswap pair for future
+	(uint reserves_fut, uint reserves_ctoken, ) = IUniswapV2Pair(pair).getReserves();
+	if (fut_short > address(data.ctoken))
+	    (reserves_fut, reserves_ctoken) = (reserves_ctoken, reserves_fut);
+	require(reserves_fut > 0); // dev: no liquidity for future
+	uint limit = amount * reserves_ctoken * (1e18 + max_slippage) / (reserves_fut * 1e18);
+	if (limit < amountInMax)
+	    amountInMax = limit;
+    }
+
+    // Swaps ctoken for `amount` of the short future, the router allowance must already be set
+    function _swap_short(uint amount, uint blocks, uint max_slippage, uint deadline, ProxyCommonData memory data) internal returns (uint amount_out, uint amount_in) {
 	require(amount > 0); // dev: amount must be non-zero
 	CTokenInterface ctoken = data.ctoken;
 
@@ -464,7 +558,7 @@ contract ProxyWallet is ProxyWalletImpl {
 	    require(fut_short != address(0)); // dev: no future for given expiry exists
 	}
 
-	uint amountInMax = amount; // slippage control not currently implemented
+	uint amountInMax = _calcAmountInMax(amount, fut_short, max_slippage, data);
 	address[] memory path = new address[](2); {
 	    path[0] = address(ctoken);
 	    path[1] = fut_short;
@@ -472,16 +566,12 @@ contract ProxyWallet is ProxyWalletImpl {
 
 	uint rate_before = ctoken.exchangeRateCurrent();
 
-	require(ctoken.approve(address(data.uniswap_router), amountInMax)); // dev: set ctoken allowance for uniswap failed
 	uint[] memory amounts = data.uniswap_router.swapTokensForExactTokens(amount, amountInMax, path, address(this), deadline);
 	require(amounts.length == 2); // dev: unexpected number of amounts returned from uniswap.swapTokensForExactTokens
 
 	amount_out = amounts[0];
 	amount_in = amounts[1];
 
-	if (amount_out < amountInMax)
-	    require(ctoken.approve(address(data.uniswap_router), 0)); // dev: reset ctoken allowance for uniswap failed
-
 	uint rate_after = ctoken.exchangeRateCurrent();
 
 	emit WalletShortHedge(msg.sender,
@@ -500,25 +590,21 @@ contract ProxyWallet is ProxyWalletImpl {
 	CTokenInterface ctoken;
      }
 
-    function _getProxyCommonData(address asset) view internal returns (ProxyCommonData memory) {
+    function _getProxyCommonData(address asset) view internal returns (ProxyCommonData memory x) {
+	// Only the ctoken lookup needs the master's storage
 	address master_proxy_wallet = _proxy_wallet;
-	if (master_proxy_wallet != address(0))
-	    return ProxyWallet(payable(master_proxy_wallet)).getProxyCommonDataLocal(asset);
-	return _getProxyCommonDataLocal(asset);
-    }
-
-    function _getProxyCommonDataLocal(address asset) view internal returns (ProxyCommonData memory x) {
-	address factory = _uniswap_router.factory();
-	address ctoken = address(_token_to_ctoken[asset]);
+	address ctoken = master_proxy_wallet != address(0)
+	    ? ProxyWallet(payable(master_proxy_wallet)).getCToken(asset)
+	    : address(_token_to_ctoken[asset]);
 	require(ctoken != address(0)); // dev: asset not recognised
 	x.future_token_master = _future_token;
 	x.uniswap_router = _uniswap_router;
-	x.uniswap_factory = IUniswapV2Factory(factory);
+	x.uniswap_factory = _uniswap_factory;
 	x.ctoken = CTokenInterface(ctoken);
     }
 
-    function getProxyCommonDataLocal(address asset) view external returns (ProxyCommonData memory ) {
-        return _getProxyCommonDataLocal(asset);
+    function getCToken(address asset) view external returns (address) {
+	return address(_token_to_ctoken[asset]);
     }
 
     fallback(bytes calldata /*_input*/) external payable returns (bytes memory /*_output*/) { revert(); } // dev: no fallback
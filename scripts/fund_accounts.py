@@ -3,38 +3,49 @@
 '''
 Iterates and print accounts on the Ethereum node.
 For a local node (forked or otherwise) there should be 20 accounts with 10,000 ETH each.
+
+Run `brownie run fund_accounts main_parallel` to compute every deficit from one
+balance snapshot and submit all funding swaps without waiting on each receipt.
 '''
 import decimal
 import datetime
 from decimal import Decimal
 from typing import Any, Mapping, Optional, Sequence, Tuple, Union
 from brownie import Contract, Fixed, accounts, chain
-from .helper import D, Wrapper, load_mainnet_contracts
+from .helper import D, Wrapper, balance_snapshot, load_mainnet_contracts
+
+def print_balances(W: Wrapper, snapshot: Mapping[Tuple[str, str], int]):
+    print(f'{"#":<2}    {"Account":<42}    {"ETH":>24}    {"WETH":>24}    {"USDC":>24}    {"cUSDC":>24}')
+    for i, account in enumerate(accounts):
+        account = str(account)
+        eth_balance = D(snapshot[account, 'ETH'], 18)
+        weth_balance = W.to_dec(W.WETH, snapshot[account, W.WETH.address])
+        usdc_balance = W.to_dec(W.USDC, snapshot[account, W.USDC.address])
+        cusdc_balance = W.to_dec(W.cUSDC, snapshot[account, W.cUSDC.address])
+        print(f'{i:<2}    {account:<42s}    {eth_balance:>24.18f}    {weth_balance:>24.18f}    {usdc_balance:>24.6f}    {cusdc_balance:>24.8f}')
+    print()
 
-def main():
+def main_parallel():
+    return main(parallel=True)
+
+def main(parallel: bool = False):
     assert chain.id != 1, "Do not run this script against mainnet"
     W = Wrapper()
+    tokens = (W.WETH, W.USDC, W.cUSDC)
 
-    block_number = chain.height
+    block_number, snapshot = balance_snapshot(accounts, tokens)
 
     print()
     print('# Ethereum')
     print(f'{"chain_id":<24} {chain.id}')
-    print(f'{"block_number":<24} {chain.height:,d}')
+    print(f'{"block_number":<24} {block_number:,d}')
     print(f'{"block_time":<24} {datetime.datetime.utcfromtimestamp(chain.time())!s:<19s} / {chain.time():,d}')
     print(f'{"accounts":<24} {len(accounts)}')
     print()
-    for token in (W.WETH, W.USDC, W.cUSDC):
+    for token in tokens:
         print(f'{W.symbol(token):<24} {W.decimals(token):>3}    {token.address}')
     print()
-    print(f'{"#":<2}    {"Account":<42}    {"ETH":>24}    {"WETH":>24}    {"USDC":>24}    {"cUSDC":>24}')
-    for i, account in enumerate(accounts):
-        eth_balance = account.balance()
-        weth_balance = W.balanceOf(W.WETH, account)
-        usdc_balance = W.balanceOf(W.USDC, account)
-        cusdc_balance = W.balanceOf(W.cUSDC, account)
-        print(f'{i:<2}    {account!s:<42s}    {D(eth_balance, 18):>24.18f}    {weth_balance:>24.18f}    {usdc_balance:>24.6f}    {cusdc_balance:>24.8f}')
-    print()
+    print_balances(W, snapshot)
 
     sane_eth_rates = {
         W.USDC: 1 / D(2_000),
@@ -46,6 +57,9 @@ def main():
         (accounts[3], W.USDC, D(5_000),),
     )
 
+    if parallel:
+        return fund_parallel(W, min_balances, sane_eth_rates, snapshot)
+
     balances_changed = False
     for account, token, amount in min_balances:
         balance = W.balanceOf(token, account)
@@ -56,17 +70,53 @@ def main():
             adj_quantity = W.to_int(token, quantity)
             adj_eth_value = W.to_int(W.WETH, eth_value)
             print(f'{quantity} {eth_value} => {adj_quantity} {adj_eth_value}')
-            rc = W.UNI.swapETHForExactTokens(adj_quantity, [W.WETH.address, W.USDC.address], account, chain.time() + 30, {'from': account, 'value': adj_eth_value})
+            rc = W.UNI.swapETHForExactTokens(adj_quantity, [W.WETH.address, token.address], account, chain.time() + 30, {'from': account, 'value': adj_eth_value})
             print(rc)
             print(rc.status)
 
     if balances_changed:
         print()
-        print(f'{"#":<2}    {"Account":<42}    {"ETH":>24}    {"WETH":>24}    {"USDC":>24}    {"cUSDC":>24}')
-        for i, account in enumerate(accounts):
-            eth_balance = account.balance()
-            weth_balance = W.balanceOf(W.WETH, account)
-            usdc_balance = W.balanceOf(W.USDC, account)
-            cusdc_balance = W.balanceOf(W.cUSDC, account)
-            print(f'{i:<2}    {account!s:<42s}    {D(eth_balance, 18):>24.18f}    {weth_balance:>24.18f}    {usdc_balance:>24.6f}    {cusdc_balance:>24.8f}')
+        _, snapshot = balance_snapshot(accounts, tokens)
+        print_balances(W, snapshot)
+
+def fund_parallel(W: Wrapper, min_balances: Sequence[Tuple[Any, Contract, Decimal]], sane_eth_rates: Mapping[Contract, Decimal], snapshot: Mapping[Tuple[str, str], int]):
+    # Merge duplicate entries so every (account, token) gets at most one swap
+    targets = {}
+    for account, token, amount in min_balances:
+        key = (str(account), token.address)
+        if key in targets:
+            amount = max(amount, targets[key][2])
+        targets[key] = account, token, amount
+
+    deadline = chain.time() + 300
+    pending = []
+    for (account_address, token_address), (account, token, amount) in targets.items():
+        balance = W.to_dec(token, snapshot[account_address, token_address])
+        if balance >= amount:
+            continue
+        quantity = amount - balance
+        eth_value = quantity * sane_eth_rates[token] * 2
+        adj_quantity = W.to_int(token, quantity)
+        adj_eth_value = W.to_int(W.WETH, eth_value)
+        # required_confs=0 returns as soon as the node accepts the transaction
+        tx = W.UNI.swapETHForExactTokens(adj_quantity, [W.WETH.address, token.address], account, deadline, {'from': account, 'value': adj_eth_value, 'required_confs': 0})
+        pending.append((account_address, token, balance, quantity, tx))
+
+    if not pending:
+        print('All accounts already funded')
         print()
+        return
+
+    for *_, tx in pending:
+        tx.wait(1)
+
+    block_number, snapshot = balance_snapshot(accounts, (W.WETH, W.USDC, W.cUSDC))
+
+    print(f'# Funding (block {block_number:,d})')
+    print(f'{"Account":<42}    {"Token":<8}    {"Before":>24}    {"Funded":>24}    {"After":>24}    {"Gas":>10}    {"Status":<8}')
+    for account_address, token, balance, quantity, tx in pending:
+        after = W.to_dec(token, snapshot[account_address, token.address])
+        status = 'ok' if tx.status == 1 else 'REVERTED'
+        print(f'{account_address:<42s}    {W.symbol(token):<8}    {balance:>24}    {quantity:>24}    {after:>24}    {tx.gas_used:>10,d}    {status:<8}')
+    print()
+    print_balances(W, snapshot)
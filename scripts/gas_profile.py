@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: UNLICENSED
+'''
+Gas profile of the ProxyWallet and FutureToken entry points.
+
+Run `brownie run gas_profile --network mainnet-fork` to run every entry point over
+its parameter grid on top of the helper deployment, each case reverted afterwards,
+and store gasUsed and the hottest opcodes and functions of its trace under
+reports/gas/<commit>.json.
+
+Run `brownie run gas_profile compare`, or `python scripts/gas_profile.py compare
+[BASE [HEAD]]` without a chain, to diff the results of two commits. Profiles
+are local and not committed, so check out and profile both commits first.
+'''
+import sys
+import json
+import subprocess
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence, Tuple
+
+REPORTS_DIR = Path(__file__).resolve().parent.parent / 'reports' / 'gas'
+TOP_N = 10
+CALL_OPS = {'CALL', 'CALLCODE', 'DELEGATECALL', 'STATICCALL', 'CREATE', 'CREATE2'}
+
+# A case is a name, a setup run before measuring and the measured transaction
+Case = Tuple[str, Callable[[], None], Callable[[], Any]]
+
+def _git(*args: str) -> str:
+    return subprocess.run(('git',) + args, cwd=REPORTS_DIR.parent.parent, capture_output=True, text=True, check=True).stdout.strip()
+
+def current_commit() -> Tuple[str, bool]:
+    return _git('rev-parse', 'HEAD'), bool(_git('status', '--porcelain', '--untracked-files=no'))
+
+def exclusive_costs(trace: Sequence[Mapping[str, Any]]) -> Sequence[int]:
+    '''
+    Gas of each trace step excluding its callees. The gasCost a node reports for a
+    call includes the gas forwarded to the callee, which the callee's own steps
+    already account for, so a call is charged only its overhead.
+    '''
+    costs = [step['gasCost'] for step in trace]
+    stack = []
+    for i in range(len(trace) - 1):
+        step, after = trace[i], trace[i + 1]
+        if step['op'] in CALL_OPS and after['depth'] > step['depth']:
+            stack.append((i, after['gas']))
+        elif after['depth'] < step['depth'] and stack:
+            call, callee_gas = stack.pop()
+            callee_used = callee_gas - (step['gas'] - step['gasCost'])
+            costs[call] = trace[call]['gas'] - after['gas'] - callee_used
+        elif step['op'] in CALL_OPS:
+            # Call to an account without code, nothing else is charged for it
+            costs[i] = step['gas'] - after['gas']
+    return costs
+
+def hotspots(trace: Sequence[Mapping[str, Any]], top: int = TOP_N) -> Mapping[str, Sequence[Tuple[str, int]]]:
+    by_op = Counter()
+    by_fn = Counter()
+    for step, cost in zip(trace, exclusive_costs(trace)):
+        by_op[step['op']] += cost
+        by_fn[step.get('fn') or f'{step.get("contractName") or step.get("address")}.<unknown>'] += cost
+    return {
+        'opcodes': by_op.most_common(top),
+        'functions': by_fn.most_common(top),
+    }
+
+def measure(cases: Iterable[Case]) -> Mapping[str, Mapping[str, Any]]:
+    from brownie import chain
+    results = {}
+    for name, setup, run in cases:
+        chain.snapshot()
+        try:
+            setup()
+            tx = run()
+            result = {'gas_used': tx.gas_used, 'status': tx.status}
+            try:
+                result.update(hotspots(tx.trace))
+            except Exception as e:
+                # Nodes without debug_traceTransaction still give gasUsed
+                result['trace_error'] = str(e)
+        except Exception as e:
+            result = {'error': str(e)}
+        finally:
+            chain.revert()
+        results[name] = result
+        print(f'{name:<72} {result.get("gas_used", "-"):>10}')
+    return results
+
+def proxy_wallet_cases(deployment: Mapping[str, Any], contracts: Mapping[str, Any]) -> Sequence[Case]:
+    from brownie import accounts, chain
+    usdc = contracts['token-usdc']
+    PW, PW1 = deployment['PW'], deployment['PW1']
+    owner = accounts[1]
+    tx = {'from': owner}
+    nothing = lambda: None
+    approve = lambda: usdc.approve(PW1, 2**256 - 1, tx)
+    cases = [
+        ('ProxyWallet.createWalletIfNeeded[new]', nothing, lambda: PW.createWalletIfNeeded({'from': accounts[7]})),
+        ('ProxyWallet.createWalletIfNeeded[existing]', nothing, lambda: PW.createWalletIfNeeded(tx)),
+    ]
+    # Wallet common data lookup alone, paid again by every deposit, withdraw and hedge
+    for blocks in (4096 * 48, 4096 * 96):
+        cases.append((f'ProxyWallet.getPricing[USDC,{blocks}]', nothing, lambda blocks=blocks: PW1.getPricing(usdc, blocks, tx)))
+    for amount in (100, 1_000, 10_000):
+        raw_amount = amount * 10**6
+        cases.append((f'ProxyWallet.deposit[USDC,{amount}]', approve, lambda raw_amount=raw_amount: PW1.deposit(raw_amount, usdc, tx)))
+        def deposited(raw_amount=raw_amount):
+            approve()
+            PW1.deposit(raw_amount, usdc, tx)
+        cases.append((f'ProxyWallet.withdraw[USDC,{amount}]', deposited, lambda raw_amount=raw_amount: PW1.withdraw(raw_amount // 2, usdc, tx)))
+        for blocks in (4096 * 48, 4096 * 96):
+            cases.append((
+                f'ProxyWallet.depositAndHedge[USDC,{amount},{blocks}]',
+                approve,
+                lambda raw_amount=raw_amount, blocks=blocks: PW1.depositAndHedge(raw_amount, usdc, blocks, 10**18, chain.time() + 300, tx),
+            ))
+        orders = [(usdc.address, raw_amount, blocks) for blocks in (4096 * 48, 4096 * 96)]
+        cases.append((
+            f'ProxyWallet.depositAndHedgeMany[USDC,{amount},2]',
+            approve,
+            lambda orders=orders: PW1.depositAndHedgeMany(orders, 10**18, chain.time() + 300, tx),
+        ))
+    return cases
+
+def future_token_cases(deployment: Mapping[str, Any], contracts: Mapping[str, Any]) -> Sequence[Case]:
+    from brownie import accounts
+    cusdc = contracts['compound-cusdc']
+    FUT, FCU = deployment['FUT'], deployment['FCU']
+    holder = accounts[4]
+    tx = {'from': holder}
+    nothing = lambda: None
+    cases = []
+    for chunks in (48, 96, 192):
+        expiry = FUT.calcNextExpiryBlockAfter(chunks * 4096)
+        cases.append((f'FutureToken.getOrCreateExpiryClassLongShort[{chunks}]', nothing, lambda expiry=expiry: FUT.getOrCreateExpiryClassLongShort(cusdc, expiry, {'from': accounts[0]})))
+    existing = FCU.expiryBlock()
+    cases.append(('FutureToken.getOrCreateExpiryClassLongShort[existing]', nothing, lambda: FUT.getOrCreateExpiryClassLongShort(cusdc, existing, {'from': accounts[0]})))
+    approve = lambda: cusdc.approve(FCU, 2**256 - 1, tx)
+    for amount in (10**6, 10**9, 10**12):
+        cases.append((f'FutureToken.mintPairs[{amount}]', approve, lambda amount=amount: FCU.mintPairs(amount, 2**256 - 1, tx)))
+        def minted(amount=amount):
+            approve()
+            FCU.mintPairs(amount, 2**256 - 1, tx)
+        cases.append((f'FutureToken.redeemPairs[{amount}]', minted, lambda amount=amount: FCU.redeemPairs(amount, tx)))
+    return cases
+
+def save(results: Mapping[str, Mapping[str, Any]], meta: Mapping[str, Any]) -> Path:
+    commit, dirty = current_commit()
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = REPORTS_DIR / f'{commit}{"-dirty" if dirty else ""}.json'
+    with path.open('w') as fd:
+        json.dump(dict(meta, commit=commit, dirty=dirty, cases=results), fd, indent=2)
+    return path
+
+def load(commit: str) -> Mapping[str, Any]:
+    paths = sorted(REPORTS_DIR.glob(f'{commit}*.json'))
+    if not paths:
+        raise ValueError(f'no gas profile for {commit}')
+    with paths[0].open() as fd:
+        return json.load(fd)
+
+def profiled_commits() -> Sequence[str]:
+    '''Commits with a stored profile, newest first in history order'''
+    stored = set(path.stem.split('-')[0] for path in REPORTS_DIR.glob('*.json'))
+    return [commit for commit in _git('rev-list', 'HEAD').split() if commit in stored]
+
+def compare(base: Optional[str] = None, head: Optional[str] = None):
+    '''Print the gasUsed difference of every case between two profiled commits, by default the two latest'''
+    if head is None or base is None:
+        commits = profiled_commits()
+        head = head or (commits[0] if commits else None)
+        base = base or next((commit for commit in commits if not commit.startswith(head)), None)
+    if base is None or head is None:
+        raise ValueError('need gas profiles of two commits')
+    base_cases = load(base)['cases']
+    head_cases = load(head)['cases']
+    print(f'{"Case":<72} {base[:10]:>10} {head[:10]:>10} {"Delta":>10} {"%":>8}')
+    for name in sorted(set(base_cases) | set(head_cases)):
+        before = base_cases.get(name, {}).get('gas_used')
+        after = head_cases.get(name, {}).get('gas_used')
+        if before is None or after is None:
+            print(f'{name:<72} {before or "-":>10} {after or "-":>10}')
+            continue
+        delta = after - before
+        print(f'{name:<72} {before:>10,d} {after:>10,d} {delta:>+10,d} {100 * delta / before:>+7.2f}%')
+
+def main():
+    import brownie
+    from brownie import chain
+    from .helper import load_mainnet_contracts, main_snapshot
+    assert chain.id != 1, "Do not run this script against mainnet"
+    deployment = main_snapshot()
+    assert deployment, f"Nothing deployed on chain {chain.id}: the helper only deploys on a development or fork network with chain id >= 1000"
+    contracts = load_mainnet_contracts('token-usdc', 'compound-cusdc')
+    cases = list(proxy_wallet_cases(deployment, contracts)) + list(future_token_cases(deployment, contracts))
+    results = measure(cases)
+    path = save(results, {
+        'chain_id': chain.id,
+        'block_number': brownie.web3.eth.block_number,
+        'network': brownie.network.main.show_active(),
+    })
+    print(f'Saved {len(results)} cases to {path}')
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['compare']:
+        sys.exit(__doc__)
+    compare(*sys.argv[2:4])
@@ -1,13 +1,21 @@
 # SPDX-License-Identifier: UNLICENSED
 import os
+import sys
 import json
 import decimal
 import lzma
 import base64
 import itertools
 from pathlib import Path
-from typing import Any, Mapping, Union
+from typing import Any, Iterable, Mapping, Sequence, Tuple, Union
 import brownie
+import requests
+
+# The cli package, for the JSON-RPC helpers it shares with the scripts
+_CLI_DIR = str(Path(__file__).resolve().parent.parent / 'cli')
+if _CLI_DIR not in sys.path:
+    sys.path.insert(0, _CLI_DIR)
+import common
 
 UINT256_MAX = (1<<256)-1
 
@@ -16,6 +24,9 @@ _ENABLE_CDAI = False
 _ENABLE_CUSDC = True
 _ENABLE_CETH = False
 
+_SNAPSHOT_FILE = 'snapshot.json'
+_SNAPSHOT_STATE = 'snapshot.state'
+
 _ABI = dict(
     (k, json.loads(lzma.decompress(base64.b64decode(v))))
     for k, v in {
@@ -55,6 +66,10 @@ def _get_interfaces_dir() -> Path:
     for project in brownie.project.main.get_loaded_projects():
         return project._path.joinpath(project._structure['interfaces'])
 
+def _get_deployments_dir() -> Path:
+    for project in brownie.project.main.get_loaded_projects():
+        return project._build_path.joinpath('deployments')
+
 def print_text_box(text: str, padding: int=1):
     inside_width = len(text) + 2*padding
     box = (
@@ -113,6 +128,30 @@ def load_mainnet_contracts(*args) -> Mapping[str, brownie.Contract]:
 def create_uniswap_v2_pair_contract(name: str, address: Any) -> brownie.Contract:
     return brownie.Contract.from_abi(name=name, address=address, abi=_ABI_IUniswapV2Pair)
 
+def balance_snapshot(accounts: Iterable[Any], tokens: Iterable[brownie.Contract]) -> Tuple[int, Mapping[Tuple[str, str], int]]:
+    '''
+    Read ETH and token balances of all accounts pinned to a single block.
+    Returns the block number and a mapping of (account, token) to raw balance,
+    where the token is the contract address or 'ETH'.
+    '''
+    accounts = [str(account) for account in accounts]
+    tokens = [str(token.address) for token in tokens]
+    block_number, = common.rpc.batch_request(brownie.web3, [('eth_blockNumber', ())])
+    keys = []
+    calls = []
+    for account in accounts:
+        keys.append((account, 'ETH'))
+        calls.append(('eth_getBalance', (account, block_number)))
+        for token in tokens:
+            data = '0x70a08231' + account[2:].lower().rjust(64, '0') # balanceOf(address)
+            keys.append((account, token))
+            calls.append(('eth_call', ({'to': token, 'data': data}, block_number)))
+    results = common.rpc.batch_request(brownie.web3, calls)
+    return int(block_number, 16), dict(
+        (key, int(result, 16) if result not in ('0x', None) else 0)
+        for key, result in zip(keys, results)
+    )
+
 def D(x: int, decimals: int = 0):
     '''Convert integer to scaled decimal'''
     y = decimal.Decimal(x)
@@ -195,8 +234,10 @@ def main():
         print_text_box(f'ADDING METAMASK ACCOUNT {METAMASK_ACCOUNT}')
 
     network = brownie.network.main.show_active()
-    CUSDC.exchangeRateCurrent({'from': accounts[0]}) #initialize the exchangeRateCurrent so that we don't get revert error
     if brownie.network.chain.id >= 1000 and (network == 'development' or network.find('fork') >= 0):
+        # Accrue cUSDC interest up to the fork block before the first deposit; this mutates
+        # the fork, which common.compound only predicts, so it is sent on forks alone
+        CUSDC.exchangeRateCurrent({'from': accounts[0]})
         print_text_box('DEPLOYING FUTURE TOKEN')
         FUT = FutureToken.deploy({'from': accounts[0]})
         print_text_box('DEPLOYING PROXY WALLET')
@@ -235,7 +276,7 @@ def main():
                                 CUSDC,
                                 EXP,
                                 {'from': accounts[0]}).return_value)
-        if _ENABLE_CETH:
+        if _ENABLE_CDAI:
             print_text_box(f'CREATING CDAI FUTURES FOR EXPIRY {EXP}')
             FCD, FLD, FSD = (
                 FutureToken.at(addr)
@@ -361,3 +402,117 @@ def main():
                              accounts[4], deadline, txdict)
         amount_fsu_cusdc = FSU_CUSDC.balanceOf(accounts[4])
         assert amount_fsu_cusdc > 0, "FSU/CUSDC balance of account should be greater than zero"
+
+        deployment = {'FUT': FUT, 'PW': PW, 'PW1': PW1, 'PW2': PW2, 'PW3': PW3}
+        if _ENABLE_CETH:
+            deployment.update(FCE=FCE, FLE=FLE, FSE=FSE, FLE_FSE=FLE_FSE, FLE_CETH=FLE_CETH, FSE_CETH=FSE_CETH)
+        if _ENABLE_CUSDC:
+            deployment.update(FCU=FCU, FLU=FLU, FSU=FSU, FLU_FSU=FLU_FSU, FLU_CUSDC=FLU_CUSDC, FSU_CUSDC=FSU_CUSDC)
+        if _ENABLE_CDAI:
+            deployment.update(FCD=FCD, FLD=FLD, FSD=FSD, FLD_FSD=FLD_FSD, FLD_CDAI=FLD_CDAI, FSD_CDAI=FSD_CDAI)
+        if METAMASK_ACCOUNT:
+            deployment['PW_META'] = PW_META
+        return deployment
+
+def main_snapshot():
+    '''
+    Restore the fully deployed dev environment from the last snapshot.
+    If there is no usable snapshot, run main() and take one for the next run.
+    '''
+    deployment = restore_snapshot()
+    if deployment is None:
+        deployment = main()
+        if deployment:
+            save_snapshot(deployment)
+    else:
+        print_text_box(f'RESTORED SNAPSHOT AT BLOCK {brownie.web3.eth.block_number}')
+    return deployment
+
+def save_snapshot(deployment: Mapping[str, brownie.Contract]):
+    '''Take an EVM snapshot and record it, with the deployed addresses, for restore_snapshot()'''
+    deployments_dir = _get_deployments_dir()
+    deployments_dir.mkdir(parents=True, exist_ok=True)
+    block = brownie.web3.eth.get_block('latest')
+    record = {
+        'chain_id': brownie.network.chain.id,
+        'block_number': block.number,
+        'block_hash': block.hash.hex(),
+        'snapshot_id': common.rpc.batch_request(brownie.web3, [('evm_snapshot', ())])[0],
+        'contracts': dict(
+            (name, {'type': contract._name, 'address': str(contract.address), 'code_hash': code_hash})
+            for (name, contract), code_hash in zip(deployment.items(), get_code_hashes(deployment.values()))
+        ),
+    }
+    # A state dump survives node restarts where the node supports one
+    state_path = deployments_dir / _SNAPSHOT_STATE
+    try:
+        state, = common.rpc.batch_request(brownie.web3, [('anvil_dumpState', ())])
+    except (ValueError, requests.RequestException):
+        state = None
+    if state:
+        with state_path.open('w') as fd:
+            fd.write(state)
+    elif state_path.exists():
+        state_path.unlink()
+    with (deployments_dir / _SNAPSHOT_FILE).open('w') as fd:
+        json.dump(record, fd, indent=2)
+    print_text_box(f'SAVED SNAPSHOT {record["snapshot_id"]} AT BLOCK {record["block_number"]}')
+
+def restore_snapshot() -> Union[Mapping[str, brownie.Contract], None]:
+    '''Revert the node to the recorded snapshot and return the deployed contracts, or None if unusable'''
+    from brownie import FutureToken, ProxyWallet
+    deployments_dir = _get_deployments_dir()
+    path = deployments_dir / _SNAPSHOT_FILE
+    if not path.exists():
+        return None
+    with path.open() as fd:
+        record = json.load(fd)
+    if record['chain_id'] != brownie.network.chain.id:
+        return None
+
+    try:
+        restored = common.rpc.batch_request(brownie.web3, [('evm_revert', (record['snapshot_id'],))])[0]
+    except ValueError:
+        restored = False
+    if restored:
+        # A restarted node reuses snapshot ids, so check we landed on the recorded block
+        block = brownie.web3.eth.get_block(record['block_number'])
+        restored = block.hash.hex() == record['block_hash']
+    if not restored:
+        state_path = deployments_dir / _SNAPSHOT_STATE
+        if not state_path.exists():
+            return None
+        with state_path.open() as fd:
+            state = fd.read()
+        try:
+            restored = common.rpc.batch_request(brownie.web3, [('anvil_loadState', (state,))])[0]
+        except (ValueError, requests.RequestException):
+            return None
+        if not restored:
+            return None
+
+    # Whatever the node restored, the recorded contracts must be there
+    contracts = list(record['contracts'].values())
+    if [item.get('code_hash') for item in contracts] != get_code_hashes(item['address'] for item in contracts):
+        return None
+
+    # evm_revert consumes the snapshot, so take a fresh one for the next run
+    record['snapshot_id'] = common.rpc.batch_request(brownie.web3, [('evm_snapshot', ())])[0]
+    with path.open('w') as fd:
+        json.dump(record, fd, indent=2)
+
+    # ContractContainer.at() also rewrites the dev deployment artifacts and map
+    containers = {
+        'FutureToken': FutureToken.at,
+        'ProxyWallet': ProxyWallet.at,
+        'IUniswapV2Pair': brownie.interface.IUniswapV2Pair,
+    }
+    return dict(
+        (name, containers[item['type']](item['address']))
+        for name, item in record['contracts'].items()
+    )
+
+def get_code_hashes(contracts: Iterable[Any]) -> Sequence[Union[str, None]]:
+    '''Hash of the code at every contract or address, None where there is no code'''
+    codes = common.rpc.batch_get_code(brownie.web3, [str(contract) for contract in contracts])
+    return [brownie.web3.keccak(code).hex() if code else None for code in codes]
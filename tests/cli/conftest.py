@@ -0,0 +1,154 @@
+import sys
+from pathlib import Path
+import pytest
+import web3
+from web3.providers.base import BaseProvider
+
+CLI_DIR = str(Path(__file__).resolve().parent.parent.parent / 'cli')
+if CLI_DIR not in sys.path:
+    sys.path.insert(0, CLI_DIR)
+
+
+@pytest.fixture(autouse=True)
+def setup():
+    """
+    The cli tests need no chain, so they run without brownie's isolation.
+    """
+    pass
+
+
+class FakeProvider(BaseProvider):
+    """
+    Provider answering every JSON-RPC request with `handler(method, params)` and
+    recording the requests it was sent.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    def make_request(self, method, params):
+        self.requests.append((method, params))
+        result = self.handler(method, params)
+        if isinstance(result, Exception):
+            return {'jsonrpc': '2.0', 'id': 0, 'error': {'code': -32000, 'message': str(result)}}
+        return {'jsonrpc': '2.0', 'id': 0, 'result': result}
+
+    def isConnected(self):
+        return True
+
+
+@pytest.fixture
+def fake_web3():
+    """
+    Yield a function creating a `Web3` whose node is a `handler(method, params)` function.
+    """
+    def make(handler):
+        return web3.Web3(FakeProvider(handler))
+    yield make
+
+
+def _selector(signature):
+    return web3.Web3.keccak(text=signature)[:4].hex()
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, (tuple, list)):
+        return b''.join(_encode(item) for item in value)
+    if isinstance(value, str):
+        return bytes(12) + bytes.fromhex(value[2:])
+    return int(value).to_bytes(32, 'big')
+
+
+class FakeChain:
+    """
+    A node holding ERC20 balances, allowances and supplies, UniswapV2 pair state
+    and any other view results, keyed by checksum address. `views[(address,
+    signature)]` is a value, or a function of the call's argument words.
+    """
+    def __init__(self):
+        self.block_number = 16
+        self.timestamp = 1000
+        self.block_hash = '0x' + '00' * 31 + '10'
+        self.eth = {}
+        self.nonces = {}
+        self.gas_estimate = 100_000
+        self.code = set()
+        self.balances = {}
+        self.allowances = {}
+        self.supply = {}
+        self.decimals = {}
+        self.reserves = {}
+        self.k_last = {}
+        self.views = {}
+        self.__selectors = {}
+
+    def erc20(self, token, decimals=18):
+        self.code.add(token)
+        self.decimals[token] = decimals
+        self.supply.setdefault(token, 0)
+        return token
+
+    def mint(self, token, account, amount):
+        self.balances[(token, account)] = self.balances.get((token, account), 0) + amount
+        self.supply[token] = self.supply.get(token, 0) + amount
+
+    def pair(self, pair, reserve0, reserve1, supply, k_last=0):
+        self.code.add(pair)
+        self.reserves[pair] = (reserve0, reserve1)
+        self.k_last[pair] = k_last
+        self.supply[pair] = supply
+        self.decimals[pair] = 18
+
+    def __call(self, to, data):
+        selector, words = data[:10], bytes.fromhex(data[10:])
+        args = [words[i:i + 32] for i in range(0, len(words), 32)]
+        address = lambda word: web3.Web3.toChecksumAddress('0x' + word[12:].hex())
+        if selector == _selector('balanceOf(address)') and to in self.supply:
+            return _encode(self.balances.get((to, address(args[0])), 0))
+        if selector == _selector('allowance(address,address)') and to in self.supply:
+            return _encode(self.allowances.get((to, address(args[0]), address(args[1])), 0))
+        if selector == _selector('totalSupply()') and to in self.supply:
+            return _encode(self.supply[to])
+        if selector == _selector('decimals()') and to in self.decimals:
+            return _encode(self.decimals[to])
+        if selector == _selector('getReserves()') and to in self.reserves:
+            return _encode(self.reserves[to] + (self.timestamp,))
+        if selector == _selector('kLast()') and to in self.k_last:
+            return _encode(self.k_last[to])
+        for (view_address, signature), value in self.views.items():
+            if view_address == to and _selector(signature) == selector:
+                return _encode(value(*args) if callable(value) else value)
+        raise ValueError('execution reverted')
+
+    def handler(self, method, params):
+        if method == 'eth_chainId':
+            return '0x1'
+        if method == 'eth_blockNumber':
+            return hex(self.block_number)
+        if method == 'eth_getBlockByNumber':
+            return {'number': hex(self.block_number), 'hash': self.block_hash, 'timestamp': hex(self.timestamp), 'transactions': []}
+        if method == 'eth_getCode':
+            return '0x6080' if web3.Web3.toChecksumAddress(params[0]) in self.code else '0x'
+        if method == 'eth_getBalance':
+            return hex(self.eth.get(web3.Web3.toChecksumAddress(params[0]), 0))
+        if method == 'eth_getTransactionCount':
+            return hex(self.nonces.get(web3.Web3.toChecksumAddress(params[0]), 0))
+        if method == 'eth_estimateGas':
+            return hex(self.gas_estimate)
+        if method == 'eth_call':
+            try:
+                return '0x' + self.__call(web3.Web3.toChecksumAddress(params[0]['to']), params[0]['data']).hex()
+            except ValueError as exc:
+                return exc
+        raise ValueError(method, params)
+
+
+@pytest.fixture
+def fake_chain(fake_web3):
+    """
+    Yield a `FakeChain` and a `Web3` connected to it.
+    """
+    chain = FakeChain()
+    yield chain, fake_web3(chain.handler)
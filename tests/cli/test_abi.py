@@ -0,0 +1,59 @@
+import json
+import pytest
+from common import abi
+
+FUTURE_TOKEN = '0x' + '11' * 20
+ABI = [{'type': 'function', 'name': 'instanceType', 'stateMutability': 'view', 'inputs': [], 'outputs': [{'name': '', 'type': 'uint8'}]}]
+
+
+@pytest.fixture
+def deployments(tmp_path, monkeypatch):
+    """
+    Point the deployment index at a dev deployment of a single FutureToken.
+    """
+    (tmp_path / 'dev').mkdir()
+    (tmp_path / 'map.json').write_text(json.dumps({'dev': {'FutureToken': [FUTURE_TOKEN]}}))
+    (tmp_path / 'dev' / f'{FUTURE_TOKEN}.json').write_text(json.dumps({'abi': ABI, 'deployedBytecode': '0x00'}))
+    monkeypatch.setattr(abi, '_DEPLOY_PATH', tmp_path)
+    monkeypatch.setattr(abi, '_INDEX_PATH', tmp_path / 'index.json')
+    monkeypatch.setattr(abi, '_DEPLOYMENT_INDEX', None)
+    yield tmp_path
+
+
+def test_failed_instance_type_is_retried(fake_web3, deployments, monkeypatch):
+    node = {'up': False}
+    def handler(method, params):
+        assert method == 'eth_call', method
+        return '0x' + (1).to_bytes(32, 'big').hex() if node['up'] else ValueError('node down')
+    w3 = fake_web3(handler)
+    assert abi.find_deployments(w3, 'FutureToken', abi.InstanceType.BASE) == []
+
+    # Asked again on the next call, although the index is already loaded
+    calls = len(w3.provider.requests)
+    assert abi.find_deployments(w3, 'FutureToken', abi.InstanceType.BASE) == []
+    assert len(w3.provider.requests) == calls + 1
+    node['up'] = True
+    contract, = abi.find_deployments(w3, 'FutureToken', abi.InstanceType.BASE)
+    assert contract.address == w3.toChecksumAddress(FUTURE_TOKEN)
+    assert json.loads((deployments / 'index.json').read_text())['contracts'][FUTURE_TOKEN]['instanceType'] == 1
+
+    # Once resolved it is not asked again, from memory or from disk
+    calls = len(w3.provider.requests)
+    assert len(abi.find_deployments(w3, 'FutureToken', abi.InstanceType.BASE)) == 1
+    monkeypatch.setattr(abi, '_DEPLOYMENT_INDEX', None)
+    assert len(abi.find_deployments(w3, 'FutureToken', abi.InstanceType.BASE)) == 1
+    assert len(w3.provider.requests) == calls
+
+
+def test_failed_instance_type_is_retried_from_disk(fake_web3, deployments, monkeypatch):
+    node = {'up': False}
+    def handler(method, params):
+        return '0x' + (3).to_bytes(32, 'big').hex() if node['up'] else ValueError('node down')
+    w3 = fake_web3(handler)
+    assert abi.find_deployments(w3, 'FutureToken', abi.InstanceType.SHORT) == []
+    assert json.loads((deployments / 'index.json').read_text())['contracts'][FUTURE_TOKEN]['instanceType'] is None
+
+    # A new process loads the saved index and asks again
+    node['up'] = True
+    monkeypatch.setattr(abi, '_DEPLOYMENT_INDEX', None)
+    assert len(abi.find_deployments(w3, 'FutureToken', abi.InstanceType.SHORT)) == 1
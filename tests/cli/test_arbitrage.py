@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+import web3
+from common import arbitrage, futures, uniswap
+
+GAMMA = arbitrage.GAMMA
+FACTORY = web3.main.to_checksum_address('0x' + 'fa' * 20)
+CTOKEN = '0x1111111111111111111111111111111111111111'
+LONG = '0x2222222222222222222222222222222222222222'
+SHORT = '0x3333333333333333333333333333333333333333'
+CLASS = '0x4444444444444444444444444444444444444444'
+E = 10**18
+
+
+def _swap(a, reserve_in, reserve_out):
+    return GAMMA * a * reserve_out / (reserve_in + GAMMA * a)
+
+
+def _brute_force(profit, high, points=400_001):
+    amounts = np.linspace(0.0, high, points)
+    profits = profit(amounts)
+    best = int(np.argmax(profits))
+    return amounts[best], profits[best]
+
+
+def test_cycle_amount_in():
+    pools = [(7.0, 1000.0), (1000.0, 1500.0), (1000.0, 5.0)]
+    amount = float(arbitrage.cycle_amount_in([(np.array([r_in]), np.array([r_out])) for r_in, r_out in pools])[0])
+    def profit(a):
+        out = a
+        for reserve_in, reserve_out in pools:
+            out = _swap(out, reserve_in, reserve_out)
+        return out - a
+    best, best_profit = _brute_force(profit, 1.0)
+    assert abs(amount - best) <= 1.0 / 400_000
+    assert profit(amount) >= best_profit
+    # Consistent pools leave nothing to take
+    assert arbitrage.cycle_amount_in([(np.array([5.0]), np.array([1000.0])), (np.array([1000.0]), np.array([1000.0])), (np.array([1000.0]), np.array([5.0]))])[0] == 0
+
+
+def test_mint_sell_amount():
+    (x_long, y_long), (x_short, y_short), factor = (1000.0, 7.0), (1000.0, 5.0), 0.01
+    amount = float(arbitrage.mint_sell_amount((np.array([x_long]), np.array([y_long])), (np.array([x_short]), np.array([y_short])), np.array([factor]))[0])
+    def profit(n):
+        return _swap(n, x_long, y_long) + _swap(n, x_short, y_short) - n * factor
+    best, best_profit = _brute_force(profit, 400.0)
+    assert abs(amount - best) <= 400.0 / 400_000
+    assert profit(amount) >= best_profit
+
+
+def test_buy_redeem_amount():
+    (x_long, y_long), (x_short, y_short), factor = (1000.0, 3.0), (1000.0, 5.0), 0.01
+    amount = float(arbitrage.buy_redeem_amount((np.array([x_long]), np.array([y_long])), (np.array([x_short]), np.array([y_short])), np.array([factor]))[0])
+    def profit(n):
+        cost = lambda reserve_fut, reserve_ctoken: reserve_ctoken * n / (GAMMA * (reserve_fut - n))
+        return n * factor - cost(x_long, y_long) - cost(x_short, y_short)
+    best, best_profit = _brute_force(profit, 500.0)
+    assert abs(amount - best) <= 500.0 / 400_000
+    assert profit(amount) >= best_profit
+
+
+def test_sizes_are_vectorized():
+    # The second series is priced consistently with its factor
+    long_ctoken = np.array([1000.0, 1000.0]), np.array([7.0, 5.0])
+    short_ctoken = np.array([1000.0, 1000.0]), np.array([5.0, 5.0])
+    amounts = arbitrage.mint_sell_amount(long_ctoken, short_ctoken, np.array([0.01, 0.01]))
+    assert amounts[0] == arbitrage.mint_sell_amount((long_ctoken[0][:1], long_ctoken[1][:1]), (short_ctoken[0][:1], short_ctoken[1][:1]), np.array([0.01]))[0]
+    assert amounts[1] == 0
+
+
+@pytest.fixture
+def monitor(fake_web3):
+    factor = [0]
+    reserves = {
+        uniswap.calc_pair_address(FACTORY, LONG, CTOKEN): {LONG: 1000 * E, CTOKEN: 7 * E},
+        uniswap.calc_pair_address(FACTORY, SHORT, CTOKEN): {SHORT: 1000 * E, CTOKEN: 5 * E},
+        uniswap.calc_pair_address(FACTORY, LONG, SHORT): {LONG: 1000 * E, SHORT: 1000 * E},
+    }
+    calls = []
+    def handler(method, params):
+        if method == 'eth_chainId':
+            return '0x1'
+        assert method == 'eth_call', method
+        to = web3.main.to_checksum_address(params[0]['to'])
+        calls.append(to)
+        if to == CLASS:
+            return '0x' + factor[0].to_bytes(32, 'big').hex()
+        if to in reserves:
+            token0, token1 = sorted(reserves[to], key=lambda token: bytes.fromhex(token[2:]))
+            return '0x' + b''.join(value.to_bytes(32, 'big') for value in (reserves[to][token0], reserves[to][token1], 0)).hex()
+        # factory()
+        return '0x' + FACTORY[2:].lower().rjust(64, '0')
+    w3 = fake_web3(handler)
+    contract = w3.eth.contract(address=FACTORY, abi=[
+        {'type': 'function', 'name': 'factory', 'stateMutability': 'view', 'inputs': [], 'outputs': [{'name': '', 'type': 'address'}]},
+        {'type': 'function', 'name': 'collateralFactor', 'stateMutability': 'view', 'inputs': [], 'outputs': [{'name': '', 'type': 'uint256'}]},
+    ])
+    class Registry:
+        future_token = contract
+    series = futures.FutureSeries(CTOKEN, 4096 * 100, CLASS, LONG, SHORT)
+    yield arbitrage.ArbitrageMonitor(uniswap.Uniswap(contract, contract), Registry, [series]), factor, calls
+
+
+def test_monitor_mint_sell(monitor):
+    monitor, factor, calls = monitor
+    # Not initialized yet: nothing to trade against
+    assert monitor.poll(16) == []
+    factor[0] = 10**16
+    opportunity, = monitor.poll(17)
+    assert opportunity.kind == arbitrage.MINT_SELL
+    collateral, out_long, out_short = opportunity.amounts
+    # mintPairs rounds the collateral up
+    assert collateral == -(-opportunity.amount * factor[0] // E)
+    assert out_long == uniswap.get_amount_out(opportunity.amount, 1000 * E, 7 * E)
+    assert out_short == uniswap.get_amount_out(opportunity.amount, 1000 * E, 5 * E)
+    assert opportunity.profit == out_long + out_short - collateral
+    # No whole number of pairs around the size found pays more
+    profit = lambda n: uniswap.get_amount_out(n * E, 1000 * E, 7 * E) + uniswap.get_amount_out(n * E, 1000 * E, 5 * E) - n * factor[0]
+    assert opportunity.profit >= max(profit(n) for n in range(1, 400))
+
+    # The factor is fixed once set, so it is not read again
+    del calls[:]
+    monitor.poll(18)
+    assert CLASS not in calls
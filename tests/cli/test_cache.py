@@ -0,0 +1,64 @@
+from common import cache, rpc
+
+PAIR = '0x' + '11' * 20
+ABI = [{'type': 'function', 'name': 'getReserves', 'stateMutability': 'view', 'inputs': [], 'outputs': [
+    {'name': 'reserve0', 'type': 'uint112'}, {'name': 'reserve1', 'type': 'uint112'}, {'name': 'blockTimestampLast', 'type': 'uint32'},
+]}]
+
+
+def _word(value):
+    return value.to_bytes(32, 'big').hex()
+
+
+def _node(fake_web3):
+    """
+    Yield a fake node whose reserves and block hashes can be changed under the cache.
+    """
+    node = {'reserve': 1, 'head': 5, 'hash': '0x' + 'aa' * 32}
+    def handler(method, params):
+        if method == 'eth_blockNumber':
+            return hex(node['head'])
+        if method == 'eth_getBlockByNumber':
+            return {'number': hex(node['head']), 'hash': node['hash'], 'timestamp': '0x0', 'transactions': []}
+        assert method == 'eth_call', method
+        return '0x' + _word(node['reserve']) * 2 + _word(0)
+    w3 = fake_web3(handler)
+    cache.install(w3)
+    return w3, node, w3.eth.contract(address=w3.toChecksumAddress(PAIR), abi=ABI).functions.getReserves()
+
+
+def _calls(w3):
+    return sum(method == 'eth_call' for method, _ in w3.provider.requests)
+
+
+def test_call_cached_by_block(fake_web3):
+    w3, node, function = _node(fake_web3)
+    assert rpc.batch_call(w3, [function], 5) == [[1, 1, 0]]
+    node['reserve'] = 2
+    assert rpc.batch_call(w3, [function], 5) == [[1, 1, 0]]
+    assert rpc.batch_call(w3, [function], 'latest') == [[2, 2, 0]]
+    assert _calls(w3) == 2
+
+
+def test_new_hash_at_same_height_drops_calls(fake_web3):
+    w3, node, function = _node(fake_web3)
+    w3.eth.get_block('latest')
+    assert rpc.batch_call(w3, [function], 5) == [[1, 1, 0]]
+    # Same block again: still cached
+    rpc.batch_request(w3, [('eth_getBlockByNumber', ('latest', False))])
+    assert rpc.batch_call(w3, [function], 5) == [[1, 1, 0]]
+    assert _calls(w3) == 1
+    # Reverted and mined again at the same height
+    node['reserve'], node['hash'] = 2, '0x' + 'bb' * 32
+    w3.eth.get_block('latest')
+    assert rpc.batch_call(w3, [function], 5) == [[2, 2, 0]]
+    assert _calls(w3) == 2
+
+
+def test_head_going_back_drops_calls(fake_web3):
+    w3, node, function = _node(fake_web3)
+    assert rpc.batch_call(w3, [function], 5) == [[1, 1, 0]]
+    node['reserve'], node['head'] = 2, 4
+    assert w3.eth.block_number == 4
+    assert rpc.batch_call(w3, [function], 5) == [[2, 2, 0]]
+    assert _calls(w3) == 2
@@ -0,0 +1,37 @@
+import web3
+from common import clones
+
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+IMPLEMENTATION = '0xbEbEbEbEbEbebebEbeBEBEBEBeBebebEBEBEBEbE'
+
+
+def _keccak(data):
+    return web3.main.eth_utils_keccak(data)
+
+
+def test_create2_address():
+    # Examples from EIP-1014
+    assert clones.create2_address(ZERO_ADDRESS, bytes(32), _keccak(bytes.fromhex('00'))) == '0x4D1A2e2bB4F88F0250f26Ffff098B0b30B26BF38'
+    assert clones.create2_address('0xdeadbeef00000000000000000000000000000000', bytes(32), _keccak(bytes.fromhex('00'))) == '0xB928f69Bb1D91Cd65274e3c79d8986362984fDA3'
+    assert clones.create2_address(
+        '0x00000000000000000000000000000000deadbeef',
+        bytes.fromhex('00000000000000000000000000000000000000000000000000000000cafebabe'),
+        _keccak(bytes.fromhex('deadbeef')),
+    ) == '0x60f3f640a8508fC6a86d45DF051962668E1e8AC7'
+    assert clones.create2_address(ZERO_ADDRESS, bytes(32), _keccak(b'')) == '0xE33C0C7F7df4809055C3ebA6c09CFe4BaF1BD9e0'
+
+
+def test_clone_init_code_hash():
+    # Creation code of the EIP-1167 minimal proxy for 0xbebe...be, as given in the EIP
+    code = bytes.fromhex('3d602d80600a3d3981f3363d3d373d3d3d363d73bebebebebebebebebebebebebebebebebebebebe5af43d82803e903d91602b57fd5bf3')
+    assert clones.clone_init_code_hash(IMPLEMENTATION) == _keccak(code)
+
+
+def test_predict_deterministic_address():
+    salt = bytes(31) + b'\x01'
+    init_code_hash = clones.clone_init_code_hash(IMPLEMENTATION)
+    # Without a deployer the implementation deploys its own clones, as Clones.cloneDeterministic
+    assert clones.predict_deterministic_address(IMPLEMENTATION, salt) == clones.create2_address(IMPLEMENTATION, salt, init_code_hash)
+    deployer = '0x00000000000000000000000000000000deadbeef'
+    assert clones.predict_deterministic_address(IMPLEMENTATION, salt, deployer) == clones.create2_address(deployer, salt, init_code_hash)
+    assert clones.predict_deterministic_address(IMPLEMENTATION, salt) != clones.predict_deterministic_address(IMPLEMENTATION, bytes(32))
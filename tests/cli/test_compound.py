@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+import pytest
+import web3
+from common import compound
+from common.compound import CTokenState
+
+INTERFACES = Path(__file__).resolve().parent.parent.parent / 'interfaces'
+CUSDC = '0x39AA39c021dfbaE8faC545936693aC917d5E7563'
+POW_10_18 = 10**18
+
+# 6000 USDC of cash, 4000 borrowed at 2e10 per block, 1000 of reserves, a 10%
+# reserve factor and 50000 cUSDC outstanding, last accrued at block 10
+STATE = CTokenState(
+    block_number=16,
+    exchange_rate_stored=0,
+    accrual_block_number=10,
+    borrow_rate=2 * 10**10,
+    total_borrows=4 * 10**12,
+    total_reserves=10**9,
+    cash=6 * 10**12,
+    total_supply=5 * 10**13,
+    reserve_factor=10**17,
+)
+
+
+def test_accrue_zero_blocks():
+    state = STATE._replace(exchange_rate_stored=123)
+    assert compound.accrue(state, 10) == state._replace(block_number=10)
+    with pytest.raises(AssertionError):
+        compound.accrue(state, 9)
+
+
+def test_accrue_many_blocks():
+    state = compound.accrue(STATE, 1010)
+    # 1000 blocks at 2e10: a factor of 2e13, so 4e12 * 2e13 / 1e18 = 8e7 of interest
+    # and 8e6 of it to reserves
+    assert state.total_borrows == 4_000_080_000_000
+    assert state.total_reserves == 1_008_000_000
+    assert state.accrual_block_number == state.block_number == 1010
+    # (6e12 + 4000080000000 - 1008000000) * 1e18 / 5e13
+    assert state.exchange_rate_stored == 199_981_440_000_000_000
+    assert (state.cash, state.total_supply) == (STATE.cash, STATE.total_supply)
+
+
+def test_accrue_truncates():
+    # 3 blocks at 1 wei on 1e17 of borrows is 0.3 of interest, which truncates to 0
+    state = compound.accrue(STATE._replace(borrow_rate=1, total_borrows=10**17), 13)
+    assert state.total_borrows == 10**17
+    assert state.exchange_rate_stored == (6 * 10**12 + 10**17 - 10**9) * POW_10_18 // (5 * 10**13)
+
+
+def test_accrue_no_supply():
+    # Without any cTokens the exchange rate stays the initial one
+    initial = 2 * 10**14
+    state = compound.accrue(STATE._replace(exchange_rate_stored=initial, total_supply=0), 1010)
+    assert state.exchange_rate_stored == initial
+    assert state.total_borrows == 4_000_080_000_000
+
+
+def test_ctoken_model(fake_chain):
+    chain, w3 = fake_chain
+    path, = INTERFACES.glob(f'mainnet.{CUSDC.lower()}.*.abi')
+    with path.open() as fd:
+        abi = json.load(fd)
+    views = {
+        'exchangeRateStored()': 199_980_000_000_000_000,
+        'accrualBlockNumber()': STATE.accrual_block_number,
+        'borrowRatePerBlock()': STATE.borrow_rate,
+        'totalBorrows()': STATE.total_borrows,
+        'totalReserves()': STATE.total_reserves,
+        'getCash()': STATE.cash,
+        'totalSupply()': STATE.total_supply,
+        'reserveFactorMantissa()': STATE.reserve_factor,
+    }
+    for signature, value in views.items():
+        chain.views[(CUSDC, signature)] = value
+    model = compound.CTokenModel(w3.eth.contract(address=CUSDC, abi=abi))
+    assert model.state == STATE._replace(exchange_rate_stored=views['exchangeRateStored()'])
+    # Read at block 16, 6 blocks after the last accrual: 4e12 * 1.2e11 / 1e18 = 480000
+    rate = (6 * 10**12 + 4 * 10**12 + 480_000 - 10**9 - 48_000) * POW_10_18 // (5 * 10**13)
+    assert model.exchange_rate() == rate
+    assert model.exchange_rate(1010) == 199_981_440_000_000_000
+    assert model.to_underlying(10**8) == 10**8 * rate // POW_10_18
+    assert model.to_ctoken(10**6) == 10**6 * POW_10_18 // rate
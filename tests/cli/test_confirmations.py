@@ -0,0 +1,151 @@
+import pytest
+from common.confirmations import ConfirmationTracker, TxState
+
+SENDER = '0xaAaAaAaaAaAaAaaAaAAAAAAAAaaaAaAaAaaAaaAa'
+TX1, TX2, TX3 = ('0x' + f'{i:02x}' * 32 for i in (1, 2, 3))
+NONCES = {TX1: 1, TX2: 2, TX3: 2}
+
+
+class FakeChain:
+    """
+    Blocks by hash and the canonical chain by number, served as a node with a
+    'latest' block filter.
+    """
+    def __init__(self):
+        self.blocks = {}
+        self.canonical = []
+        self.new_heads = []
+        self.pool = set()
+        self.mine([])
+
+    def mine(self, txs, parent=None, tag=''):
+        number = 0 if parent is None and not self.canonical else self.blocks[parent or self.canonical[-1]]['number'] + 1
+        parent = parent or (self.canonical[-1] if self.canonical else '0x' + '00' * 32)
+        block_hash = '0x' + f'{number:08x}{len(self.blocks):08x}'.rjust(64, 'f' if tag else 'e')
+        self.blocks[block_hash] = {'number': number, 'hash': block_hash, 'parentHash': parent, 'transactions': list(txs)}
+        del self.canonical[number:]
+        self.canonical.append(block_hash)
+        self.new_heads.append(block_hash)
+        return block_hash
+
+    def __format(self, block):
+        return dict(block, number=hex(block['number']), transactions=[
+            {'hash': tx, 'from': SENDER, 'nonce': hex(NONCES[tx])} for tx in block['transactions']
+        ])
+
+    def __inclusion(self, tx_hash):
+        for block_hash in self.canonical:
+            if tx_hash in self.blocks[block_hash]['transactions']:
+                return self.blocks[block_hash]
+        return None
+
+    def handler(self, method, params):
+        if method == 'eth_newBlockFilter':
+            self.new_heads = []
+            return '0x1'
+        if method == 'eth_getFilterChanges':
+            heads, self.new_heads = self.new_heads, []
+            return heads
+        if method == 'eth_getBlockByNumber':
+            return self.__format(self.blocks[self.canonical[-1]])
+        if method == 'eth_getBlockByHash':
+            block = self.blocks.get(params[0])
+            return None if block is None else self.__format(block)
+        block = self.__inclusion(params[0])
+        if method == 'eth_getTransactionByHash':
+            if block is None and params[0] not in self.pool:
+                return None
+            reply = {'hash': params[0], 'from': SENDER, 'nonce': hex(NONCES[params[0]]), 'blockHash': None, 'blockNumber': None}
+            if block is not None:
+                reply.update(blockHash=block['hash'], blockNumber=hex(block['number']))
+            return reply
+        if method == 'eth_getTransactionReceipt':
+            if block is None:
+                return None
+            return {'transactionHash': params[0], 'blockHash': block['hash'], 'blockNumber': hex(block['number']), 'status': '0x1'}
+        raise ValueError(method)
+
+
+@pytest.fixture
+def chain_and_tracker(fake_web3):
+    chain = FakeChain()
+    events = []
+    tracker = ConfirmationTracker(
+        fake_web3(chain.handler),
+        confirmations=3,
+        dropped_after=5,
+        on_final=lambda tx, receipt: events.append(('final', tx.tx_hash, tx.block_number)),
+        on_dropped=lambda tx: events.append(('dropped', tx.tx_hash)),
+        on_replaced=lambda tx: events.append(('replaced', tx.tx_hash, tx.replaced_by)),
+        on_reorg=lambda fork_number, depth: events.append(('reorg', fork_number, depth)),
+    )
+    yield chain, tracker, events
+
+
+def test_final_after_confirmations(chain_and_tracker):
+    chain, tracker, events = chain_and_tracker
+    chain.pool.add(TX1)
+    tracker.track([TX1])
+    chain.mine([TX1])
+    tracker.poll()
+    assert tracker.transactions[TX1].state == TxState.INCLUDED
+    chain.mine([])
+    tracker.poll()
+    assert events == []
+    chain.mine([])
+    assert tracker.poll() == 1
+    assert events == [('final', TX1, 1)]
+    assert tracker.transactions == {}
+
+
+def test_reorg_and_replacement(chain_and_tracker):
+    chain, tracker, events = chain_and_tracker
+    chain.pool.update((TX1, TX2))
+    genesis = chain.canonical[0]
+    tracker.track([TX1, TX2])
+    chain.mine([TX1])
+    tracker.poll()
+    # A branch without TX1 and with TX3 replacing TX2 overtakes it
+    chain.mine([], parent=chain.mine([TX3], parent=genesis, tag='x'), tag='x')
+    tracker.poll()
+    assert events == [('reorg', 1, 1)]
+    assert tracker.transactions[TX1].state == TxState.PENDING
+    assert tracker.transactions[TX2].replaced_by == TX3
+    chain.mine([TX1])
+    tracker.poll()
+    chain.mine([])
+    chain.mine([])
+    tracker.poll()
+    assert events[1:] == [('replaced', TX2, TX3), ('final', TX1, 3)]
+
+
+def test_dropped(chain_and_tracker):
+    chain, tracker, events = chain_and_tracker
+    chain.pool.add(TX1)
+    tracker.track([TX1])
+    chain.pool.discard(TX1)
+    for _ in range(5):
+        chain.mine([])
+        tracker.poll()
+    assert events == [('dropped', TX1)]
+
+
+def test_included_before_track_then_orphaned(chain_and_tracker):
+    chain, tracker, events = chain_and_tracker
+    genesis = chain.canonical[0]
+    chain.mine([TX1])
+    chain.mine([])
+    # Tracked when already included one block below the head
+    tx, = tracker.track([TX1])
+    assert (tx.state, tx.block_number) == (TxState.INCLUDED, 1)
+    # The block that included it is orphaned
+    fork = chain.mine([], parent=genesis, tag='x')
+    chain.mine([], parent=chain.mine([], parent=fork, tag='x'), tag='x')
+    tracker.poll()
+    assert events == [('reorg', 1, 2)]
+    assert tracker.transactions[TX1].state == TxState.PENDING
+    chain.mine([TX1])
+    for _ in range(3):
+        chain.mine([])
+        tracker.poll()
+    assert events[1:] == [('final', TX1, 4)]
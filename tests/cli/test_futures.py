@@ -0,0 +1,65 @@
+from fractions import Fraction
+import eth_abi.packed
+import web3
+from common import futures
+from common.abi import InstanceType
+
+FUTURE_TOKEN = '0x1000000000000000000000000000000000000001'
+CUSDC = '0x39AA39c021dfbaE8faC545936693aC917d5E7563'
+CDAI = '0x5d3a536E4D6DbD6114cc1Ead35777bAB948E3643'
+# Collateral factor of one 4096 block interval, ~25.8% a year over 2,102,400 blocks
+FACTOR_PER_INTERVAL = 502648401826484
+
+
+def test_calc_expiry_block():
+    assert futures.calc_expiry_block(1) == 4096
+    assert futures.calc_expiry_block(4096) == 4096
+    assert futures.calc_expiry_block(4097) == 8192
+    assert list(futures.calc_expiry_blocks(4097, 16384)) == [8192, 12288, 16384]
+    assert list(futures.calc_expiry_blocks(4097, 8191)) == []
+
+
+def test_calc_collateral_factor():
+    assert FACTOR_PER_INTERVAL == int(Fraction(10**18) * 4096 * Fraction('0.258') / 2_102_400)
+    assert futures.calc_collateral_factor(8192, 0) == 2 * FACTOR_PER_INTERVAL
+    assert futures.calc_collateral_factor(8192, 4095) == 2 * FACTOR_PER_INTERVAL
+    assert futures.calc_collateral_factor(8192, 4096) == FACTOR_PER_INTERVAL
+    assert futures.calc_collateral_factor(8192, 8191) == FACTOR_PER_INTERVAL
+    assert futures.calc_collateral_factor(8192, 8192) == 0
+    assert futures.calc_collateral_factor(8192, 9000) == 0
+
+
+def test_calc_settle_value_long_short():
+    create_price = 2 * 10**16
+    # Below the creation price the short takes everything, above its cap the long does
+    assert futures.calc_settle_value_long_short(8192, 4096, create_price - 1, create_price) == (0, FACTOR_PER_INTERVAL)
+    assert futures.calc_settle_value_long_short(8192, 4096, create_price * 2, create_price) == (FACTOR_PER_INTERVAL, 0)
+    # 0.01% up
+    assert futures.calc_settle_value_long_short(8192, 4096, create_price + create_price // 10_000, create_price) == (10**14, FACTOR_PER_INTERVAL - 10**14)
+
+
+def test_calc_address_salt():
+    # keccak256(abi.encodePacked(ctoken, expiry_block, uint8(instance_type)))
+    packed = eth_abi.packed.encode_packed(['address', 'uint256', 'uint8'], [CUSDC, 8192, 4])
+    assert len(packed) == 20 + 32 + 1
+    assert futures.calc_address_salt(CUSDC, 8192, InstanceType.CLASS) == web3.main.eth_utils_keccak(packed)
+
+
+def test_registry_discover(fake_web3):
+    existing = futures.FutureTokenRegistry(web3.Web3().eth.contract(address=FUTURE_TOKEN, abi=[])).predict(CUSDC, 8192)
+    deployed = {existing.fut_class, existing.fut_long, existing.fut_short}
+    w3 = fake_web3(lambda method, params: '0x3d' if params[0] in deployed else '0x')
+    registry = futures.FutureTokenRegistry(w3.eth.contract(address=FUTURE_TOKEN, abi=[]))
+
+    found = registry.discover((CUSDC, CDAI), (8192, 12288))
+    assert found == {(CUSDC, 8192): existing}
+    assert [method for method, _ in w3.provider.requests] == ['eth_getCode'] * 12
+    assert registry.series() == [existing]
+
+    # Found series are kept, missing ones are only checked again on refresh
+    del w3.provider.requests[:]
+    assert registry.find(CUSDC, 8192) == existing
+    assert registry.find(CDAI, 8192) is None
+    assert w3.provider.requests == []
+    assert registry.find(CDAI, 8192, refresh=True) is None
+    assert len(w3.provider.requests) == 3
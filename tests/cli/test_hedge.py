@@ -0,0 +1,77 @@
+import inspect
+import pytest
+from common import hedge, uniswap
+from common.proxy_wallet import NO_SLIPPAGE_LIMIT, PricingData, ProxyWallet
+
+E = 10**18
+CTOKEN = '0x' + '11' * 20
+TOKEN = '0x' + '22' * 20
+# Reserves of the short future pair: 0.4 ctoken per future
+RESERVE_CTOKEN, RESERVE_FUT = 400 * E, 1_000 * E
+
+
+def _pricing(reserve_ctoken=RESERVE_CTOKEN, reserve_fut=RESERVE_FUT, exchange_rate=2 * E // 100):
+    zero = '0x' + '00' * 20
+    return PricingData(exchange_rate, 10_000, 0, 0, reserve_fut, reserve_ctoken, 0, 0, CTOKEN, zero, zero, zero, zero, zero)
+
+
+@pytest.mark.parametrize('reserves', [(400 * E, 1_000 * E), (5 * 10**8, 10**9), (10**6, 10**6 - 1)])
+@pytest.mark.parametrize('max_slippage', [1, 10**15, 10**16, 5 * 10**17, 10**18])
+def test_max_hedge_amount_is_largest_safe(reserves, max_slippage):
+    amount = hedge.max_hedge_amount(*reserves, max_slippage)
+    assert hedge._is_safe_hedge(amount, *reserves, max_slippage)
+    assert not hedge._is_safe_hedge(amount + 1, *reserves, max_slippage)
+
+
+def test_is_safe_hedge():
+    amount = 10 * E
+    amount_in = uniswap.get_amount_in(amount, RESERVE_CTOKEN, RESERVE_FUT)
+    # Slippage of the trade over spot, rounded up as the contract compares it
+    slippage = -(-(amount_in * RESERVE_FUT * E) // (amount * RESERVE_CTOKEN)) - E
+    assert hedge._is_safe_hedge(amount, RESERVE_CTOKEN, RESERVE_FUT, slippage)
+    assert not hedge._is_safe_hedge(amount, RESERVE_CTOKEN, RESERVE_FUT, slippage - 1)
+    # The ctoken budget of 1 per future, whatever the slippage
+    assert not hedge._is_safe_hedge(10 * E, 9 * E, 10 * E, 10**18)
+    assert not hedge._is_safe_hedge(RESERVE_FUT, RESERVE_CTOKEN, RESERVE_FUT, 10**18)
+
+
+def test_plan_hedge():
+    plan = hedge.plan_hedge(_pricing(), 10 * E, CTOKEN, 4096, 100, max_slippage=10**16)
+    assert plan.hedge_amount == 10 * E
+    assert plan.amount_in == uniswap.get_amount_in(10 * E, RESERVE_CTOKEN, RESERVE_FUT)
+    assert plan.indicative_price == 4 * E // 10
+    assert plan.max_hedge_amount == hedge.max_hedge_amount(RESERVE_CTOKEN, RESERVE_FUT, 10**16)
+    assert plan.safe == hedge._is_safe_hedge(10 * E, RESERVE_CTOKEN, RESERVE_FUT, 10**16)
+    # Anything but the ctoken is minted into it first
+    plan = hedge.plan_hedge(_pricing(), 10 * E, TOKEN, 4096, 100, max_slippage=10**16)
+    assert plan.hedge_amount == 10 * E * E // (2 * E // 100)
+
+
+def test_plan_hedge_never_unbounded():
+    # The contract reads 0 as no bound, so 0 is planned as the tightest bound instead
+    plan = hedge.plan_hedge(_pricing(), 10 * E, CTOKEN, 4096, 100, max_slippage=0)
+    assert plan.max_slippage == 1
+    assert not plan.safe
+    # Only the budget of 1 ctoken per future
+    plan = hedge.plan_hedge(_pricing(), 10 * E, CTOKEN, 4096, 100)
+    assert plan.max_slippage == E * E // (4 * E // 10) - E
+
+
+def test_plan_hedge_reference_price():
+    # A reference below spot tightens the limit against spot
+    reference = 38 * E // 100
+    plan = hedge.plan_hedge(_pricing(), 10 * E, CTOKEN, 4096, 100, max_slippage=10**17, reference_price=reference)
+    spot = 4 * E // 10
+    assert plan.max_slippage == reference * (E + 10**17) // spot - E
+    # The bound on the average price is the same whether stated against the reference or spot
+    assert abs(spot * (E + plan.max_slippage) - reference * (E + 10**17)) < spot
+    # A reference so far below spot that no trade is within the limit leaves the tightest bound
+    plan = hedge.plan_hedge(_pricing(), 10 * E, CTOKEN, 4096, 100, max_slippage=10**16, reference_price=spot // 2)
+    assert plan.max_slippage == 1
+    assert not plan.safe
+
+
+def test_wallet_slippage_is_explicit():
+    for name in ('depositAndHedge', 'depositAndHedgeMany'):
+        assert inspect.signature(getattr(ProxyWallet, name)).parameters['max_slippage'].default is inspect.Parameter.empty
+    assert NO_SLIPPAGE_LIMIT == 0
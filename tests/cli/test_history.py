@@ -0,0 +1,125 @@
+import math
+import numpy as np
+import pytest
+import web3
+from common import history, uniswap
+from common.history import SeriesStore
+
+PAIR = web3.Web3.toChecksumAddress('0x' + '30' * 20)
+
+
+def _rows(blocks, timestamps, reserve1):
+    count = len(blocks)
+    return blocks, timestamps, [1000.0] * count, reserve1, [float('nan')] * count
+
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    Yield a store with blocks 10 to 13, 12s apart from timestamp 100, whose price
+    is 1, 2, 3 and then 4.
+    """
+    store = SeriesStore(tmp_path / 'pair', meta={'pair': PAIR})
+    store.append(*_rows([10, 11, 12, 13], [100, 112, 124, 136], [1000.0, 2000.0, 3000.0, 4000.0]))
+    yield store
+
+
+def test_append(store, tmp_path):
+    assert len(store) == 4
+    assert store.last_block == 13
+    assert store.meta == {'pair': PAIR}
+    assert list(store.view().price) == [1.0, 2.0, 3.0, 4.0]
+    # A second store on the same directory reads the same rows
+    assert list(SeriesStore(tmp_path / 'pair').view().block) == [10, 11, 12, 13]
+    with pytest.raises(AssertionError):
+        store.append(*_rows([13], [148], [1.0]))
+    with pytest.raises(AssertionError):
+        store.append(*_rows([15, 14], [160, 172], [1.0, 1.0]))
+    assert len(store) == 4
+
+
+def test_torn_append(store):
+    # An append interrupted halfway through the third row of one column
+    path = store.path / 'reserve1.bin'
+    with path.open('r+b') as fd:
+        fd.truncate(2 * 8 + 4)
+    assert len(store) == 2
+    assert store.last_block == 11
+    assert list(store.view().price) == [1.0, 2.0]
+    # The next append drops the partial row and the rows other columns got past it
+    store.append(*_rows([12], [124], [5000.0]))
+    assert len(store) == 3
+    for name, dtype in history.COLUMNS:
+        assert (store.path / f'{name}.bin').stat().st_size == 3 * np.dtype(dtype).itemsize
+    view = store.view()
+    assert list(view.block) == [10, 11, 12]
+    assert list(view.timestamp) == [100, 112, 124]
+    assert list(view.price) == [1.0, 2.0, 5.0]
+
+
+def test_ranges(store):
+    assert list(store.time_range(112, 136).timestamp) == [112, 124]
+    assert list(store.time_range(113, 137).timestamp) == [124, 136]
+    assert list(store.time_range(end_timestamp=100).timestamp) == []
+    assert list(store.time_range(136).timestamp) == [136]
+    assert list(store.block_range(11, 12).block) == [11, 12]
+    assert list(store.block_range(12).block) == [12, 13]
+    assert list(store.block_range(last_block=9).block) == []
+    assert store.at(99) is None
+    assert store.at(100) == 0
+    assert store.at(123) == 1
+
+
+def test_twap(store):
+    # Price 1 from 106 to 112, 2 until 124 and 3 until 130
+    assert store.twap(106, 130) == pytest.approx((1 * 6 + 2 * 12 + 3 * 6) / 24)
+    # A window starting on a row starts with that row
+    assert store.twap(112, 124) == pytest.approx(2.0)
+    # Before the first row only the time after it counts
+    assert store.twap(50, 112) == pytest.approx(1.0)
+    # The last row holds until the end of the window
+    assert store.twap(136, 200) == pytest.approx(4.0)
+    assert math.isnan(store.twap(10, 50))
+
+
+def _sync(block, log_index, reserve0, reserve1):
+    return {
+        'address': PAIR,
+        'topics': [history.SYNC_TOPIC],
+        'data': '0x' + reserve0.to_bytes(32, 'big').hex() + reserve1.to_bytes(32, 'big').hex(),
+        'blockNumber': hex(block),
+        'blockHash': '0x' + f'{block:064x}',
+        'transactionHash': '0x' + f'{block * 100 + log_index:064x}',
+        'transactionIndex': hex(log_index),
+        'logIndex': hex(log_index),
+        'removed': False,
+    }
+
+
+def test_replay(fake_chain, fake_web3, tmp_path):
+    chain, _ = fake_chain
+    logs = [_sync(20, 0, 10, 20), _sync(20, 1, 11, 30), _sync(22, 0, 12, 48), _sync(25, 0, 13, 65)]
+
+    def handler(method, params):
+        if method == 'eth_getLogs':
+            first, last = int(params[0]['fromBlock'], 16), int(params[0]['toBlock'], 16)
+            return [log for log in logs if first <= int(log['blockNumber'], 16) <= last]
+        if method == 'eth_getBlockByNumber' and params[0].startswith('0x'):
+            return {'number': params[0], 'hash': '0x' + f'{int(params[0], 16):064x}', 'timestamp': hex(10 * int(params[0], 16)), 'transactions': []}
+        return chain.handler(method, params)
+
+    w3 = fake_web3(handler)
+    pair = uniswap.UniswapToken(w3.eth.contract(address=PAIR, abi=uniswap._ABI_IUniswapV2Pair))
+    store = SeriesStore(tmp_path / PAIR)
+    recorder = history.Recorder(store, pair)
+    recorder.replay(0, 22)
+    view = store.view()
+    # Only the last Sync of block 20 is its closing state
+    assert list(view.block) == [20, 22]
+    assert list(view.timestamp) == [200, 220]
+    assert list(view.reserve0) == [11.0, 12.0]
+    assert list(view.reserve1) == [30.0, 48.0]
+    assert all(math.isnan(rate) for rate in view.exchange_rate)
+    # Replaying an overlapping range only adds the blocks after the last one stored
+    recorder.replay(20, 30)
+    assert list(store.view().block) == [20, 22, 25]
@@ -0,0 +1,111 @@
+import json
+import math
+from pathlib import Path
+import pytest
+import web3
+from common import liquidity, simulate, uniswap
+
+INTERFACES = Path(__file__).resolve().parent.parent.parent / 'interfaces'
+FACTORY = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
+ROUTER = '0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D'
+WETH = '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2'
+TOKEN_A = web3.Web3.toChecksumAddress('0x' + '10' * 20)
+TOKEN_B = web3.Web3.toChecksumAddress('0x' + '20' * 20)
+TOKEN_C = web3.Web3.toChecksumAddress('0x' + '30' * 20)
+OWNER = web3.Web3.toChecksumAddress('0x' + '11' * 20)
+PAIR = uniswap.calc_pair_address(FACTORY, TOKEN_A, TOKEN_B)
+RESERVES = 1_000 * 10**18, 2_000 * 10**6
+SUPPLY = 40 * 10**12
+E = 10**18
+
+
+def _abi(name):
+    path, = INTERFACES.glob(f'mainnet.*.{name}.abi')
+    with path.open() as fd:
+        return json.load(fd)
+
+
+@pytest.fixture
+def chain(fake_chain):
+    """
+    Yield a chain with an A/B pair and no pair with C, the owner holding all three
+    tokens, and a LiquidityPlanner on it.
+    """
+    chain, w3 = fake_chain
+    chain.views[(ROUTER, 'factory()')] = FACTORY
+    chain.views[(ROUTER, 'WETH()')] = WETH
+    chain.views[(FACTORY, 'feeTo()')] = '0x' + '00' * 20
+    for token, decimals in ((TOKEN_A, 18), (TOKEN_B, 6), (TOKEN_C, 18)):
+        chain.erc20(token, decimals)
+        chain.mint(token, OWNER, 100 * 10**decimals)
+    chain.pair(PAIR, *RESERVES, SUPPLY)
+    chain.mint(TOKEN_A, PAIR, RESERVES[0])
+    chain.mint(TOKEN_B, PAIR, RESERVES[1])
+    router = w3.eth.contract(address=ROUTER, abi=_abi('uniswap-v2-router'))
+    factory = w3.eth.contract(address=FACTORY, abi=_abi('uniswap-v2-factory'))
+    yield chain, w3, liquidity.LiquidityPlanner(uniswap.Uniswap(factory, router))
+
+
+def test_new_pair(chain):
+    _, _, planner = chain
+    plan = planner.plan([liquidity.Allocation(TOKEN_A, TOKEN_C, 4 * E, 9 * E)], OWNER)
+    deposit, = plan.deposits
+    assert deposit.pair == uniswap.calc_pair_address(FACTORY, TOKEN_A, TOKEN_C)
+    assert (deposit.amount_a, deposit.amount_b) == (4 * E, 9 * E)
+    assert deposit.liquidity == math.isqrt(4 * E * 9 * E) - simulate.MINIMUM_LIQUIDITY
+    assert plan.approvals == [liquidity.Approval(TOKEN_A, 4 * E), liquidity.Approval(TOKEN_C, 9 * E)]
+
+
+def test_existing_and_reversed_pair(chain):
+    _, _, planner = chain
+    plan = planner.plan([
+        liquidity.Allocation(TOKEN_A, TOKEN_B, 10 * E, 100 * 10**6),
+        liquidity.Allocation(TOKEN_B, TOKEN_A, 10**6, 50 * E),
+    ], OWNER, max_slippage=10**16)
+    first, second = plan.deposits
+    amount_b = uniswap.quote(10 * E, *RESERVES)
+    assert (first.amount_a, first.amount_b) == (10 * E, amount_b)
+    assert first.liquidity == min(10 * E * SUPPLY // RESERVES[0], amount_b * SUPPLY // RESERVES[1])
+    # The reversed deposit is sized on the reserves the first one leaves
+    amount_a = uniswap.quote(10**6, RESERVES[1] + amount_b, RESERVES[0] + 10 * E)
+    assert (second.pair, second.amount_a, second.amount_b) == (PAIR, 10**6, amount_a)
+    # 1% below each amount
+    assert (first.amount_a_min, first.amount_b_min) == (99 * E // 10, amount_b * 99 // 100)
+    assert (second.amount_a_min, second.amount_b_min) == (10**6 * 99 // 100, amount_a * 99 // 100)
+    # One approval per token for the total of its deposits
+    assert plan.approvals == [liquidity.Approval(TOKEN_A, 10 * E + amount_a), liquidity.Approval(TOKEN_B, amount_b + 10**6)]
+
+
+def test_existing_allowance(chain):
+    chain_, _, planner = chain
+    chain_.allowances[(TOKEN_A, OWNER, ROUTER)] = 2**256 - 1
+    plan = planner.plan([liquidity.Allocation(TOKEN_A, TOKEN_B, 10 * E, 100 * 10**6)], OWNER)
+    assert plan.approvals == [liquidity.Approval(TOKEN_B, uniswap.quote(10 * E, *RESERVES))]
+
+
+def test_insufficient_balance(chain):
+    _, _, planner = chain
+    with pytest.raises(ValueError, match='holds'):
+        planner.plan([liquidity.Allocation(TOKEN_A, TOKEN_C, 101 * E, 9 * E)], OWNER)
+
+
+def test_execute_without_transacting(chain):
+    chain_, _, planner = chain
+    chain_.nonces[OWNER] = 7
+    tx = {'gasPrice': 10**9, 'chainId': 1}
+    plan = planner.plan([liquidity.Allocation(TOKEN_A, TOKEN_B, 10 * E, 100 * 10**6)], OWNER)
+    # Deposits cannot be estimated before the approvals are mined
+    with pytest.raises(ValueError, match='gas limit'):
+        planner.execute(plan, tx=tx)
+    txs = planner.execute(plan, tx=dict(tx, gas=300_000))
+    assert [t['nonce'] for t in txs] == [7, 8, 9]
+    assert [t['to'] for t in txs] == [TOKEN_A, TOKEN_B, ROUTER]
+    assert all(t['gas'] == 300_000 for t in txs)
+
+    # Without approvals the deposits are estimated, with a margin
+    chain_.allowances[(TOKEN_A, OWNER, ROUTER)] = chain_.allowances[(TOKEN_B, OWNER, ROUTER)] = 2**256 - 1
+    chain_.block_number += 1
+    plan = planner.plan([liquidity.Allocation(TOKEN_A, TOKEN_B, 10 * E, 100 * 10**6)], OWNER)
+    tx_, = planner.execute(plan, tx=tx)
+    assert tx_['gas'] == chain_.gas_estimate * liquidity.GAS_MARGIN[0] // liquidity.GAS_MARGIN[1]
+    assert tx_['nonce'] == 7
@@ -0,0 +1,88 @@
+import math
+import numpy as np
+import pytest
+import web3
+from common import lp, uniswap
+
+TOKEN0 = web3.Web3.toChecksumAddress('0x' + '10' * 20)
+TOKEN1 = web3.Web3.toChecksumAddress('0x' + '20' * 20)
+PAIR = web3.Web3.toChecksumAddress('0x' + '30' * 20)
+HOLDER = web3.Web3.toChecksumAddress('0x' + '11' * 20)
+OTHER = web3.Web3.toChecksumAddress('0x' + '22' * 20)
+SUPPLY = 10**14
+# (reserve0, reserve1, kLast) by block, token0 with 18 decimals and token1 with 6:
+# a price of 2, then 8 at the same k, then 8 with k grown 21% by fees since kLast
+STATES = {
+    1: (100 * 10**18, 200 * 10**6, 0),
+    2: (50 * 10**18, 400 * 10**6, 0),
+    3: (55 * 10**18, 440 * 10**6, 20 * 10**27),
+}
+
+
+@pytest.fixture
+def pair(fake_chain, fake_web3):
+    """
+    Yield a pair whose state follows STATES, with HOLDER owning a tenth of its supply
+    and OTHER none of it, and the Web3 provider it reads through.
+    """
+    chain, _ = fake_chain
+    chain.erc20(TOKEN0, 18)
+    chain.erc20(TOKEN1, 6)
+    chain.views[(PAIR, 'token0()')] = TOKEN0
+    chain.views[(PAIR, 'token1()')] = TOKEN1
+
+    def handler(method, params):
+        if method == 'eth_call' and params[1].startswith('0x'):
+            reserve0, reserve1, k_last = STATES[int(params[1], 16)]
+            chain.pair(PAIR, reserve0, reserve1, SUPPLY, k_last)
+            chain.balances[(PAIR, HOLDER)] = SUPPLY // 10
+        return chain.handler(method, params)
+
+    w3 = fake_web3(handler)
+    yield uniswap.UniswapToken(w3.eth.contract(address=PAIR, abi=uniswap._ABI_IUniswapV2Pair)), w3.provider
+
+
+def test_impermanent_loss():
+    assert lp.impermanent_loss(np.array([1.0, 4.0, 0.25])) == pytest.approx([0.0, -0.2, -0.2])
+
+
+def test_protocol_fee_liquidity():
+    reserve = np.array([55.0, 55.0, 50.0])
+    liquidity = lp.protocol_fee_liquidity(reserve, reserve, np.full(3, 65.0), np.array([0.0, 50.0**2, 50.0**2]))
+    # Nothing while the fee is off or k has not grown, otherwise S (rk - rkl) / (5 rk + rkl)
+    assert liquidity == pytest.approx([0.0, 65.0 * 5 / (5 * 55 + 50), 0.0])
+
+
+def test_fetch(pair):
+    pair_, _ = pair
+    pool, positions = lp.LPAnalytics(pair_).fetch([1, 2, 3], [HOLDER, OTHER])
+    assert list(pool.blocks) == [1, 2, 3]
+    assert pool.price * 10**12 == pytest.approx([2.0, 8.0, 8.0])
+    # At block 3 sqrt(k) grew 10% over sqrt(kLast), so the fee mints S * 0.1 / 6.5
+    assert pool.effective_supply == pytest.approx([SUPPLY, SUPPLY, SUPPLY * 66 / 65])
+
+    position = positions[HOLDER]
+    assert position.share == pytest.approx([0.1, 0.1, 0.1 * 65 / 66])
+    assert position.amount0 == pytest.approx([10.0, 5.0, 5.5 * 65 / 66])
+    assert position.amount1 == pytest.approx([20.0, 40.0, 44.0 * 65 / 66])
+    assert position.value == pytest.approx([40.0, 80.0, 88.0 * 65 / 66])
+    # sqrt(k) per effective LP token: flat through the price move, then 1.1 * 65 / 66
+    assert position.fee_growth == pytest.approx([0.0, 0.0, 1 / 12])
+    assert position.impermanent_loss == pytest.approx([0.0, -0.2, -0.2])
+    # Holding 10 and 20 is worth 100 at a price of 8
+    assert position.lp_vs_hold == pytest.approx([0.0, -0.2, 88.0 * 65 / 66 / 100 - 1])
+
+    other = positions[OTHER]
+    assert list(other.share) == [0.0, 0.0, 0.0]
+    assert list(other.value) == [0.0, 0.0, 0.0]
+    assert all(math.isnan(value) for value in other.lp_vs_hold)
+
+
+def test_tokens_memoised(pair):
+    pair_, provider = pair
+    token0 = pair_.token0
+    assert pair_.token0 is token0 and token0.address == TOKEN0
+    assert pair_.token1 is pair_.token1
+    selectors = [params[0]['data'][:10] for method, params in provider.requests if method == 'eth_call']
+    assert selectors.count(web3.Web3.keccak(text='token0()')[:4].hex()) == 1
+    assert selectors.count(web3.Web3.keccak(text='token1()')[:4].hex()) == 1
@@ -0,0 +1,71 @@
+import io
+import json
+from decimal import Decimal
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from common.ndjson import NDJSONWriter
+
+TX_HASH = HexBytes('0x' + 'ab' * 32)
+
+
+def _receipt():
+    log = AttributeDict({
+        'address': '0x' + '11' * 20,
+        'topics': [HexBytes('0x' + '22' * 32)],
+        'data': HexBytes('0x' + '00' * 31 + '07'),
+        'logIndex': 0,
+    })
+    return AttributeDict({
+        'transactionHash': TX_HASH,
+        'blockNumber': 16,
+        'status': 1,
+        'gasUsed': 21000,
+        'logsBloom': HexBytes(bytes(256)),
+        'logs': [log],
+    })
+
+
+def _lines(stream):
+    lines = stream.getvalue().split('\n')
+    assert lines[-1] == ''
+    return [json.loads(line) for line in lines[:-1]]
+
+
+def test_receipt_without_logs():
+    stream = io.StringIO()
+    NDJSONWriter(stream).receipt(_receipt())
+    record, = _lines(stream)
+    assert record == {
+        'type': 'receipt',
+        'transactionHash': '0x' + 'ab' * 32,
+        'blockNumber': 16,
+        'status': 1,
+        'gasUsed': 21000,
+    }
+
+
+def test_receipt_with_logs():
+    stream = io.StringIO()
+    NDJSONWriter(stream, include_logs=True).receipt(_receipt())
+    record, = _lines(stream)
+    assert 'logsBloom' not in record
+    # Nested AttributeDicts and HexBytes are converted as they are encoded
+    assert record['logs'] == [{
+        'address': '0x' + '11' * 20,
+        'topics': ['0x' + '22' * 32],
+        'data': '0x' + '00' * 31 + '07',
+        'logIndex': 0,
+    }]
+
+
+def test_one_object_per_line():
+    stream = io.StringIO()
+    writer = NDJSONWriter(stream)
+    writer.block(16)
+    writer.balance('0x' + '11' * 20, 'USDC', 6, Decimal('1.500000'))
+    writer.write('result', {'id': 1, 'result': {'tokens': {'USDC'}, 'amount': Decimal('0.1'), 'hash': TX_HASH}})
+    block, balance, result = _lines(stream)
+    assert block == {'type': 'block', 'blockNumber': 16}
+    # Decimals keep their exact digits as strings
+    assert balance['balance'] == '1.500000' and balance['token'] is None
+    assert result == {'type': 'result', 'id': 1, 'result': {'tokens': ['USDC'], 'amount': '0.1', 'hash': '0x' + 'ab' * 32}}
@@ -0,0 +1,109 @@
+import json
+from pathlib import Path
+import pytest
+import web3
+from common import pending, uniswap
+
+INTERFACES = Path(__file__).resolve().parent.parent.parent / 'interfaces'
+FACTORY = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
+ROUTER = '0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D'
+USDC = '0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48'
+WETH = '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2'
+USDC_WETH = '0xB4e16d0168e52d35CaCD2c6185b44281Ec28C9Dc'
+RESERVES = 2_000_000 * 10**6, 1_000 * 10**18
+TIMESTAMP = 1_000
+TRADER = '0x1111111111111111111111111111111111111111'
+OTHER = '0x2222222222222222222222222222222222222222'
+
+
+def _abi(name):
+    path, = INTERFACES.glob(f'mainnet.*.{name}.abi')
+    with path.open() as fd:
+        return json.load(fd)
+
+
+def _amount_out(amount_in, reserve_in, reserve_out):
+    return amount_in * 997 * reserve_out // (reserve_in * 1000 + amount_in * 997)
+
+
+@pytest.fixture
+def state(fake_web3):
+    mined = []
+    def handler(method, params):
+        if method == 'eth_chainId':
+            return '0x1'
+        if method == 'eth_getBlockByNumber':
+            return {'number': '0x10', 'timestamp': hex(TIMESTAMP), 'transactions': list(mined)}
+        if method == 'eth_call' and params[0]['to'] == ROUTER and params[0]['data'] == '0xc45a0155': # factory()
+            return '0x' + FACTORY[2:].lower().rjust(64, '0')
+        if method == 'eth_call' and params[0]['to'] == USDC_WETH:
+            return '0x' + b''.join(value.to_bytes(32, 'big') for value in RESERVES + (TIMESTAMP,)).hex()
+        raise ValueError(method, params)
+    w3 = fake_web3(handler)
+    router = w3.eth.contract(address=ROUTER, abi=_abi('uniswap-v2-router'))
+    factory = w3.eth.contract(address=FACTORY, abi=_abi('uniswap-v2-factory'))
+    state = pending.PendingState(uniswap.Uniswap(factory, router), [(WETH, USDC)])
+    state.sync()
+    yield state, router, mined
+
+
+def _swap(router, tx_hash, sender, nonce, gas_price, fn_name, args, value=0):
+    return {
+        'hash': tx_hash, 'from': sender, 'nonce': hex(nonce), 'gasPrice': hex(gas_price),
+        'to': ROUTER, 'value': hex(value), 'input': router.encodeABI(fn_name=fn_name, args=args),
+    }
+
+
+def test_pair_address():
+    assert uniswap.calc_pair_address(FACTORY, WETH, USDC) == USDC_WETH
+
+
+def test_decode_router_transaction(state):
+    _, router, _ = state
+    tx = _swap(router, '0x01', TRADER, 7, 10, 'swapExactETHForTokens', [5, [WETH, USDC], TRADER, 2000], value=3 * 10**18)
+    assert pending.decode_router_transaction(router, tx) == pending.PendingSwap('0x01', TRADER, 7, 10, [WETH, USDC], True, 3 * 10**18, 5, 2000)
+    tx = _swap(router, '0x02', TRADER, 8, 10, 'swapTokensForExactTokens', [10**18, 4000 * 10**6, [USDC, WETH], TRADER, 2000])
+    assert pending.decode_router_transaction(router, tx) == pending.PendingSwap('0x02', TRADER, 8, 10, [USDC, WETH], False, 4000 * 10**6, 10**18, 2000)
+    tx = dict(tx, input=router.encodeABI(fn_name='quote', args=[1, 2, 3]))
+    assert pending.decode_router_transaction(router, tx) is None
+
+
+def test_pending_quotes(state):
+    state, router, mined = state
+    amount_in = 100_000 * 10**6
+    out = _amount_out(amount_in, *RESERVES)
+    assert state.get_amounts_out(10**6, [USDC, WETH], pending=False) == [10**6, _amount_out(10**6, *RESERVES)]
+
+    assert state.add([_swap(router, '0x01', TRADER, 1, 10, 'swapExactTokensForTokens', [amount_in, out, [USDC, WETH], TRADER, 2000])]) == 1
+    projected = RESERVES[0] + amount_in, RESERVES[1] - out
+    assert state.reserves(USDC, WETH) == projected
+    assert state.reserves(WETH, USDC) == projected[::-1]
+    assert state.reserves(USDC, WETH, pending=False) == RESERVES
+    assert state.get_amounts_out(10**6, [USDC, WETH]) == [10**6, _amount_out(10**6, *projected)]
+
+    # Once mined the pending swap is forgotten
+    mined.append('0x01')
+    state.sync()
+    assert state.swaps == {}
+    assert state.reserves(USDC, WETH) == RESERVES
+
+
+def test_pending_order_and_limits(state):
+    state, router, _ = state
+    amount_in = 100_000 * 10**6
+    out = _amount_out(amount_in, *RESERVES)
+    state.add([
+        # Cheaper, and reverts once the other swap has moved the price
+        _swap(router, '0x01', TRADER, 1, 10, 'swapExactTokensForTokens', [amount_in, out, [USDC, WETH], TRADER, 2000]),
+        _swap(router, '0x02', OTHER, 1, 20, 'swapExactTokensForTokens', [amount_in, 0, [USDC, WETH], OTHER, 2000]),
+        # Expired
+        _swap(router, '0x03', OTHER, 2, 30, 'swapExactTokensForTokens', [amount_in, 0, [USDC, WETH], OTHER, TIMESTAMP - 1]),
+    ])
+    assert state.reserves(USDC, WETH) == (RESERVES[0] + amount_in, RESERVES[1] - out)
+
+    # Same sender and nonce replaces the reverting swap with one that goes through
+    state.add([_swap(router, '0x04', TRADER, 1, 15, 'swapExactTokensForTokens', [amount_in, 0, [USDC, WETH], TRADER, 2000])])
+    assert set(state.swaps) == {'0x02', '0x03', '0x04'}
+    reserves = RESERVES[0] + amount_in, RESERVES[1] - out
+    reserves = reserves[0] + amount_in, reserves[1] - _amount_out(amount_in, *reserves)
+    assert state.reserves(USDC, WETH) == reserves
@@ -0,0 +1,92 @@
+import web3
+from common import proxy_wallet
+from common.proxy_wallet import ETH_TOKEN_ADDRESS, HedgeOrder, ProxyWallet
+
+USDC = '0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48'
+DAI = '0x6B175474E89094C44Da98b954EedeAC495271d0F'
+WALLET = '0x1000000000000000000000000000000000000001'
+OWNER = '0x2000000000000000000000000000000000000002'
+ALLOWANCE = web3.main.to_hex(web3.main.eth_utils_keccak(text='allowance(address,address)')[:4])
+MASTER = '0x5FbDB2315678afecb367f032d93F642f64180aa3'
+OWNERS = [
+    '0xf39Fd6e51aad88F6F4ce6aB8827279cffFb92266',
+    '0x70997970C51812dc3A010C7d01b50e0d17dc79C8',
+]
+
+
+def test_calc_wallet_address():
+    # keccak256(0xff ++ master ++ salt ++ keccak256(EIP-1167 creation code for master))[12:],
+    # with the owner as the salt as in ProxyWallet.getWalletAddress
+    assert proxy_wallet.calc_wallet_salt(OWNERS[0]) == bytes(12) + bytes.fromhex(OWNERS[0][2:])
+    assert proxy_wallet.calc_wallet_address(MASTER, OWNERS[0]) == '0x7DdaC1A1A9c18DBFc130BBD4432e60b0a50341B0'
+    assert proxy_wallet.calc_wallet_addresses(MASTER, OWNERS) == dict(
+        (owner, proxy_wallet.calc_wallet_address(MASTER, owner))
+        for owner in OWNERS
+    )
+
+
+def test_wallets_or_null(fake_web3):
+    created = proxy_wallet.calc_wallet_address(MASTER, OWNERS[0])
+    w3 = fake_web3(lambda method, params: '0x363d3d37' if params[0] == created else '0x')
+    master = ProxyWallet(w3.eth.contract(address=MASTER, abi=[]))
+    assert master.walletAddress(OWNERS[0]) == created
+    wallets = master.walletsOrNull(OWNERS, block_identifier=12)
+    assert wallets[OWNERS[0]].address == created
+    assert wallets[OWNERS[1]] is None
+    # One code read per owner pinned to the block, no calls to the master
+    assert w3.provider.requests == [
+        ('eth_getCode', [address, '0xc'])
+        for address in proxy_wallet.calc_wallet_addresses(MASTER, OWNERS).values()
+    ]
+    assert master.walletsOrNull([]) == {}
+
+
+def test_group_orders_makes_tokens_adjacent():
+    orders = [
+        HedgeOrder(USDC.lower(), 1, 10),
+        HedgeOrder(DAI, 2, 20),
+        HedgeOrder(USDC, 3, 30),
+        HedgeOrder(ETH_TOKEN_ADDRESS, 4, 40),
+        HedgeOrder(DAI, 5, 50),
+    ]
+    assert proxy_wallet.group_orders(orders) == [
+        HedgeOrder(USDC, 1, 10),
+        HedgeOrder(USDC, 3, 30),
+        HedgeOrder(DAI, 2, 20),
+        HedgeOrder(DAI, 5, 50),
+        HedgeOrder(ETH_TOKEN_ADDRESS, 4, 40),
+    ]
+    assert proxy_wallet.group_orders([]) == []
+
+
+def _allowance_node(allowances):
+    def handler(method, params):
+        assert method == 'eth_call', method
+        tx, block = params
+        assert tx['data'][:10] == ALLOWANCE
+        assert tx['data'][10:] == OWNER[2:].lower().rjust(64, '0') + WALLET[2:].lower().rjust(64, '0')
+        assert block == 'latest'
+        return '0x' + hex(allowances[web3.main.to_checksum_address(tx['to'])])[2:].rjust(64, '0')
+    return handler
+
+
+def test_approvals_for_orders(fake_web3):
+    w3 = fake_web3(_allowance_node({USDC: 4, DAI: 7}))
+    wallet = ProxyWallet(w3.eth.contract(address=WALLET, abi=[]))
+    orders = [
+        HedgeOrder(USDC, 1, 10),
+        HedgeOrder(USDC, 4, 20),
+        HedgeOrder(DAI, 7, 30),
+        HedgeOrder(ETH_TOKEN_ADDRESS, 100, 40),
+    ]
+    # USDC needs 5 with 4 approved, DAI is approved for exactly its 7
+    assert wallet.approvalsForOrders(orders, OWNER) == {USDC: 5}
+    # One allowance read per token, ether needs none
+    assert sorted(tx['to'] for _, (tx, _) in w3.provider.requests) == sorted([USDC, DAI])
+
+
+def test_approvals_for_ether_orders(fake_web3):
+    w3 = fake_web3(_allowance_node({}))
+    wallet = ProxyWallet(w3.eth.contract(address=WALLET, abi=[]))
+    assert wallet.approvalsForOrders([HedgeOrder(ETH_TOKEN_ADDRESS, 1, 10)], OWNER) == {}
+    assert w3.provider.requests == []
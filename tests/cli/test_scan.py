@@ -0,0 +1,118 @@
+import http.server
+import json
+import threading
+from multiprocessing import shared_memory
+import pytest
+import web3
+from common import rpc, scan, uniswap
+
+FACTORY = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
+TOKENS = [web3.Web3.toChecksumAddress('0x' + f'{i:02x}' * 20) for i in range(0x10, 0x13)]
+ACCOUNTS = [web3.Web3.toChecksumAddress('0x' + f'{i:02x}' * 20) for i in range(0x20, 0x25)]
+
+
+@pytest.fixture
+def node(fake_chain):
+    """
+    Serve a FakeChain over HTTP JSON-RPC, batches included, and yield it with its URI
+    and the blocks every eth_call and eth_getBalance was pinned to.
+    """
+    chain, _ = fake_chain
+    blocks = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            replies = []
+            for request in payload if isinstance(payload, list) else [payload]:
+                if request['method'] in ('eth_call', 'eth_getBalance'):
+                    blocks.append(request['params'][1])
+                result = chain.handler(request['method'], request['params'])
+                if isinstance(result, Exception):
+                    replies.append({'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32000, 'message': str(result)}})
+                else:
+                    replies.append({'jsonrpc': '2.0', 'id': request['id'], 'result': result})
+            body = json.dumps(replies if isinstance(payload, list) else replies[0]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    for i, token in enumerate(TOKENS):
+        chain.erc20(token)
+        for j, account in enumerate(ACCOUNTS):
+            chain.mint(token, account, (i + 1) * 10**18 + j)
+    for j, account in enumerate(ACCOUNTS):
+        chain.eth[account] = j * 10**17
+    try:
+        yield chain, f'http://127.0.0.1:{server.server_port}', blocks
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_balances(node):
+    chain, uri, blocks = node
+    # A token without code reverts, so its balances are missing
+    missing = web3.Web3.toChecksumAddress('0x' + 'ee' * 20)
+    tokens = TOKENS + [None, missing]
+    with scan.ScanExecutor(uri, processes=2, shard_size=3) as executor:
+        balances = executor.balances(ACCOUNTS, tokens)
+    assert list(balances) == [(account, token) for account in ACCOUNTS for token in tokens]
+    assert set(blocks) == {hex(chain.block_number)}
+
+    w3 = web3.Web3(web3.HTTPProvider(uri))
+    contracts = [w3.eth.contract(address=token, abi=uniswap._ABI_IERC20) for token in TOKENS + [missing]]
+    functions = [contract.functions.balanceOf(account) for account in ACCOUNTS for contract in contracts]
+    serial = iter(rpc.batch_call(w3, functions, chain.block_number, allow_failure=True))
+    for account in ACCOUNTS:
+        for token in TOKENS:
+            assert balances[(account, token)] == next(serial)
+        assert balances[(account, None)] == chain.eth[account]
+        assert balances[(account, missing)] is None and next(serial) is None
+
+
+def test_reserves(node):
+    chain, uri, blocks = node
+    pairs = [(TOKENS[0], TOKENS[1]), (TOKENS[1], TOKENS[2]), (TOKENS[0], TOKENS[2])]
+    for k, (token_a, token_b) in enumerate(pairs[:2]):
+        chain.pair(uniswap.calc_pair_address(FACTORY, token_a, token_b), 10**18 + k, 2 * 10**18 + k, 10**18)
+    with scan.ScanExecutor(uri, processes=2, shard_size=1) as executor:
+        reserves = executor.reserves(FACTORY, pairs, block_identifier=12)
+    assert set(blocks) == {hex(12)}
+
+    w3 = web3.Web3(web3.HTTPProvider(uri))
+    functions = [
+        w3.eth.contract(address=uniswap.calc_pair_address(FACTORY, *pair), abi=uniswap._ABI_IUniswapV2Pair).functions.getReserves()
+        for pair in pairs
+    ]
+    serial = rpc.batch_call(w3, functions, 12, allow_failure=True)
+    assert [reserves[pair] for pair in pairs] == [tuple(serial[0]), tuple(serial[1]), None]
+    assert reserves[pairs[0]] == (10**18, 2 * 10**18, chain.timestamp)
+
+
+def test_write_results():
+    count, words = 4, 2
+    item_size = words * scan.WORD_SIZE
+    shm = shared_memory.SharedMemory(create=True, size=count * (item_size + 1))
+    try:
+        shm.buf[:] = bytes(shm.size)
+        good = '0x' + (1).to_bytes(32, 'big').hex() + (2).to_bytes(32, 'big').hex()
+        # A shard of the last two items, the first reply too short to hold both words
+        scan._write_results(shm.name, 2, count, words, ['0x' + '00' * 32, good])
+        # A shard of the first two items, one of them failed
+        scan._write_results(shm.name, 0, count, words, [ValueError('execution reverted'), None])
+        data = bytes(shm.buf)
+        assert data[:3 * item_size] == bytes(3 * item_size)
+        assert data[3 * item_size:4 * item_size] == bytes.fromhex(good[2:])
+        assert data[count * item_size:] == bytes([0, 0, 0, 1])
+    finally:
+        shm.close()
+        shm.unlink()
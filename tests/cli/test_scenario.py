@@ -0,0 +1,51 @@
+import math
+import numpy as np
+from common import futures, scenario
+
+POW_10_18 = 10**18
+
+
+def test_collateral_factor_matches_contract():
+    expiry = 40960
+    current = np.arange(0, 45000, 97)
+    expected = [futures.calc_collateral_factor(expiry, int(block)) / POW_10_18 for block in current]
+    assert np.allclose(scenario.collateral_factor(expiry, current), expected, rtol=1e-12, atol=0)
+
+
+def test_settle_values_matches_contract():
+    create_price = 10**18
+    factor = futures.calc_collateral_factor(40960, 0)
+    ratio = np.array([0.5, 1.0, 1.0001, 1.002, 1.004, 1.0049, 2.0])
+    value_long, value_short = scenario.settle_values(factor / POW_10_18, ratio)
+    for r, long_, short_ in zip(ratio, value_long, value_short):
+        expected = futures.calc_settle_value_long_short(40960, 0, int(round(r * create_price)), create_price)
+        assert math.isclose(long_, expected[0] / POW_10_18, rel_tol=1e-9, abs_tol=1e-15)
+        assert math.isclose(short_, expected[1] / POW_10_18, rel_tol=1e-9, abs_tol=1e-15)
+
+
+def test_moments_merge_batches():
+    values = np.random.default_rng(1).normal(3.0, 2.0, 10_001)
+    moments = scenario.Moments()
+    for offset in range(0, len(values), 999):
+        moments.update(values[offset:offset + 999])
+    assert moments.count == len(values)
+    assert math.isclose(moments.mean, values.mean(), rel_tol=1e-12)
+    assert math.isclose(moments.variance, values.var(ddof=1), rel_tol=1e-9)
+    assert (moments.min, moments.max) == (values.min(), values.max())
+
+
+def test_gbm_mean():
+    # E[exp(X)] of the terminal rate is exp(drift * t)
+    blocks = scenario.BLOCKS_PER_YEAR // 4
+    ratio = scenario.gbm(0.08, 0.05, blocks)(np.random.default_rng(2), 400_000)
+    assert math.isclose(ratio.mean(), math.exp(0.08 / 4), rel_tol=2e-4)
+
+
+def test_pair_settles_to_factor():
+    # One long and one short always settle to the collateral factor
+    engine = scenario.ScenarioEngine(40960, 0, scenario.gbm(0.05, 0.2, 40960), batch_size=1000, seed=3)
+    pair = scenario.Portfolio().add_long(1.0, engine.factor / 2).add_short(1.0, engine.factor / 2)
+    result = engine.run(pair, 5000, keep_samples=True)
+    assert result.scenarios == 5000
+    assert math.isclose(result.value_long.mean + result.value_short.mean, engine.factor, rel_tol=1e-9)
+    assert math.isclose(result.pnl.mean, engine.factor * (result.ratio.mean - 1), rel_tol=1e-6, abs_tol=1e-12)
@@ -0,0 +1,164 @@
+import json
+import math
+from decimal import Decimal
+from pathlib import Path
+import pytest
+import web3
+from common import simulate, uniswap
+from common.token import Token
+
+INTERFACES = Path(__file__).resolve().parent.parent.parent / 'interfaces'
+FACTORY = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
+ROUTER = '0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D'
+WETH = '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2'
+TOKEN_A = web3.Web3.toChecksumAddress('0x' + '10' * 20)
+TOKEN_B = web3.Web3.toChecksumAddress('0x' + '20' * 20)
+TRADER = web3.Web3.toChecksumAddress('0x' + '11' * 20)
+FEE_TO = web3.Web3.toChecksumAddress('0x' + 'fe' * 20)
+PAIR = uniswap.calc_pair_address(FACTORY, TOKEN_A, TOKEN_B)
+RESERVES = 1_000 * 10**18, 2_000 * 10**6
+SUPPLY = 40 * 10**12
+E = 10**18
+
+
+def _abi(name):
+    path, = INTERFACES.glob(f'mainnet.*.{name}.abi')
+    with path.open() as fd:
+        return json.load(fd)
+
+
+@pytest.fixture
+def chain(fake_chain):
+    """
+    Yield a chain with an A/B pair, the trader holding both tokens, and a function
+    making a Simulator on it.
+    """
+    chain, w3 = fake_chain
+    chain.views[(ROUTER, 'factory()')] = FACTORY
+    chain.views[(ROUTER, 'WETH()')] = WETH
+    chain.views[(FACTORY, 'feeTo()')] = '0x' + '00' * 20
+    chain.erc20(TOKEN_A, 18)
+    chain.erc20(TOKEN_B, 6)
+    chain.pair(PAIR, *RESERVES, SUPPLY)
+    chain.mint(TOKEN_A, PAIR, RESERVES[0])
+    chain.mint(TOKEN_B, PAIR, RESERVES[1])
+    chain.mint(TOKEN_A, TRADER, 100 * E)
+    chain.mint(TOKEN_B, TRADER, 100 * 10**6)
+    def make():
+        router = w3.eth.contract(address=ROUTER, abi=_abi('uniswap-v2-router'))
+        factory = w3.eth.contract(address=FACTORY, abi=_abi('uniswap-v2-factory'))
+        sim = simulate.Simulator(uniswap.Uniswap(factory, router))
+        sim.approve(TOKEN_A, TRADER, ROUTER, simulate.UINT256_MAX)
+        sim.approve(TOKEN_B, TRADER, ROUTER, simulate.UINT256_MAX)
+        return sim
+    yield chain, w3, make
+
+
+def test_swap(chain):
+    _, _, make = chain
+    sim = make()
+    amount_out = uniswap.get_amount_out(10 * E, *RESERVES)
+    assert sim.swap_exact_tokens_for_tokens(10 * E, amount_out, [TOKEN_A, TOKEN_B], TRADER) == [10 * E, amount_out]
+    assert sim.reserves(TOKEN_A, TOKEN_B) == (RESERVES[0] + 10 * E, RESERVES[1] - amount_out)
+    assert sim.balance_of(TOKEN_B, TRADER) == 100 * 10**6 + amount_out
+
+    reserves = sim.reserves(TOKEN_B, TOKEN_A)
+    amount_in = uniswap.get_amount_in(E, *reserves)
+    assert sim.swap_tokens_for_exact_tokens(E, amount_in, [TOKEN_B, TOKEN_A], TRADER) == [amount_in, E]
+    assert sim.reserves(TOKEN_B, TOKEN_A) == (reserves[0] + amount_in, reserves[1] - E)
+
+
+def test_add_and_remove_liquidity(chain):
+    _, _, make = chain
+    sim = make()
+    amount_b = uniswap.quote(10 * E, *RESERVES)
+    liquidity = min(10 * E * SUPPLY // RESERVES[0], amount_b * SUPPLY // RESERVES[1])
+    assert sim.add_liquidity(TOKEN_A, TOKEN_B, 10 * E, 100 * 10**6, 0, 0, TRADER) == (10 * E, amount_b, liquidity)
+    assert sim.balance_of(PAIR, TRADER) == liquidity
+    assert sim.total_supply(PAIR) == SUPPLY + liquidity
+    reserves = RESERVES[0] + 10 * E, RESERVES[1] + amount_b
+    assert sim.reserves(TOKEN_A, TOKEN_B) == reserves
+
+    # B is the side that limits the deposit
+    amount_a = uniswap.quote(10**6, reserves[1], reserves[0])
+    assert sim.add_liquidity(TOKEN_B, TOKEN_A, 10**6, 50 * E, 0, 0, TRADER)[:2] == (10**6, amount_a)
+
+    sim.approve(PAIR, TRADER, ROUTER, liquidity)
+    reserves, supply = sim.reserves(TOKEN_A, TOKEN_B), sim.total_supply(PAIR)
+    assert sim.remove_liquidity(TOKEN_A, TOKEN_B, liquidity, 0, 0, TRADER) == (liquidity * reserves[0] // supply, liquidity * reserves[1] // supply)
+    assert sim.allowance(PAIR, TRADER, ROUTER) == 0
+
+
+def test_first_mint(chain):
+    chain_, _, make = chain
+    other = web3.Web3.toChecksumAddress('0x' + '30' * 20)
+    chain_.erc20(other, 18)
+    chain_.mint(other, TRADER, 10 * E)
+    sim = make()
+    sim.approve(other, TRADER, ROUTER, simulate.UINT256_MAX)
+    pair = sim.pair_for(TOKEN_A, other)
+    liquidity = math.isqrt(4 * E * 9 * E) - simulate.MINIMUM_LIQUIDITY
+    assert sim.add_liquidity(TOKEN_A, other, 4 * E, 9 * E, 4 * E, 9 * E, TRADER) == (4 * E, 9 * E, liquidity)
+    assert sim.balance_of(pair, simulate.ZERO_ADDRESS) == simulate.MINIMUM_LIQUIDITY
+    assert sim.total_supply(pair) == liquidity + simulate.MINIMUM_LIQUIDITY
+    assert sim.reserves(other, TOKEN_A) == (9 * E, 4 * E)
+
+
+def test_protocol_fee(chain):
+    chain_, _, make = chain
+    chain_.views[(FACTORY, 'feeTo()')] = FEE_TO
+    # k grew by a quarter since the last liquidity event
+    k_last = RESERVES[0] * RESERVES[1] * 4 // 5
+    chain_.k_last[PAIR] = k_last
+    sim = make()
+    root_k, root_k_last = math.isqrt(RESERVES[0] * RESERVES[1]), math.isqrt(k_last)
+    fee = SUPPLY * (root_k - root_k_last) // (5 * root_k + root_k_last)
+    assert fee > 0
+    supply = SUPPLY + fee
+    amount_b = uniswap.quote(10 * E, *RESERVES)
+    liquidity = min(10 * E * supply // RESERVES[0], amount_b * supply // RESERVES[1])
+    assert sim.add_liquidity(TOKEN_A, TOKEN_B, 10 * E, 100 * 10**6, 0, 0, TRADER)[2] == liquidity
+    assert sim.balance_of(PAIR, FEE_TO) == fee
+    assert sim.fork.get(('k_last', PAIR)) == (RESERVES[0] + 10 * E) * (RESERVES[1] + amount_b)
+
+
+def test_reverted_step_is_undone(chain):
+    _, _, make = chain
+    sim = make()
+    steps = len(sim.steps)
+    amount_out = uniswap.get_amount_out(10 * E, *RESERVES)
+    with pytest.raises(ValueError, match='INSUFFICIENT_OUTPUT_AMOUNT'):
+        sim.swap_exact_tokens_for_tokens(10 * E, amount_out + 1, [TOKEN_A, TOKEN_B], TRADER)
+    # B's transfer fails after A has already moved into the pair
+    sim.approve(TOKEN_B, TRADER, ROUTER, 0)
+    with pytest.raises(ValueError, match='exceeds allowance'):
+        sim.add_liquidity(TOKEN_A, TOKEN_B, 10 * E, 100 * 10**6, 0, 0, TRADER)
+    assert sim.balance_of(TOKEN_A, TRADER) == 100 * E
+    assert sim.balance_of(TOKEN_A, PAIR) == RESERVES[0]
+    assert sim.reserves(TOKEN_A, TOKEN_B) == RESERVES
+    assert len(sim.steps) == steps + 1
+
+
+def test_simulated_uniswap(chain):
+    chain_, w3, make = chain
+    sim = make()
+    sim.approve(TOKEN_A, TRADER, ROUTER, 0)
+    simulated = simulate.SimulatedUniswap(sim)
+    token_a = simulated.token(Token(w3.eth.contract(address=TOKEN_A, abi=uniswap._ABI_IERC20)))
+    token_b = simulated.token(Token(w3.eth.contract(address=TOKEN_B, abi=uniswap._ABI_IERC20)))
+    amount_out = uniswap.get_amount_out(10 * E, *RESERVES)
+    path = [token_a, token_b]
+    assert simulated.getAmountsOut(Decimal(10), path) == (Decimal(10), token_b.to_dec(amount_out))
+    assert simulated.swapExactTokensForTokens(Decimal(10), Decimal(0), path, tx_from=TRADER, approve=True) == (Decimal(10), token_b.to_dec(amount_out))
+    # The second swap sees the first one's reserves
+    second = uniswap.get_amount_out(10 * E, RESERVES[0] + 10 * E, RESERVES[1] - amount_out)
+    assert simulated.swapExactTokensForTokens(Decimal(10), Decimal(0), path, tx_from=TRADER, approve=True)[1] == token_b.to_dec(second)
+    assert token_a.balanceOf(TRADER) == Decimal(80)
+    assert token_a.allowance(TRADER, ROUTER) == Decimal(0)
+    # Nothing reached the node
+    assert chain_.balances[(TOKEN_A, TRADER)] == 100 * E
+    assert not any(method == 'eth_sendTransaction' for method, _ in w3.provider.requests)
+    with pytest.raises(AssertionError):
+        simulated.swapExactTokensForTokens(Decimal(1), Decimal(0), path, tx_from=TRADER, transact=True)
+    with pytest.raises(NotImplementedError):
+        simulated.swapExactETHForTokens(Decimal(1), Decimal(0), path, tx_from=TRADER)
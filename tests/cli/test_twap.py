@@ -0,0 +1,62 @@
+from common import twap
+from common.twap import Q112, Observation
+
+POW_10_18 = 10**18
+
+
+def _observe(oracle, schedule, start=0, offset=0):
+    '''Feed `oracle` an observation every 300s of a pair whose price0 follows `schedule`'''
+    observation = Observation(start, offset, offset)
+    oracle.update(observation)
+    for timestamp, (reserve0, reserve1) in schedule:
+        observation = twap.current_cumulative_prices(
+            observation.price0_cumulative, observation.price1_cumulative,
+            reserve0, reserve1,
+            observation.timestamp, timestamp,
+        )
+        oracle.update(observation)
+    return observation
+
+
+def _schedule(start=0):
+    # price0 is 2 for the first 1800s and 4 for the next 1800s
+    return [(start + t, (10**6, 2 * 10**6) if t <= 1800 else (10**6, 4 * 10**6)) for t in range(300, 3601, 300)]
+
+
+def test_current_cumulative_prices():
+    observation = twap.current_cumulative_prices(10, 20, 10**6, 3 * 10**6, 100, 160)
+    assert observation == Observation(160, 10 + 60 * 3 * Q112, 20 + 60 * (Q112 // 3))
+    # Nothing accrues within the block the pair was synced in
+    assert twap.current_cumulative_prices(10, 20, 10**6, 3 * 10**6, 160, 160) == Observation(160, 10, 20)
+
+
+def test_sliding_window_twap():
+    oracle = twap.SlidingWindowOracle(3600, 12)
+    _observe(oracle, _schedule())
+    price0, price1 = oracle.consult()
+    # The window's oldest bucket starts at 300: price 2 for 1500s and 4 for 1800s
+    assert price0 * POW_10_18 // Q112 == 34 * POW_10_18 // 11
+    assert abs(price1 * POW_10_18 // Q112 - 4 * POW_10_18 // 11) <= 1
+
+
+def test_sliding_window_twap_across_overflow():
+    # The accumulators wrap around 2**256 halfway through
+    oracle = twap.SlidingWindowOracle(3600, 12)
+    _observe(oracle, _schedule(), offset=(1 << 256) - 2 * Q112 * 1800)
+    reference = twap.SlidingWindowOracle(3600, 12)
+    _observe(reference, _schedule())
+    assert oracle.latest.price0_cumulative == 4 * Q112 * 1800
+    assert oracle.consult() == reference.consult()
+
+
+def test_sliding_window_needs_history():
+    oracle = twap.SlidingWindowOracle(3600, 12)
+    assert oracle.consult() is None
+    oracle.update(Observation(0, 0, 0))
+    oracle.update(Observation(300, 2 * Q112 * 300, 0))
+    # The oldest bucket of the window at 300 has not been observed yet
+    assert oracle.consult() is None
+    # Observations older than the window are not used
+    oracle = twap.SlidingWindowOracle(3600, 12)
+    _observe(oracle, _schedule())
+    assert oracle.consult(3600 + 3600) is None
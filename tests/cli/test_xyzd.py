@@ -0,0 +1,74 @@
+import json
+import os
+import socket
+import stat
+import threading
+from pathlib import Path
+import eth_abi
+import pytest
+import web3
+import common
+import xyzd
+from conftest import FakeProvider
+
+OWNER = web3.Web3.toChecksumAddress('0x' + '11' * 20)
+OTHER = web3.Web3.toChecksumAddress('0x' + '22' * 20)
+NEW_TOKEN = web3.Web3.toChecksumAddress('0x' + '33' * 20)
+INTERFACES = Path(__file__).resolve().parent.parent.parent / 'interfaces'
+
+
+@pytest.fixture
+def state(fake_chain, monkeypatch):
+    """
+    Yield a WarmState on a FakeChain, without deployments, allowed to send from OWNER
+    only, and whose tokens are named T0, T1, ...
+    """
+    chain, _ = fake_chain
+    monkeypatch.setattr(web3, 'HTTPProvider', lambda uri: FakeProvider(chain.handler))
+    monkeypatch.setattr(common.abi, '_SEARCH_PATH', INTERFACES)
+    monkeypatch.setattr(common.abi, 'load_deployed_FutureToken', lambda w3: None)
+    monkeypatch.setattr(common.abi, 'find_deployments', lambda w3, name, instance_type=None: [])
+    state = xyzd.WarmState(allow_from=[OWNER])
+    for i, address in enumerate(list(state.tokens) + [NEW_TOKEN]):
+        chain.views[(address, 'symbol()')] = eth_abi.encode_abi(['string'], [f'T{i}'])
+    yield state, chain
+
+
+def test_token_by_address(state):
+    state_, _ = state
+    tokens = list(state_.tokens.values())
+    assert state_.token('T0') is tokens[0]
+    # A token added by address after the symbols were first looked up is found by symbol too
+    symbol = f'T{len(tokens)}'
+    with pytest.raises(KeyError):
+        state_.token(symbol)
+    token = state_.token(NEW_TOKEN.lower())
+    assert token.address == NEW_TOKEN
+    assert state_.token(symbol) is token
+    assert state_.token(NEW_TOKEN) is token
+
+
+def test_server(state, tmp_path):
+    state_, chain = state
+    path = str(tmp_path / 'xyzd.sock')
+    with xyzd.Server(path, state_) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+                requests = [
+                    {'id': 1, 'command': 'block'},
+                    {'id': 2, 'command': 'swap', 'args': {'from': OTHER, 'path': ['T0', 'T1'], 'amount_in': '1'}},
+                    {'id': 3, 'command': 'unknown'},
+                ]
+                sock.sendall(b''.join(json.dumps(request).encode() + b'\n' for request in requests))
+                sock.shutdown(socket.SHUT_WR)
+                with sock.makefile('r') as fd:
+                    replies = [json.loads(line) for line in fd]
+        finally:
+            server.shutdown()
+    assert replies[0] == {'type': 'result', 'id': 1, 'result': {'blockNumber': chain.block_number}}
+    assert replies[1] == {'type': 'error', 'id': 2, 'error': f'ValueError: sending from {OTHER} is not allowed'}
+    assert replies[2]['type'] == 'error' and replies[2]['id'] == 3
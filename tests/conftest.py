@@ -1,5 +1,10 @@
+import sys
+from pathlib import Path
 import pytest
 
+# Mainnet addresses; without a fork the ProxyWallet constructor only stores them
+COMPOUND_COMPTROLLER = '0x3d9819210A31b4961b30EF54bE2aeD79B9c9Cd3B'
+UNISWAP_V2_ROUTER = '0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D'
 
 @pytest.fixture(autouse=True)
 def setup(fn_isolation):
@@ -10,25 +15,103 @@ def setup(fn_isolation):
     pass
 
 
+class DeploymentSnapshot:
+    """
+    The session's deployment and the id of the chain snapshot taken right after it.
+    """
+    def __init__(self, future_token, proxy_wallet, snapshot_id):
+        self.future_token = future_token
+        self.proxy_wallet = proxy_wallet
+        self.snapshot_id = snapshot_id
+
+    def restore(self, chain):
+        # What chain.reset() does for the empty chain; reverting consumes the
+        # snapshot, so keep the one taken in its place
+        self.snapshot_id = chain._revert(self.snapshot_id)
+
+
+@pytest.fixture(scope="session")
+def deployment_snapshot(accounts, rpc, FutureToken, ProxyWallet):
+    """
+    Deploy FutureToken and the ProxyWallet master once per session and snapshot the chain.
+
+    With `brownie test -n auto` every pytest-xdist worker runs its own session
+    against its own development chain, so this runs once per worker.
+    """
+    future_token = accounts[0].deploy(FutureToken)
+    proxy_wallet = accounts[0].deploy(ProxyWallet, future_token, COMPOUND_COMPTROLLER, UNISWAP_V2_ROUTER)
+    yield DeploymentSnapshot(future_token, proxy_wallet, rpc.snapshot())
+
+
 @pytest.fixture(scope="module")
-def proxy_wallet(accounts, ProxyWallet):
+def module_isolation(chain, deployment_snapshot):
+    """
+    Replaces brownie's module isolation, which resets to the empty chain and so
+    would lose the session deployment: every module starts and ends at the
+    deployment snapshot instead, and `fn_isolation` reverts each test to the
+    state its module fixtures left.
+    """
+    deployment_snapshot.restore(chain)
+    yield
+    deployment_snapshot.restore(chain)
+
+
+@pytest.fixture(scope="session")
+def deployment(deployment_snapshot):
+    """
+    Yield the session's FutureToken and ProxyWallet master.
+    """
+    yield deployment_snapshot.future_token, deployment_snapshot.proxy_wallet
+
+
+@pytest.fixture(scope="session")
+def future_token(deployment):
+    """
+    Yield the session's `Contract` object for the FutureToken contract.
+    """
+    yield deployment[0]
+
+
+@pytest.fixture(scope="session")
+def proxy_wallet_master(deployment):
+    """
+    Yield the session's `Contract` object for the ProxyWallet master.
+    """
+    yield deployment[1]
+
+
+@pytest.fixture(scope="module")
+def proxy_wallet(proxy_wallet_master):
     """
     Yield a `Contract` object for the ProxyWallet contract.
     """
-    yield accounts[0].deploy(ProxyWallet)
+    yield proxy_wallet_master
 
 
 @pytest.fixture(scope="module")
 def proxy_wallet_0(accounts, ProxyWallet, proxy_wallet):
     """
-    Yield a `Contract` object for the ProxyWallet contract.
+    Yield a `Contract` object for the wallet of accounts[0].
     """
-    yield ProxyWallet.at(proxy_wallet.getOrCreateClone({'from': accounts[0]}).return_value)
+    yield ProxyWallet.at(proxy_wallet.createWalletIfNeeded({'from': accounts[0]}).return_value)
 
 
 @pytest.fixture(scope="module")
 def proxy_wallet_1(accounts, ProxyWallet, proxy_wallet):
     """
-    Yield a `Contract` object for the ProxyWallet contract.
+    Yield a `Contract` object for the wallet of accounts[1].
+    """
+    yield ProxyWallet.at(proxy_wallet.createWalletIfNeeded({'from': accounts[1]}).return_value)
+
+
+@pytest.fixture(scope="session")
+def common(web3):
+    """
+    Yield the cli `common` package, for tests of the Python layer against the
+    worker's chain through brownie's `web3`.
     """
-    yield ProxyWallet.at(proxy_wallet.getOrCreateClone({'from': accounts[1]}).return_value)
+    cli = str(Path(__file__).resolve().parent.parent / 'cli')
+    if cli not in sys.path:
+        sys.path.insert(0, cli)
+    import common
+    yield common
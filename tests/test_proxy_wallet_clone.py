@@ -1,59 +1,68 @@
 import brownie
-from brownie.convert import to_address
 
-def test_proxy_wallet_deploy(proxy_wallet):
+def test_proxy_wallet_deploy(accounts, proxy_wallet):
     """
     Test if the contract is correctly deployed.
     """
-    assert proxy_wallet.owner() == to_address(b'\xff'*20)
-    assert proxy_wallet.get() == 5
+    assert proxy_wallet.owner() == accounts[0]
+    assert not proxy_wallet.isProxy()
+    assert proxy_wallet.extractProxyAddress() == brownie.ZERO_ADDRESS
 
 
-def test_proxy_wallet_set(accounts, proxy_wallet):
+def test_proxy_wallet_create(accounts, proxy_wallet, proxy_wallet_0, proxy_wallet_1):
     """
-    Test if the storage variable can be changed.
+    Test if wallets are created once per owner as clones of the master.
     """
-    assert proxy_wallet.get() == 5
-    with brownie.reverts():
-        proxy_wallet.set(20, {'from': accounts[0]})
-    assert proxy_wallet.get() == 5
-
+    assert proxy_wallet_0.isProxy()
+    assert proxy_wallet_0.extractProxyAddress() == proxy_wallet
+    assert proxy_wallet_0.owner() == accounts[0]
+    assert proxy_wallet_1.isProxy()
+    assert proxy_wallet_1.extractProxyAddress() == proxy_wallet
+    assert proxy_wallet_1.owner() == accounts[1]
 
-def test_proxy_wallet_create(accounts, ProxyWallet, proxy_wallet, proxy_wallet_0, proxy_wallet_1):
-    """
-    Test if the storage variable can be changed.
-    """
+    assert proxy_wallet_0 == proxy_wallet.getWallet({'from': accounts[0]})
+    assert proxy_wallet_1 == proxy_wallet.getWallet({'from': accounts[1]})
+    with brownie.reverts():
+        proxy_wallet.getWallet({'from': accounts[2]})
 
-    assert not proxy_wallet.isClone()
-    assert proxy_wallet.proxyAddress() == brownie.ZERO_ADDRESS
-    assert proxy_wallet_0.isClone()
-    assert proxy_wallet_0.proxyAddress() == proxy_wallet
-    assert proxy_wallet_1.isClone()
-    assert proxy_wallet_1.proxyAddress() == proxy_wallet
+    assert proxy_wallet_0 == proxy_wallet.getWalletOrNull({'from': accounts[0]})
+    assert proxy_wallet_1 == proxy_wallet.getWalletOrNull({'from': accounts[1]})
+    assert brownie.ZERO_ADDRESS == proxy_wallet.getWalletOrNull({'from': accounts[2]})
 
-    assert proxy_wallet_0 == proxy_wallet.getClone({'from': accounts[0]})
-    assert proxy_wallet_1 == proxy_wallet.getClone({'from': accounts[1]})
+    # Creating again returns the existing wallet
+    assert proxy_wallet_0 == proxy_wallet.createWalletIfNeeded({'from': accounts[0]}).return_value
     with brownie.reverts():
-        proxy_wallet.getClone({'from': accounts[2]})
+        proxy_wallet_0.createWalletIfNeeded({'from': accounts[0]})
 
-    assert proxy_wallet_0 == proxy_wallet.getCloneOrNull({'from': accounts[0]})
-    assert proxy_wallet_1 == proxy_wallet.getCloneOrNull({'from': accounts[1]})
-    assert brownie.ZERO_ADDRESS == proxy_wallet.getCloneOrNull({'from': accounts[2]})
 
+def test_proxy_wallet_initialize(accounts, proxy_wallet, proxy_wallet_0):
+    """
+    Test if only the master initializes a wallet, and only once.
+    """
     with brownie.reverts():
-        proxy_wallet_0.getClone({'from': accounts[0]})
-
+        proxy_wallet_0.initializeWallet(accounts[1], {'from': accounts[1]})
+    with brownie.reverts():
+        proxy_wallet.initializeWallet(accounts[1], {'from': accounts[1]})
     assert proxy_wallet_0.owner() == accounts[0]
-    assert proxy_wallet_0.get() == 5
 
-    with brownie.reverts():
-        proxy_wallet.set(20, {'from': accounts[0]})
 
+def test_proxy_wallet_destroy(accounts, proxy_wallet, proxy_wallet_0):
+    """
+    Test if only the owner destroys a wallet, and the master cannot be destroyed.
+    """
+    with brownie.reverts():
+        proxy_wallet_0.destroyWallet({'from': accounts[1]})
     with brownie.reverts():
-        proxy_wallet_0.set(21, {'from': accounts[1]})
-    assert proxy_wallet_0.get() == 5
+        proxy_wallet.destroyWallet({'from': accounts[0]})
+    proxy_wallet_0.destroyWallet({'from': accounts[0]})
+    assert brownie.ZERO_ADDRESS == proxy_wallet.getWalletOrNull({'from': accounts[0]})
 
-    proxy_wallet_0.set(22, {'from': accounts[0]})
-    assert proxy_wallet_0.get() == 22
 
-    assert proxy_wallet_1.get() == 5
+def test_proxy_wallet_address(accounts, common, proxy_wallet, proxy_wallet_0):
+    """
+    Test if the cli predicts wallet addresses without asking the chain.
+    """
+    for account in accounts[:4]:
+        expected = proxy_wallet.getWalletAddress({'from': account})
+        assert common.proxy_wallet.calc_wallet_address(proxy_wallet.address, account.address) == expected
+    assert proxy_wallet.getWalletAddress({'from': accounts[0]}) == proxy_wallet_0
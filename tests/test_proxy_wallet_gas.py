@@ -0,0 +1,47 @@
+import brownie
+import pytest
+
+BLOCKS = 48 * 4096
+FACTORY_SELECTOR = '0xc45a0155'
+
+
+@pytest.fixture(scope="module")
+def gas_deployment(module_isolation):
+    """
+    Yield the helper deployment, which needs Compound and Uniswap from a mainnet fork.
+    """
+    network = brownie.network.main.show_active()
+    if 'fork' not in network:
+        pytest.skip(f'needs a mainnet fork, not {network}')
+    from scripts.helper import load_mainnet_contracts, main
+    deployment = main()
+    if not deployment:
+        pytest.skip(f'the helper deploys nothing on chain {brownie.chain.id}')
+    deployment.update(load_mainnet_contracts('token-usdc', 'uniswap-v2-router'))
+    yield deployment
+
+
+def _calls_into(tx, address):
+    """
+    Subcalls of tx into address other than a clone delegating to its master.
+    """
+    return [call for call in tx.subcalls if call['to'] == address and call['op'] != 'DELEGATECALL']
+
+
+def test_clone_reads_config_without_master_calls(accounts, gas_deployment):
+    """
+    Test a clone's depositAndHedge asks the master only for the ctoken, and never
+    asks the router for its factory.
+    """
+    usdc, router = gas_deployment['token-usdc'], gas_deployment['uniswap-v2-router']
+    master, wallet = gas_deployment['PW'], gas_deployment['PW1']
+    owner = accounts[1]
+    usdc.approve(wallet, 2**256 - 1, {'from': owner})
+    tx = wallet.depositAndHedge(1_000 * 10**6, usdc, BLOCKS, 10**18, brownie.chain.time() + 300, {'from': owner})
+    assert tx.status == 1
+    master_calls = _calls_into(tx, master)
+    assert len(master_calls) == 1, master_calls
+    assert 'getCToken' in master_calls[0].get('function', ''), master_calls
+    router_calls = _calls_into(tx, router)
+    assert not [call for call in router_calls if 'factory' in call.get('function', '') or call.get('calldata', '').startswith(FACTORY_SELECTOR)]
+
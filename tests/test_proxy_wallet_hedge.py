@@ -0,0 +1,61 @@
+import brownie
+import pytest
+
+BLOCKS = 48 * 4096
+
+@pytest.fixture(scope="module")
+def hedge_deployment(module_isolation):
+    """
+    Yield the helper deployment, which needs Compound and Uniswap from a mainnet fork.
+    """
+    network = brownie.network.main.show_active()
+    if 'fork' not in network:
+        pytest.skip(f'needs a mainnet fork, not {network}')
+    from scripts.helper import load_mainnet_contracts, main
+    deployment = main()
+    if not deployment:
+        pytest.skip(f'the helper deploys nothing on chain {brownie.chain.id}')
+    deployment.update(load_mainnet_contracts('token-usdc', 'compound-cusdc'))
+    yield deployment
+
+
+@pytest.fixture
+def hedge(accounts, hedge_deployment):
+    """
+    Yield a function hedging `amount` of freshly minted cUSDC from account 1's wallet
+    and the ctoken amount the swap needs at the current reserves.
+    """
+    usdc, cusdc = hedge_deployment['token-usdc'], hedge_deployment['compound-cusdc']
+    wallet, pair = hedge_deployment['PW1'], hedge_deployment['FSU_CUSDC']
+    fut_short = hedge_deployment['FSU']
+    owner = accounts[1]
+    usdc.approve(cusdc, 1000 * 10**6, {'from': owner})
+    cusdc.mint(1000 * 10**6, {'from': owner})
+    amount = cusdc.balanceOf(owner)
+    cusdc.approve(wallet, amount, {'from': owner})
+
+    reserve0, reserve1, _ = pair.getReserves()
+    reserve_fut, reserve_ctoken = (reserve0, reserve1) if fut_short.address.lower() < cusdc.address.lower() else (reserve1, reserve0)
+    amount_in = (1000 * reserve_ctoken * amount) // (997 * (reserve_fut - amount)) + 1
+
+    def run(max_slippage):
+        return wallet.depositAndHedge(amount, cusdc, BLOCKS, max_slippage, brownie.chain.time() + 300, {'from': owner})
+    # Slippage of the average price over spot, rounded up so the swap sits on the bound
+    slippage = -(-(amount_in * reserve_fut * 10**18) // (amount * reserve_ctoken)) - 10**18
+    yield run, slippage
+
+
+def test_hedge_within_max_slippage(hedge):
+    run, slippage = hedge
+    assert run(slippage).status == 1
+
+
+def test_hedge_past_max_slippage_reverts(hedge):
+    run, slippage = hedge
+    with brownie.reverts('UniswapV2Router: EXCESSIVE_INPUT_AMOUNT'):
+        run(slippage - 1)
+
+
+def test_hedge_without_max_slippage(hedge):
+    run, _ = hedge
+    assert run(0).status == 1